@@ -0,0 +1,69 @@
+"""add_search_index_to_new_products
+
+Revision ID: e8b3d6f2a914
+Revises: c5f1a8d3e276
+Create Date: 2026-10-17 14:06:52.184730
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e8b3d6f2a914'
+down_revision: Union[str, None] = 'c5f1a8d3e276'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+SEARCH_FIELDS = ['product_name', 'product_type', 'serial_number', 'batch_number', 'lot_number', 'remark']
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    columns = ', '.join(SEARCH_FIELDS)
+    new_values = ', '.join(f'new.{field}' for field in SEARCH_FIELDS)
+    old_values = ', '.join(f'old.{field}' for field in SEARCH_FIELDS)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        document = " || ' ' || ".join(f"coalesce({field}, '')" for field in SEARCH_FIELDS)
+        op.execute(
+            f"ALTER TABLE new_products ADD COLUMN search_vector tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('simple', {document})) STORED"
+        )
+        op.execute("CREATE INDEX ix_new_products_search_vector ON new_products USING gin (search_vector)")
+    elif op.get_bind().dialect.name == 'sqlite':
+        op.execute(
+            f"CREATE VIRTUAL TABLE new_products_fts USING fts5("
+            f"{columns}, content='new_products', content_rowid='id', prefix='2 3')"
+        )
+        op.execute(
+            f"CREATE TRIGGER new_products_fts_insert AFTER INSERT ON new_products BEGIN "
+            f"INSERT INTO new_products_fts(rowid, {columns}) VALUES (new.id, {new_values}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER new_products_fts_delete AFTER DELETE ON new_products BEGIN "
+            f"INSERT INTO new_products_fts(new_products_fts, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old_values}); END"
+        )
+        op.execute(
+            f"CREATE TRIGGER new_products_fts_update AFTER UPDATE OF {columns} ON new_products BEGIN "
+            f"INSERT INTO new_products_fts(new_products_fts, rowid, {columns}) "
+            f"VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO new_products_fts(rowid, {columns}) VALUES (new.id, {new_values}); END"
+        )
+        # Index the products that already exist
+        op.execute("INSERT INTO new_products_fts(new_products_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_new_products_search_vector', table_name='new_products')
+        op.drop_column('new_products', 'search_vector')
+    elif op.get_bind().dialect.name == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS new_products_fts_update")
+        op.execute("DROP TRIGGER IF EXISTS new_products_fts_delete")
+        op.execute("DROP TRIGGER IF EXISTS new_products_fts_insert")
+        op.execute("DROP TABLE IF EXISTS new_products_fts")
@@ -0,0 +1,37 @@
+"""backfill_processed_rows_of_bulk_uploads
+
+Revision ID: f2a7c9e4b153
+Revises: e8b3d6f2a914
+Create Date: 2026-10-18 10:27:05.612384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a7c9e4b153'
+down_revision: Union[str, None] = 'e8b3d6f2a914'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Uploads older than processed_rows handled every row they counted
+    op.execute(
+        "UPDATE bulk_uploads SET processed_rows = "
+        "COALESCE(successful_records, 0) + COALESCE(updated_records, 0) "
+        "+ COALESCE(skipped_records, 0) + COALESCE(failed_records, 0) "
+        "WHERE processed_rows IS NULL"
+    )
+    with op.batch_alter_table('bulk_uploads') as batch_op:
+        batch_op.alter_column('processed_rows', existing_type=sa.Integer(), server_default='0', nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('bulk_uploads') as batch_op:
+        batch_op.alter_column('processed_rows', existing_type=sa.Integer(), server_default=None, nullable=True)
@@ -0,0 +1,185 @@
+"""
+Product Name Autocomplete
+Per-company in-memory prefix indexes of product names, for typeahead pickers
+"""
+import bisect
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import NewProduct
+
+# (casefolded product_name, product_id, product_name): the sort key, then the suggestion
+_Entry = Tuple[str, str, str]
+
+# Committed changes of a session: (company_id, row id, (product_name, product_id) or None if removed)
+_Change = Tuple[str, int, Optional[Tuple[str, str]]]
+
+SESSION_CHANGES_KEY = "product_name_changes"
+
+
+class ProductNameIndex:
+    """One company's product names in sorted order, with each product's entry by row id"""
+
+    def __init__(self, rows: Iterable[Tuple[int, str, str]]):
+        self.entries: Dict[int, _Entry] = {
+            row_id: (product_name.casefold(), product_id, product_name) for row_id, product_name, product_id in rows
+        }
+        self.sorted: List[_Entry] = sorted(self.entries.values())
+        self.built_at = time.monotonic()
+
+    def add(self, row_id: int, product_name: str, product_id: str) -> None:
+        """Insert or replace a product's entry"""
+        self.remove(row_id)
+        entry = (product_name.casefold(), product_id, product_name)
+        self.entries[row_id] = entry
+        bisect.insort(self.sorted, entry)
+
+    def remove(self, row_id: int) -> None:
+        """Drop a product's entry, if it has one"""
+        entry = self.entries.pop(row_id, None)
+        if entry is not None:
+            position = bisect.bisect_left(self.sorted, entry)
+            if position < len(self.sorted) and self.sorted[position] == entry:
+                del self.sorted[position]
+
+    def complete(self, prefix: str, limit: int) -> List[Tuple[str, str]]:
+        """(product_name, product_id) of the first ``limit`` names starting with ``prefix``, ignoring case"""
+        key = prefix.casefold()
+        start = bisect.bisect_left(self.sorted, (key,))
+        suggestions = []
+        for folded, product_id, product_name in self.sorted[start:start + limit]:
+            if not folded.startswith(key):
+                break
+            suggestions.append((product_name, product_id))
+        return suggestions
+
+
+class ProductNameIndexes:
+    """
+    The prefix indexes of the companies autocompleted lately, each built on first use.
+
+    Committed writes of NewProduct (creates, updates, deletes) are applied to
+    the indexes in place: ORM writes as they are flushed, statement-level
+    writes such as bulk uploads and reverts through the rows they queue with
+    ``queue_product_name_changes``. An index older than ``ttl`` seconds is
+    rebuilt, which bounds how long writes of other processes go unseen. At
+    most ``max_companies`` indexes are kept, the least recently used are
+    dropped first.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_companies: Optional[int] = None):
+        self.ttl = settings.autocomplete_index_ttl if ttl is None else ttl
+        self.max_companies = settings.autocomplete_max_companies if max_companies is None else max_companies
+        self._lock = threading.Lock()
+        self._indexes: "OrderedDict[str, ProductNameIndex]" = OrderedDict()
+        self._build_locks: Dict[str, threading.Lock] = {}
+        # Bumped by every change of a company, so a build that raced one is not kept
+        self._generations: Dict[str, int] = {}
+
+    def _cached(self, company_id: str) -> Optional[ProductNameIndex]:
+        """A company's index if it is fresh; call with the lock held"""
+        index = self._indexes.get(company_id)
+        if index is None or time.monotonic() - index.built_at > self.ttl:
+            return None
+        self._indexes.move_to_end(company_id)
+        return index
+
+    def complete(self, db: Session, company_id: str, prefix: str, limit: int) -> List[Tuple[str, str]]:
+        """(product_name, product_id) of a company's first ``limit`` product names starting with ``prefix``"""
+        with self._lock:
+            index = self._cached(company_id)
+            if index is not None:
+                return index.complete(prefix, limit)
+            build_lock = self._build_locks.setdefault(company_id, threading.Lock())
+
+        with build_lock:
+            # Another request may have built it meanwhile
+            with self._lock:
+                index = self._cached(company_id)
+                if index is not None:
+                    return index.complete(prefix, limit)
+                generation = self._generations.get(company_id, 0)
+
+            index = ProductNameIndex(
+                db.query(NewProduct.id, NewProduct.product_name, NewProduct.product_id)
+                .filter(NewProduct.company_id == company_id)
+            )
+            with self._lock:
+                if self._generations.get(company_id, 0) == generation:
+                    self._indexes[company_id] = index
+                    self._indexes.move_to_end(company_id)
+                    while len(self._indexes) > self.max_companies:
+                        self._indexes.popitem(last=False)
+                return index.complete(prefix, limit)
+
+    def apply(self, changes: List[_Change]) -> None:
+        """Apply committed product changes to the indexes built so far"""
+        with self._lock:
+            for company_id, row_id, value in changes:
+                self._generations[company_id] = self._generations.get(company_id, 0) + 1
+                index = self._indexes.get(company_id)
+                if index is None:
+                    continue
+                if value is None:
+                    index.remove(row_id)
+                else:
+                    index.add(row_id, *value)
+
+    def clear(self) -> None:
+        """Drop every index"""
+        with self._lock:
+            for company_id in self._indexes:
+                self._generations[company_id] = self._generations.get(company_id, 0) + 1
+            self._indexes.clear()
+
+
+product_names = ProductNameIndexes()
+
+
+def product_name_changes(products: Iterable[Mapping[str, Any]]) -> List[_Change]:
+    """The changes of written products, given their column values (e.g. rows of a RETURNING clause)"""
+    return [(product["company_id"], product["id"], (product["product_name"], product["product_id"])) for product in products]
+
+
+def queue_product_name_changes(session: Session, changes: Iterable[_Change]) -> None:
+    """Queue product changes the ORM does not see, e.g. of bulk statements, until the transaction commits"""
+    session.info.setdefault(SESSION_CHANGES_KEY, []).extend(changes)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_product_name_changes(session: Session, flush_context) -> None:
+    """Queue the flushed NewProduct changes until the transaction commits"""
+    changes = [
+        (product.company_id, product.id, (product.product_name, product.product_id))
+        for product in session.new if isinstance(product, NewProduct)
+    ]
+    changes.extend(
+        (product.company_id, product.id, (product.product_name, product.product_id))
+        for product in session.dirty
+        if isinstance(product, NewProduct) and any(
+            inspect(product).attrs[field].history.has_changes() for field in ("product_name", "product_id")
+        )
+    )
+    changes.extend(
+        (product.company_id, product.id, None) for product in session.deleted if isinstance(product, NewProduct)
+    )
+    if changes:
+        queue_product_name_changes(session, changes)
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_product_name_changes(session: Session) -> None:
+    changes = session.info.pop(SESSION_CHANGES_KEY, None)
+    if changes:
+        product_names.apply(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_product_name_changes(session: Session) -> None:
+    session.info.pop(SESSION_CHANGES_KEY, None)
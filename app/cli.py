@@ -0,0 +1,220 @@
+"""
+Command Line
+Runs bulk imports straight against the configured database, without going through HTTP
+
+    python -m app.cli import-products products.csv --company COMP1 --manager manager@example.com
+    python -m app.cli watch --dir /srv/drop
+
+Imports are recorded as bulk uploads, like those sent to POST /new-products/bulk-upload,
+so their status, reject report and changes show up in the API.
+"""
+import argparse
+import os
+import sys
+import time
+from typing import BinaryIO, List, Optional, TextIO
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.controllers.new_products import IMPORT_MODES, create_bulk_upload, find_completed_bulk_upload, run_bulk_upload
+from app.database import SessionLocal
+from app.ingest import check_upload_file
+from app.jobs import file_sha256, open_reject_report, reject_report_path
+from app.models import BulkUpload, Manager
+from app.watcher import DropFolderWatcher
+
+PROGRESS_WIDTH = 30
+
+
+class ProgressBar:
+    """
+    Progress of an import on a terminal: how much of the file was read, and the rows committed.
+
+    The share read comes from the position of the file's descriptor, so it
+    works for every format without counting rows first; for zip, Excel and
+    Parquet files it is only approximate.
+    """
+
+    def __init__(self, source: BinaryIO, stream: TextIO):
+        self.source = source
+        self.stream = stream
+        self.size = os.fstat(source.fileno()).st_size
+        self.started = time.monotonic()
+
+    def update(self, bulk_upload: BulkUpload) -> None:
+        """Redraw the bar with the upload's committed counters"""
+        read = min(os.lseek(self.source.fileno(), 0, os.SEEK_CUR), self.size)
+        share = read / self.size if self.size else 1.0
+        filled = int(share * PROGRESS_WIDTH)
+        rows = bulk_upload.processed_rows or 0
+        rate = rows / max(time.monotonic() - self.started, 1e-9)
+        self.stream.write(
+            f"\r[{'#' * filled}{'.' * (PROGRESS_WIDTH - filled)}] {share:4.0%}"
+            f"  {rows:,} rows  {rate:,.0f} rows/s"
+        )
+        self.stream.flush()
+
+    def finish(self, bulk_upload: BulkUpload) -> None:
+        """Draw the bar full and end its line"""
+        rows = bulk_upload.processed_rows or 0
+        rate = rows / max(time.monotonic() - self.started, 1e-9)
+        self.stream.write(f"\r[{'#' * PROGRESS_WIDTH}] 100%  {rows:,} rows  {rate:,.0f} rows/s\n")
+        self.stream.flush()
+
+
+def find_manager(db: Session, manager: str) -> Optional[Manager]:
+    """A manager by id or email"""
+    if manager.isdigit():
+        return db.get(Manager, int(manager))
+    return db.query(Manager).filter(Manager.email == manager).first()
+
+
+def import_products(args: argparse.Namespace) -> int:
+    """Import a file as a bulk upload; returns the exit status"""
+    if args.workers is not None:
+        settings.bulk_upload_validation_workers = args.workers
+    max_bytes = settings.bulk_upload_max_size_mb * 1024 * 1024
+    filename = os.path.basename(args.file)
+
+    if not os.path.isfile(args.file):
+        print(f"error: {args.file} is not a file", file=sys.stderr)
+        return 1
+    if os.path.getsize(args.file) > max_bytes:
+        print(f"error: File size exceeds {settings.bulk_upload_max_size_mb}MB limit", file=sys.stderr)
+        return 1
+    try:
+        check_upload_file(args.file, filename, max_bytes)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    db = SessionLocal()
+    try:
+        manager = find_manager(db, args.manager)
+        if manager is None:
+            print(f"error: no manager {args.manager}", file=sys.stderr)
+            return 1
+        if manager.company_id != args.company:
+            print(f"error: manager {args.manager} does not belong to company {args.company}", file=sys.stderr)
+            return 1
+
+        content_hash = file_sha256(args.file)
+        if not args.force:
+            previous_upload = find_completed_bulk_upload(db, args.company, content_hash, args.duplicate_action)
+            if previous_upload is not None:
+                print(f"File already imported as bulk upload {previous_upload.id}; use --force to import it again")
+                return 0
+
+        bulk_upload = create_bulk_upload(
+            db,
+            filename=filename,
+            manager_id=manager.id,
+            company_id=args.company,
+            duplicate_action=args.duplicate_action,
+            import_mode=args.import_mode,
+            content_hash=content_hash
+        )
+        print(f"Importing {args.file} as bulk upload {bulk_upload.id}")
+
+        with open(args.file, "rb") as source, open_reject_report(bulk_upload.id) as reject_report:
+            progress = ProgressBar(source, sys.stderr) if args.progress else None
+            run_bulk_upload(
+                db,
+                bulk_upload,
+                source,
+                batch_size=args.batch_size,
+                reject_report=reject_report,
+                on_commit=progress.update if progress is not None else None
+            )
+            if progress is not None:
+                progress.finish(bulk_upload)
+
+        print(
+            f"Bulk upload {bulk_upload.id} {bulk_upload.upload_status}: "
+            f"{bulk_upload.total_records} rows, {bulk_upload.successful_records} created, "
+            f"{bulk_upload.updated_records} updated, {bulk_upload.skipped_records} skipped, "
+            f"{bulk_upload.failed_records} failed"
+        )
+        if bulk_upload.failed_records:
+            print(f"Rejected rows: {reject_report_path(bulk_upload.id)}")
+        return 1 if bulk_upload.upload_status == "failed" else 0
+    finally:
+        db.close()
+
+
+def watch(args: argparse.Namespace) -> int:
+    """Watch a drop folder until interrupted; returns the exit status"""
+    if not args.dir:
+        print("error: no drop folder, set BULK_UPLOAD_WATCH_DIR or pass --dir", file=sys.stderr)
+        return 1
+    if args.workers is not None:
+        settings.bulk_upload_validation_workers = args.workers
+
+    watcher = DropFolderWatcher(args.dir, args.duplicate_action, args.batch_size)
+    print(f"Watching {args.dir} every {args.interval}s")
+    try:
+        watcher.run(args.interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description=__doc__.strip().splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser(
+        "import-products",
+        help="Import a product file as a bulk upload",
+        description="Import a product file (CSV, .csv.gz, .zip, .xlsx, Parquet or NDJSON) "
+                    "with the same validation and writes as a bulk upload sent to the API."
+    )
+    importer.add_argument("file", help="File to import")
+    importer.add_argument("--company", required=True, help="Company id to import into")
+    importer.add_argument("--manager", required=True, help="Id or email of the company's manager the import is recorded for")
+    importer.add_argument("--duplicate-action", choices=["skip", "update"], default="skip",
+                          help="What to do with products that already exist (default: skip)")
+    importer.add_argument("--import-mode", choices=IMPORT_MODES, default="batch",
+                          help="'copy' streams chunks through COPY on PostgreSQL (default: batch)")
+    importer.add_argument("--batch-size", type=int, default=None,
+                          help="Rows per committed batch (default: BULK_UPLOAD_BATCH_SIZE, "
+                               "or BULK_UPLOAD_COPY_BATCH_SIZE in copy mode)")
+    importer.add_argument("--workers", type=int, default=None,
+                          help="Validation processes, 1 validates in-process (default: BULK_UPLOAD_VALIDATION_WORKERS)")
+    importer.add_argument("--force", action="store_true",
+                          help="Import the file even if the same file was imported before")
+    importer.add_argument("--no-progress", dest="progress", action="store_false", default=None,
+                          help="Do not show the progress bar (shown by default on a terminal)")
+    importer.set_defaults(handler=import_products)
+
+    watcher = commands.add_parser(
+        "watch",
+        help="Import the files dropped into a folder, one subdirectory per company",
+        description="Poll a drop folder and import new files of its company subdirectories as bulk uploads, "
+                    "moving them to done/ or failed/. Run it instead of the watcher in the API, not beside it."
+    )
+    watcher.add_argument("--dir", default=settings.bulk_upload_watch_dir,
+                         help="Drop folder (default: BULK_UPLOAD_WATCH_DIR)")
+    watcher.add_argument("--interval", type=float, default=settings.bulk_upload_watch_interval,
+                         help="Seconds between scans (default: BULK_UPLOAD_WATCH_INTERVAL)")
+    watcher.add_argument("--duplicate-action", choices=["skip", "update"],
+                         default=settings.bulk_upload_watch_duplicate_action,
+                         help="What to do with products that already exist (default: BULK_UPLOAD_WATCH_DUPLICATE_ACTION)")
+    watcher.add_argument("--batch-size", type=int, default=None,
+                         help="Rows per committed batch (default: BULK_UPLOAD_BATCH_SIZE)")
+    watcher.add_argument("--workers", type=int, default=None,
+                         help="Validation processes per import (default: BULK_UPLOAD_VALIDATION_WORKERS)")
+    watcher.set_defaults(handler=watch, progress=False)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.progress is None:
+        args.progress = sys.stderr.isatty()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
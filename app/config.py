@@ -28,6 +28,24 @@ class Settings(BaseSettings):
     db_name: str = os.getenv("DB_NAME", "")
     db_driver: str = os.getenv("DB_DRIVER", "")
 
+    # Bulk upload settings
+    bulk_upload_batch_size: int = int(os.getenv("BULK_UPLOAD_BATCH_SIZE", 1000))  # Rows per lookup/insert/commit
+    bulk_upload_copy_batch_size: int = int(os.getenv("BULK_UPLOAD_COPY_BATCH_SIZE", 50000))  # Rows per COPY/merge/commit in "copy" mode
+    bulk_upload_dir: str = os.getenv("BULK_UPLOAD_DIR", "./uploads")  # Uploaded files waiting to be imported
+    bulk_upload_workers: int = int(os.getenv("BULK_UPLOAD_WORKERS", 2))  # Imports running at once, at most one per company
+    bulk_upload_validation_workers: int = int(os.getenv("BULK_UPLOAD_VALIDATION_WORKERS", min(4, os.cpu_count() or 1)))  # Validation processes, 1 disables the pool
+    bulk_upload_parallel_min_rows: int = int(os.getenv("BULK_UPLOAD_PARALLEL_MIN_ROWS", 20000))  # Files are validated in-process up to this many rows
+    bulk_upload_max_size_mb: int = int(os.getenv("BULK_UPLOAD_MAX_SIZE_MB", 1024))  # Files are streamed, this only bounds disk use
+    bulk_upload_heartbeat_timeout: int = int(os.getenv("BULK_UPLOAD_HEARTBEAT_TIMEOUT", 900))  # Seconds without a heartbeat after which an import run on another host counts as abandoned
+    bulk_upload_recovery_interval: int = int(os.getenv("BULK_UPLOAD_RECOVERY_INTERVAL", 60))  # Seconds between heartbeats of this process's imports and checks for abandoned ones, well under the timeout
+    bulk_upload_watch_dir: str = os.getenv("BULK_UPLOAD_WATCH_DIR", "")  # Drop folder with one subdirectory per company id; empty disables the watcher
+    bulk_upload_watch_interval: int = int(os.getenv("BULK_UPLOAD_WATCH_INTERVAL", 30))  # Seconds between scans of the drop folder
+    bulk_upload_watch_duplicate_action: str = os.getenv("BULK_UPLOAD_WATCH_DUPLICATE_ACTION", "update")  # "skip" or "update" for dropped files
+
+    # Autocomplete settings
+    autocomplete_index_ttl: int = int(os.getenv("AUTOCOMPLETE_INDEX_TTL", 300))  # Seconds before a company's name index is rebuilt, bounds staleness across processes
+    autocomplete_max_companies: int = int(os.getenv("AUTOCOMPLETE_MAX_COMPANIES", 100))  # Company name indexes kept in memory, least recently used dropped first
+
     # JWT Authentication
     SECRET_KEY: str = "IAMAUTH"
     ALGORITHM: str = "HS256"
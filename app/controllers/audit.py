@@ -7,6 +7,7 @@ from datetime import datetime
 from decimal import Decimal
 from typing import List, Optional, Any, Dict
 
+from sqlalchemy import DateTime, Numeric, func, insert
 from sqlalchemy.orm import Session, selectinload
 
 from app.models import AuditTrail, NewAuditTrail, Product, NewProduct
@@ -23,6 +24,18 @@ def serialize_value(value: Any) -> Any:
     return value
 
 
+def deserialize_value(field: str, value: Any) -> Any:
+    """A NewProduct field's value as written by ``serialize_value``, back in its column type"""
+    if value is None:
+        return None
+    column_type = NewProduct.__table__.c[field].type
+    if isinstance(column_type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column_type, Numeric):
+        return Decimal(str(value))
+    return value
+
+
 def get_model_dict(model_instance) -> Dict[str, Any]:
     """Convert SQLAlchemy model to dict, excluding internal attributes"""
     result = {}
@@ -182,6 +195,61 @@ def get_product_audit_logs(
 # NewProduct Audit Trail Functions
 # ─────────────────────────────────────────────────────────────────────────────
 
+def _new_product_audit_row(
+    product_values: Dict[str, Any],
+    action_type: str,
+    changes: Dict[str, Dict[str, Any]],
+    manager_id: int,
+    bulk_upload_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """Build the column values of a NewAuditTrail row for a product"""
+    return {
+        "product_id": product_values["id"],
+        "product_unique_id": product_values["product_id"],
+        "product_name": product_values["product_name"],
+        "action_type": action_type,
+        "changes": json.dumps(changes),
+        "changed_by": manager_id,
+        "company_id": product_values["company_id"],
+        "bulk_upload_id": bulk_upload_id
+    }
+
+
+def new_product_create_audit_row(
+    product_values: Dict[str, Any],
+    manager_id: int,
+    bulk_upload_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """Audit row values for a created product, with every field as new"""
+    changes = {key: {"old": None, "new": serialize_value(value)} for key, value in product_values.items()}
+    action_type = "bulk_create" if bulk_upload_id else "create"
+    return _new_product_audit_row(product_values, action_type, changes, manager_id, bulk_upload_id)
+
+
+def new_product_update_audit_row(
+    new_values: Dict[str, Any],
+    old_values: Dict[str, Any],
+    manager_id: int,
+    bulk_upload_id: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """Audit row values for an updated product, or None if nothing changed"""
+    changes = compute_changes(old_values, new_values)
+    if not changes:
+        return None
+    action_type = "bulk_update" if bulk_upload_id else "update"
+    return _new_product_audit_row(new_values, action_type, changes, manager_id, bulk_upload_id)
+
+
+def new_product_delete_audit_row(
+    product_values: Dict[str, Any],
+    manager_id: int,
+    bulk_upload_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """Audit row values for a deleted product, with every field becoming None"""
+    changes = {key: {"old": serialize_value(value), "new": None} for key, value in product_values.items()}
+    return _new_product_audit_row(product_values, "delete", changes, manager_id, bulk_upload_id)
+
+
 def log_new_product_create(
     db: Session,
     product: NewProduct,
@@ -189,23 +257,7 @@ def log_new_product_create(
     bulk_upload_id: Optional[int] = None
 ) -> NewAuditTrail:
     """Log new product creation"""
-    product_data = get_model_dict(product)
-
-    # For create, all fields are "new"
-    changes = {key: {"old": None, "new": value} for key, value in product_data.items()}
-
-    action_type = "bulk_create" if bulk_upload_id else "create"
-
-    audit = NewAuditTrail(
-        product_id=product.id,
-        product_unique_id=product.product_id,
-        product_name=product.product_name,
-        action_type=action_type,
-        changes=json.dumps(changes),
-        changed_by=manager_id,
-        company_id=product.company_id,
-        bulk_upload_id=bulk_upload_id
-    )
+    audit = NewAuditTrail(**new_product_create_audit_row(get_model_dict(product), manager_id, bulk_upload_id))
     db.add(audit)
     db.commit()
     db.refresh(audit)
@@ -220,25 +272,13 @@ def log_new_product_update(
     bulk_upload_id: Optional[int] = None
 ) -> Optional[NewAuditTrail]:
     """Log new product update"""
-    new_values = get_model_dict(product)
-    changes = compute_changes(old_values, new_values)
+    audit_row = new_product_update_audit_row(get_model_dict(product), old_values, manager_id, bulk_upload_id)
 
     # Only log if there are actual changes
-    if not changes:
+    if audit_row is None:
         return None
 
-    action_type = "bulk_update" if bulk_upload_id else "update"
-
-    audit = NewAuditTrail(
-        product_id=product.id,
-        product_unique_id=product.product_id,
-        product_name=product.product_name,
-        action_type=action_type,
-        changes=json.dumps(changes),
-        changed_by=manager_id,
-        company_id=product.company_id,
-        bulk_upload_id=bulk_upload_id
-    )
+    audit = NewAuditTrail(**audit_row)
     db.add(audit)
     db.commit()
     db.refresh(audit)
@@ -251,26 +291,62 @@ def log_new_product_delete(
     manager_id: int
 ) -> NewAuditTrail:
     """Log new product deletion"""
-    product_data = get_model_dict(product)
-
-    # For delete, all fields become None
-    changes = {key: {"old": value, "new": None} for key, value in product_data.items()}
-
-    audit = NewAuditTrail(
-        product_id=product.id,
-        product_unique_id=product.product_id,
-        product_name=product.product_name,
-        action_type="delete",
-        changes=json.dumps(changes),
-        changed_by=manager_id,
-        company_id=product.company_id
-    )
+    audit = NewAuditTrail(**new_product_delete_audit_row(get_model_dict(product), manager_id))
     db.add(audit)
     db.commit()
     db.refresh(audit)
     return audit
 
 
+class NewAuditTrailWriter:
+    """
+    Collects NewAuditTrail rows during a bulk operation and writes them in batches.
+
+    Rows are kept in memory until ``flush``, which inserts them with one
+    multi-row INSERT in the session's current transaction and does not commit;
+    callers flush right before committing the matching product writes. After a
+    rollback, ``discard`` drops the rows of the batch that was rolled back, so
+    audit rows are only ever committed together with their products.
+    """
+
+    def __init__(self, db: Session, manager_id: int, bulk_upload_id: Optional[int] = None):
+        self.db = db
+        self.manager_id = manager_id
+        self.bulk_upload_id = bulk_upload_id
+        self.pending: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def log_create(self, product_values: Dict[str, Any]) -> None:
+        """Queue the audit row for a created product, given all its column values"""
+        self.pending.append(new_product_create_audit_row(product_values, self.manager_id, self.bulk_upload_id))
+
+    def log_update(self, new_values: Dict[str, Any], old_values: Dict[str, Any]) -> bool:
+        """Queue the audit row for an updated product; returns False if nothing changed"""
+        audit_row = new_product_update_audit_row(new_values, old_values, self.manager_id, self.bulk_upload_id)
+        if audit_row is None:
+            return False
+        self.pending.append(audit_row)
+        return True
+
+    def log_delete(self, product_values: Dict[str, Any]) -> None:
+        """Queue the audit row for a deleted product, given its last column values"""
+        self.pending.append(new_product_delete_audit_row(product_values, self.manager_id, self.bulk_upload_id))
+
+    def flush(self) -> int:
+        """Insert the queued rows without committing; returns how many were written"""
+        count = len(self.pending)
+        if self.pending:
+            self.db.execute(insert(NewAuditTrail), self.pending)
+            self.pending = []
+        return count
+
+    def discard(self) -> None:
+        """Drop the queued rows, e.g. after their product writes were rolled back"""
+        self.pending = []
+
+
 def get_new_product_audit_logs(
     db: Session,
     company_id: Optional[str] = None,
@@ -307,3 +383,31 @@ def get_new_product_audit_logs(
         }
         for a in audits
     ]
+
+
+def get_bulk_upload_audit_page(
+    db: Session,
+    bulk_upload_id: int,
+    after: Optional[int] = None,
+    limit: int = 100
+) -> List[NewAuditTrail]:
+    """
+    A page of the audit rows a bulk upload wrote, in id order, after the row ``after``.
+
+    Keyset pagination on the (bulk_upload_id, id) index: each page costs the
+    same however far into the upload it is.
+    """
+    query = db.query(NewAuditTrail).filter(NewAuditTrail.bulk_upload_id == bulk_upload_id)
+    if after is not None:
+        query = query.filter(NewAuditTrail.id > after)
+    return query.order_by(NewAuditTrail.id).limit(limit).all()
+
+
+def count_bulk_upload_audit_actions(db: Session, bulk_upload_id: int) -> Dict[str, int]:
+    """Number of audit rows per action type a bulk upload wrote"""
+    return dict(
+        db.query(NewAuditTrail.action_type, func.count(NewAuditTrail.id))
+        .filter(NewAuditTrail.bulk_upload_id == bulk_upload_id)
+        .group_by(NewAuditTrail.action_type)
+        .all()
+    )
@@ -0,0 +1,203 @@
+"""
+Bulk Upload Preview Controller
+Works out what a bulk upload would change (dry runs), without writing any product
+"""
+import csv
+import itertools
+import json
+from contextlib import closing
+from typing import Any, BinaryIO, Dict, List, Optional, TextIO, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.controllers.audit import compute_changes, serialize_value
+from app.controllers.new_products import BULK_INSERT_DEFAULTS, STORED_ERRORS, import_batch_size
+from app.ingest import PRODUCT_FIELDS, read_upload_chunks, validate_chunks, reject_report_rows
+from app.models import BulkUpload, NewProduct
+
+# Product ids per lookup of stored products
+PREVIEW_LOOKUP_SIZE = 1000
+
+# Fields whose empty cells keep the stored value in "update" mode
+COALESCED_FIELDS = list(BULK_INSERT_DEFAULTS)
+
+
+def _load_products(db: Session, company_id: str, product_ids: List[str]) -> List[Tuple[Any, ...]]:
+    """The company's stored (product_id, *PRODUCT_FIELDS) of ``product_ids``, looked up in batches"""
+    table = NewProduct.__table__
+    columns = [table.c.product_id, *(table.c[field] for field in PRODUCT_FIELDS)]
+    rows = []
+    for start in range(0, len(product_ids), PREVIEW_LOOKUP_SIZE):
+        rows.extend(db.execute(
+            select(*columns).where(
+                table.c.company_id == company_id,
+                table.c.product_id.in_(product_ids[start:start + PREVIEW_LOOKUP_SIZE])
+            )
+        ).all())
+    return rows
+
+
+def _same_values(field: str, new: pd.Series, old: pd.Series) -> pd.Series:
+    """Null-safe equality of a field's values, comparing like the database does"""
+    if field == "expiry":
+        # Stored values may come back timezone-aware, uploaded ones are naive
+        new, old = pd.to_datetime(new, utc=True), pd.to_datetime(old, utc=True)
+    return (new.isna() & old.isna()) | (new == old)
+
+
+def _present(value: Any) -> Any:
+    """A cell value, with pandas' missing markers as None"""
+    return None if value is None or value is pd.NaT or (isinstance(value, float) and np.isnan(value)) else value
+
+
+def preview_bulk_upload(
+    db: Session,
+    bulk_upload: BulkUpload,
+    source: BinaryIO,
+    target: TextIO,
+    reject_report: Optional[TextIO] = None,
+    batch_size: Optional[int] = None
+) -> BulkUpload:
+    """
+    Work out what importing an upload file would do, without writing any product.
+
+    The file is read and validated as for an import, in chunks of
+    ``batch_size`` rows (by default the import mode's). Its valid rows are
+    then joined in memory with the company's stored products for the file's
+    product_ids, and every row is compared, set-based, with the product as the importer would
+    find it: stored, created or updated by an earlier row of the file, or
+    missing. As in the importer, empty expiry/price cells keep the previous
+    value in "update" mode.
+
+    Rows that would create or change a product are written to ``target`` as
+    NDJSON, in file order: ``row_number``, ``product_id``, ``action``
+    ("create" or "update") and ``changes`` as ``compute_changes`` reports them.
+    The record gets the counters the import would end with, and a
+    ``preview_summary`` that also counts unchanged rows and changes per field.
+    Rejected rows go to ``reject_report``, as in an import.
+    """
+    company_id = bulk_upload.company_id
+    try:
+        frames = []
+        errors = []
+        rejected = 0
+        total_records = 0
+        reject_writer = csv.writer(reject_report) if reject_report is not None else None
+        max_bytes = settings.bulk_upload_max_size_mb * 1024 * 1024
+        chunks = read_upload_chunks(source, bulk_upload.filename, import_batch_size(db, bulk_upload, batch_size), max_bytes)
+        validated = validate_chunks(
+            chunks,
+            company_id,
+            workers=settings.bulk_upload_validation_workers,
+            min_rows=settings.bulk_upload_parallel_min_rows
+        )
+        # Closed here, while ``source`` is still open, when the preview stops early
+        with closing(chunks), closing(validated):
+            for chunk_rows, valid, rejects in validated:
+                total_records += chunk_rows
+                frames.append(valid[["product_id", *PRODUCT_FIELDS, "row_number"]])
+                rejected += len(rejects)
+                errors.extend(f"Row {row_number}: {message}" for row_number, message in zip(rejects["row_number"], rejects["message"]))
+                del errors[STORED_ERRORS:]
+                if reject_writer is not None:
+                    reject_writer.writerows(reject_report_rows(rejects))
+
+        columns = ["product_id", *PRODUCT_FIELDS, "row_number"]
+        file_rows = [frame.to_numpy(dtype=object) for frame in frames]
+        stored = _load_products(
+            db, company_id, pd.unique(np.concatenate([rows[:, 0] for rows in file_rows] or [[]])).tolist()
+        )
+
+        # Stored products first, then the file's rows in file order: within a
+        # product, each row follows the state it would be applied to. Built
+        # from object arrays, as concatenating frames of objects is slow
+        stacked = pd.DataFrame(
+            np.concatenate([np.array([(*row, 0) for row in stored], dtype=object).reshape(-1, len(columns))] + file_rows),
+            columns=columns
+        )
+        from_file = pd.Series(stacked.index >= len(stored), index=stacked.index)
+        if bulk_upload.duplicate_action == "update":
+            stacked[COALESCED_FIELDS] = stacked.groupby("product_id", sort=False)[COALESCED_FIELDS].ffill()
+        previous = stacked.groupby("product_id", sort=False)[PRODUCT_FIELDS].shift(1)
+        exists = stacked.groupby("product_id", sort=False).cumcount() > 0
+
+        creates = from_file & ~exists
+        if bulk_upload.duplicate_action == "update":
+            changed = pd.DataFrame({
+                field: ~_same_values(field, stacked[field], previous[field]) for field in PRODUCT_FIELDS
+            }) & (from_file & exists).to_numpy()[:, None]
+            updates = changed.any(axis=1)
+            unchanged = from_file & exists & ~updates
+            skips = pd.Series(False, index=stacked.index)
+        else:
+            changed = pd.DataFrame(False, index=stacked.index, columns=PRODUCT_FIELDS)
+            updates = unchanged = pd.Series(False, index=stacked.index)
+            skips = from_file & exists
+
+        values = stacked[PRODUCT_FIELDS].to_numpy(dtype=object)
+        old_values = previous.to_numpy(dtype=object)
+        changed_fields = changed.to_numpy()
+        row_numbers = stacked["row_number"].to_numpy()
+        product_ids = stacked["product_id"].to_numpy()
+        for position in np.flatnonzero((creates | updates).to_numpy()):
+            if creates.iat[position]:
+                # What compute_changes({}, values) gives, in field order
+                action = "create"
+                changes = {
+                    field: {"old": None, "new": serialize_value(value)}
+                    for field, value in zip(PRODUCT_FIELDS, values[position]) if _present(value) is not None
+                }
+            else:
+                action = "update"
+                fields = [field for field, is_changed in zip(PRODUCT_FIELDS, changed_fields[position]) if is_changed]
+                changes = compute_changes(
+                    {field: _present(old_values[position][PRODUCT_FIELDS.index(field)]) for field in fields},
+                    {field: _present(values[position][PRODUCT_FIELDS.index(field)]) for field in fields}
+                )
+            target.write(json.dumps({
+                "row_number": int(row_numbers[position]),
+                "product_id": product_ids[position],
+                "action": action,
+                "changes": changes
+            }) + "\n")
+
+        summary = {
+            "create": int(creates.sum()),
+            "update": int(updates.sum()),
+            "unchanged": int(unchanged.sum()),
+            "skip": int(skips.sum()),
+            "reject": rejected,
+            "fields": {field: int(count) for field, count in changed[updates].sum().items() if count}
+        }
+
+        bulk_upload.total_records = total_records
+        bulk_upload.successful_records = summary["create"]
+        bulk_upload.updated_records = summary["update"] + summary["unchanged"]
+        bulk_upload.skipped_records = summary["skip"]
+        bulk_upload.failed_records = summary["reject"]
+        bulk_upload.processed_rows = total_records
+        bulk_upload.preview_summary = json.dumps(summary)
+        if errors:
+            bulk_upload.error_details = json.dumps(errors)
+        bulk_upload.upload_status = "previewed"
+        db.commit()
+        db.refresh(bulk_upload)
+        return bulk_upload
+
+    except Exception as e:
+        db.rollback()
+        bulk_upload.upload_status = "failed"
+        bulk_upload.error_details = json.dumps([str(e)])
+        db.commit()
+        db.refresh(bulk_upload)
+        return bulk_upload
+
+
+def read_preview_changes(path: str, skip: int = 0, limit: int = 100) -> List[Dict[str, Any]]:
+    """A page of the changes a dry run recorded at ``path``"""
+    with open(path, encoding="utf-8") as source:
+        return [json.loads(line) for line in itertools.islice(source, skip, skip + limit)]
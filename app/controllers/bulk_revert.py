@@ -0,0 +1,197 @@
+"""
+Bulk Upload Revert Controller
+Undoes everything a bulk upload wrote, using its audit trail
+"""
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.autocomplete import product_name_changes, queue_product_name_changes
+from app.controllers.audit import NewAuditTrailWriter, deserialize_value, get_model_dict
+from app.ingest import PRODUCT_FIELDS
+from app.models import BulkUpload, NewAuditTrail, NewProduct
+
+# Audit rows, and products, per statement while reverting
+REVERT_BATCH_SIZE = 1000
+
+# Upload states whose writes can be reverted; others are still running, or wrote nothing
+REVERTIBLE_STATUSES = ["completed", "partial", "failed", "interrupted"]
+
+
+class _RevertPlan:
+    """What an upload did to one product, from its audit rows in id order"""
+
+    def __init__(self, first_audit_id: int, product_unique_id: Optional[str], created: bool):
+        self.first_audit_id = first_audit_id
+        self.product_unique_id = product_unique_id
+        self.created = created
+        self.old_values: Dict[str, Any] = {}
+
+    def add_changes(self, changes: Dict[str, Dict[str, Any]]) -> None:
+        """Keep, per field, the value it had before the upload first changed it"""
+        for field, change in changes.items():
+            if field in PRODUCT_FIELDS:
+                self.old_values.setdefault(field, change["old"])
+
+
+def _load_plans(db: Session, bulk_upload_id: int) -> Dict[int, _RevertPlan]:
+    """Every product the upload created or changed, read in keyset batches of its audit rows"""
+    plans: Dict[int, _RevertPlan] = {}
+    last_id = 0
+    while True:
+        audits = db.execute(
+            select(
+                NewAuditTrail.id, NewAuditTrail.product_id, NewAuditTrail.product_unique_id,
+                NewAuditTrail.action_type, NewAuditTrail.changes
+            )
+            .where(
+                NewAuditTrail.bulk_upload_id == bulk_upload_id,
+                NewAuditTrail.id > last_id,
+                NewAuditTrail.action_type.in_(["bulk_create", "bulk_update"])
+            )
+            .order_by(NewAuditTrail.id)
+            .limit(REVERT_BATCH_SIZE)
+        ).all()
+        if not audits:
+            return plans
+
+        for audit_id, product_id, product_unique_id, action_type, changes in audits:
+            plan = plans.get(product_id)
+            if plan is None:
+                plan = plans[product_id] = _RevertPlan(audit_id, product_unique_id, action_type == "bulk_create")
+            plan.add_changes(json.loads(changes))
+        last_id = audits[-1][0]
+
+
+def _find_conflicts(db: Session, bulk_upload_id: int, plans: Dict[int, _RevertPlan]) -> List[Dict[str, Any]]:
+    """
+    Products of the upload that changed after it, so reverting them would overwrite someone's edit.
+
+    A product conflicts when it no longer exists, when it has an audit row of
+    another operation (a manual edit, a later upload, a deletion) newer than
+    the upload's first change to it, or when its ``updated_at`` is later than
+    the upload's last audit row for it. The last catches edits that leave no
+    audit row, such as those of admins.
+    """
+    conflicts = []
+    product_ids = list(plans)
+    for start in range(0, len(product_ids), REVERT_BATCH_SIZE):
+        batch = product_ids[start:start + REVERT_BATCH_SIZE]
+        updated_at = dict(db.execute(select(NewProduct.id, NewProduct.updated_at).where(NewProduct.id.in_(batch))).all())
+        written_at = dict(db.execute(
+            select(NewAuditTrail.product_id, func.max(NewAuditTrail.created_at))
+            .where(NewAuditTrail.bulk_upload_id == bulk_upload_id, NewAuditTrail.product_id.in_(batch))
+            .group_by(NewAuditTrail.product_id)
+        ).all())
+        latest_edits = dict(db.execute(
+            select(NewAuditTrail.product_id, func.max(NewAuditTrail.id))
+            .where(
+                NewAuditTrail.product_id.in_(batch),
+                or_(NewAuditTrail.bulk_upload_id.is_(None), NewAuditTrail.bulk_upload_id != bulk_upload_id)
+            )
+            .group_by(NewAuditTrail.product_id)
+        ).all())
+
+        for product_id in batch:
+            plan = plans[product_id]
+            if product_id not in updated_at:
+                reason = "deleted after the upload"
+            elif latest_edits.get(product_id, 0) > plan.first_audit_id or (
+                updated_at[product_id] is not None and written_at.get(product_id) is not None
+                and updated_at[product_id] > written_at[product_id]
+            ):
+                reason = "edited after the upload"
+            else:
+                continue
+            conflicts.append({
+                "product_id": product_id,
+                "product_unique_id": plan.product_unique_id,
+                "reason": reason
+            })
+    return conflicts
+
+
+def _product_values(db: Session, product_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """All column values of the given products"""
+    table = NewProduct.__table__
+    return {
+        row["id"]: dict(row)
+        for row in db.execute(select(*table.columns).where(table.c.id.in_(product_ids))).mappings()
+    }
+
+
+def revert_bulk_upload(
+    db: Session,
+    bulk_upload: BulkUpload,
+    manager_id: int
+) -> Tuple[BulkUpload, int, int, List[Dict[str, Any]]]:
+    """
+    Undo what a bulk upload wrote, in one transaction.
+
+    The upload's new_audit_trail rows say which products it created and which
+    it changed, and what they held before. Created products are deleted and
+    changed products get their earlier values back, with batched DELETE and
+    UPDATE statements; the revert itself is audited like manual changes by
+    ``manager_id``. Products edited or deleted after the upload are left alone
+    and reported as conflicts. The upload ends up "reverted".
+
+    Returns (bulk_upload, deleted, restored, conflicts). Raises 409 if the
+    upload is a dry run, still running or already reverted.
+    """
+    if bulk_upload.dry_run or bulk_upload.upload_status not in REVERTIBLE_STATUSES:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Only finished, failed or interrupted imports can be reverted"
+        )
+
+    try:
+        plans = _load_plans(db, bulk_upload.id)
+        conflicts = _find_conflicts(db, bulk_upload.id, plans)
+        conflicting = {conflict["product_id"] for conflict in conflicts}
+
+        to_delete = [product_id for product_id, plan in plans.items() if plan.created and product_id not in conflicting]
+        to_restore = [
+            product_id for product_id, plan in plans.items()
+            if not plan.created and plan.old_values and product_id not in conflicting
+        ]
+
+        audit = NewAuditTrailWriter(db, manager_id)
+        for start in range(0, len(to_delete), REVERT_BATCH_SIZE):
+            batch = to_delete[start:start + REVERT_BATCH_SIZE]
+            for values in _product_values(db, batch).values():
+                audit.log_delete(values)
+                queue_product_name_changes(db, [(values["company_id"], values["id"], None)])
+            db.execute(delete(NewProduct).where(NewProduct.id.in_(batch)))
+            audit.flush()
+
+        for start in range(0, len(to_restore), REVERT_BATCH_SIZE):
+            batch = to_restore[start:start + REVERT_BATCH_SIZE]
+            old_values = {
+                product.id: get_model_dict(product)
+                for product in db.query(NewProduct).filter(NewProduct.id.in_(batch))
+            }
+            db.execute(update(NewProduct), [
+                {
+                    "id": product_id,
+                    **{field: deserialize_value(field, value) for field, value in plans[product_id].old_values.items()}
+                }
+                for product_id in batch
+            ])
+            refreshed = db.query(NewProduct).filter(NewProduct.id.in_(batch)).populate_existing()
+            new_values = [get_model_dict(product) for product in refreshed]
+            queue_product_name_changes(db, product_name_changes(new_values))
+            for values in new_values:
+                audit.log_update(values, old_values[values["id"]])
+            audit.flush()
+
+        bulk_upload.upload_status = "reverted"
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    db.refresh(bulk_upload)
+    return bulk_upload, len(to_delete), len(to_restore), conflicts
@@ -1,22 +1,59 @@
+import base64
+import binascii
+import csv
+import io
 import json
+import os
 import random
-import pandas as pd
-from datetime import datetime
-from decimal import Decimal, InvalidOperation
-from typing import List, Optional, Dict, Any
-from io import StringIO
+import socket
+from collections import deque
+from contextlib import closing
+from datetime import datetime, time, timedelta, timezone
+from typing import BinaryIO, Callable, Deque, List, Optional, Dict, Any, TextIO, Tuple
 
+import pandas as pd
 from fastapi import HTTPException, status, UploadFile
+from sqlalchemy import Numeric, Table, and_, case, func, insert, literal, or_, select, text, union_all, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 
+from app.autocomplete import product_name_changes, queue_product_name_changes
+from app.config import settings
 from app.models import NewProduct, BulkUpload, Manager
-from app.validators import NewProductCreate, NewProductUpdate, CSVProductRow, BulkUploadRead
+from app.validators import NewProductCreate, NewProductUpdate, NewProductFilters, BulkUploadRead
+from app.ingest import (
+    PRODUCT_FIELDS, read_upload_chunks, validate_chunks, iter_product_rows, parse_csv_date, parse_csv_decimal,
+    reject_report_rows, reject_report_row
+)
 from app.controllers.audit import (
-    log_new_product_create, log_new_product_update, log_new_product_delete, get_model_dict
+    log_new_product_create, log_new_product_update, log_new_product_delete, get_model_dict,
+    count_bulk_upload_audit_actions, serialize_value, deserialize_value, NewAuditTrailWriter
 )
 
 
+# Optional columns only present in a row's data when the CSV cell had a value;
+# multi-row INSERTs need every row to carry the same keys
+BULK_INSERT_DEFAULTS = {"expiry": None, "price": None}
+
+# Dialects with INSERT ... ON CONFLICT ... RETURNING
+UPSERT_INSERTS = {"postgresql": postgresql_insert, "sqlite": sqlite_insert}
+
+# Import modes a bulk upload can ask for: "batch" writes multi-row INSERT/upsert
+# batches, "copy" streams chunks through COPY on PostgreSQL
+IMPORT_MODES = ["batch", "copy"]
+
+# Columns the product listing can be sorted by; a leading "-" sorts descending
+PRODUCT_SORT_FIELDS = ["id", "product_name", "product_type", "location", "condition", "payment_status", "expiry", "quantity", "price"]
+
+# Columns the product listing can filter on by value, and count products by
+PRODUCT_FACET_FIELDS = ["product_type", "location", "condition", "payment_status"]
+
+COPY_STAGING_TABLE = "new_products_staging"
+COPY_NULL = "\\N"
+
+
 def generate_product_id(product_name: str, batch_num: str, company_id: str) -> str:
     """Generate unique product_id from ProductName + Batch Number + CompanyID"""
     # Clean and format the components
@@ -84,13 +121,181 @@ def get_new_product(db: Session, product_id: int, company_id: Optional[str] = No
     return product
 
 
-def get_new_products(db: Session, company_id: Optional[str] = None, skip: int = 0, limit: int = 100) -> List[NewProduct]:
-    """Get all new products, optionally filtered by company"""
-    query = db.query(NewProduct)
+def _product_conditions(company_id: Optional[str], filters: Optional[NewProductFilters]) -> List[Any]:
+    """WHERE conditions selecting a company's products that match the filters"""
+    conditions = []
     if company_id:
-        query = query.filter(NewProduct.company_id == company_id)
+        conditions.append(NewProduct.company_id == company_id)
+    if filters is None:
+        return conditions
+
+    for field in PRODUCT_FACET_FIELDS:
+        values = getattr(filters, field)
+        if values:
+            conditions.append(getattr(NewProduct, field).in_(values))
+    if filters.expiry_from is not None:
+        conditions.append(NewProduct.expiry >= datetime.combine(filters.expiry_from, time.min))
+    if filters.expiry_to is not None:
+        conditions.append(NewProduct.expiry < datetime.combine(filters.expiry_to + timedelta(days=1), time.min))
+    return conditions
+
+
+def _parse_sort(sort: str) -> Tuple[str, bool]:
+    """(field, descending) of a ``sort`` parameter; 400 if the field cannot be sorted by"""
+    field = sort[1:] if sort.startswith("-") else sort
+    if field not in PRODUCT_SORT_FIELDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"sort must be one of: {', '.join(PRODUCT_SORT_FIELDS)}, optionally prefixed with '-'"
+        )
+    return field, sort.startswith("-")
 
-    return query.offset(skip).limit(limit).all()
+
+def _sort_order(field: str, descending: bool) -> List[Any]:
+    """ORDER BY of a sort: the field, empty values last, then id as the tie-breaker"""
+    column = getattr(NewProduct, field)
+    order = column.desc() if descending else column.asc()
+    if field == "id":
+        return [order]
+    if column.nullable:
+        order = order.nulls_last()
+    return [order, NewProduct.id.desc() if descending else NewProduct.id.asc()]
+
+
+def get_new_products(
+    db: Session,
+    company_id: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    filters: Optional[NewProductFilters] = None,
+    sort: str = "id"
+) -> List[NewProduct]:
+    """Get new products, optionally filtered by company and ``filters``, ordered by ``sort``"""
+    field, descending = _parse_sort(sort)
+    return (
+        db.query(NewProduct)
+        .filter(*_product_conditions(company_id, filters))
+        .order_by(*_sort_order(field, descending))
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+
+def encode_cursor(values: List[Any]) -> str:
+    """An opaque page token holding the sort key values of the last row of a page"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """The values held by a page token; 400 if it is not one"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        values = None
+    if not isinstance(values, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return values
+
+
+def _after_cursor(cursor: str, sort: str, field: str, descending: bool) -> Any:
+    """
+    WHERE condition selecting the rows after the one ``cursor`` points at.
+
+    Cursors hold ``[id]`` when sorting by id, and ``[sort, value, id]``
+    otherwise; a cursor of another sort is rejected.
+    """
+    values = decode_cursor(cursor)
+    if field == "id":
+        valid = len(values) == 1 and sort == "id"
+    else:
+        valid = len(values) == 3 and values[0] == sort
+    last_id = values[-1] if valid else None
+    if not isinstance(last_id, int):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    id_after = NewProduct.id < last_id if descending else NewProduct.id > last_id
+    if field == "id":
+        return id_after
+
+    column = getattr(NewProduct, field)
+    try:
+        value = deserialize_value(field, values[1])
+    except (TypeError, ValueError, ArithmeticError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    if value is None:
+        # Empty values sort last: only the rest of them are left
+        return and_(column.is_(None), id_after)
+    conditions = [column < value if descending else column > value, and_(column == value, id_after)]
+    if column.nullable:
+        conditions.append(column.is_(None))
+    return or_(*conditions)
+
+
+def get_new_products_page(
+    db: Session,
+    company_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+    filters: Optional[NewProductFilters] = None,
+    sort: str = "id"
+) -> Tuple[List[NewProduct], Optional[str]]:
+    """
+    A page of new products ordered by ``sort``, after the row ``cursor`` points at.
+
+    Keyset pagination: the page is found by seeking past the last row's sort
+    value and id, so deep pages cost the same as the first one.
+    Returns the products and the cursor of the next page, None on the last one.
+    """
+    field, descending = _parse_sort(sort)
+    query = db.query(NewProduct).filter(*_product_conditions(company_id, filters))
+    if cursor:
+        query = query.filter(_after_cursor(cursor, sort, field, descending))
+
+    products = query.order_by(*_sort_order(field, descending)).limit(limit + 1).all()
+    if len(products) <= limit:
+        return products, None
+    products = products[:limit]
+    last = products[-1]
+    if field == "id":
+        return products, encode_cursor([last.id])
+    return products, encode_cursor([sort, serialize_value(getattr(last, field)), last.id])
+
+
+def count_new_product_facets(
+    db: Session,
+    facets: List[str],
+    company_id: Optional[str] = None,
+    filters: Optional[NewProductFilters] = None
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Products per value of each of ``facets``, among the products the filters select.
+
+    One statement: a GROUP BY per facet, glued together with UNION ALL.
+    Values come most frequent first. 400 if a facet cannot be counted.
+    """
+    unknown = [facet for facet in facets if facet not in PRODUCT_FACET_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"facets must be among: {', '.join(PRODUCT_FACET_FIELDS)}"
+        )
+
+    conditions = _product_conditions(company_id, filters)
+    statements = [
+        select(literal(facet).label("facet"), getattr(NewProduct, facet).label("value"), func.count().label("count"))
+        .where(*conditions)
+        .group_by(getattr(NewProduct, facet))
+        for facet in facets
+    ]
+    counts: Dict[str, List[Dict[str, Any]]] = {facet: [] for facet in facets}
+    if not statements:
+        return counts
+    for facet, value, count in db.execute(union_all(*statements) if len(statements) > 1 else statements[0]):
+        counts[facet].append({"value": value, "count": count})
+    for values in counts.values():
+        values.sort(key=lambda facet_count: (-facet_count["count"], facet_count["value"] is None, facet_count["value"] or ""))
+    return counts
 
 
 def update_new_product(db: Session, product_id: int, product_in: NewProductUpdate, company_id: Optional[str] = None, manager_id: Optional[int] = None) -> NewProduct:
@@ -154,229 +359,741 @@ def delete_new_product(db: Session, product_id: int, company_id: Optional[str] =
     return True
 
 
-def parse_csv_date(date_str: str) -> Optional[datetime]:
-    """Parse date string from CSV into datetime object"""
-    if not date_str or date_str.strip() == "":
-        return None
+def _apply_bulk_batch(
+    db: Session,
+    batch: List[Tuple[int, str, Dict[str, Any]]],
+    duplicate_action: str,
+    audit: NewAuditTrailWriter
+) -> Tuple[int, int, int]:
+    """
+    Write one batch of validated rows without committing.
+
+    Uses a native INSERT ... ON CONFLICT upsert where the dialect has one, and a
+    lookup followed by a bulk INSERT and a bulk UPDATE elsewhere. Audit rows are
+    queued on ``audit``. Returns (created, updated, skipped).
+    """
+    dialect = db.get_bind().dialect
+    dialect_insert = UPSERT_INSERTS.get(dialect.name)
+    if dialect_insert is not None and dialect.insert_returning:
+        return _apply_bulk_upsert(db, dialect_insert, batch, duplicate_action, audit)
+    return _apply_bulk_insert_update(db, batch, duplicate_action, audit)
+
+
+def _apply_bulk_upsert(
+    db: Session,
+    dialect_insert: Callable[[Table], Any],
+    batch: List[Tuple[int, str, Dict[str, Any]]],
+    duplicate_action: str,
+    audit: NewAuditTrailWriter
+) -> Tuple[int, int, int]:
+    """
+    Write one batch with a single INSERT ... ON CONFLICT (product_id) ... RETURNING.
+
+    "skip" uses DO NOTHING, so only the inserted rows come back. "update" uses
+    DO UPDATE guarded by a WHERE that leaves unchanged rows alone; the batch's
+    existing rows are read first, once, to give the audit trail its old values.
+    """
+    table = NewProduct.__table__
+    rows = [{**BULK_INSERT_DEFAULTS, **product_data, "product_id": product_id} for _, product_id, product_data in batch]
+    stmt = dialect_insert(table)
+
+    existing_values = {}
+    if duplicate_action == "skip":
+        stmt = stmt.on_conflict_do_nothing(index_elements=[table.c.product_id])
+    else:
+        product_ids = [row["product_id"] for row in rows]
+        existing_values = {
+            product.product_id: get_model_dict(product)
+            for product in db.query(NewProduct).filter(NewProduct.product_id.in_(product_ids))
+        }
+
+        set_ = {}
+        for field in PRODUCT_FIELDS:
+            value = stmt.excluded[field]
+            if field in BULK_INSERT_DEFAULTS:
+                # Empty expiry/price cells keep the stored value
+                value = func.coalesce(value, table.c[field])
+            set_[field] = value
+        changed = or_(*[table.c[field].is_distinct_from(value) for field, value in set_.items()])
+        # ON CONFLICT updates do not run Column.onupdate
+        set_["updated_at"] = func.now()
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.product_id], set_=set_, where=changed)
+
+    returned = db.execute(stmt.returning(*table.columns), rows).mappings().all()
+    queue_product_name_changes(db, product_name_changes(returned))
+
+    created = 0
+    for product in returned:
+        product = dict(product)
+        old_values = existing_values.get(product["product_id"])
+        if old_values is None:
+            created += 1
+            audit.log_create(product)
+        else:
+            audit.log_update(product, old_values)
+
+    if duplicate_action == "skip":
+        return created, 0, len(rows) - created
+    return created, len(existing_values), 0
 
-    date_str = date_str.strip()
-    formats = [
-        "%Y-%m-%d",
-        "%Y-%m-%d %H:%M:%S",
-        "%m/%d/%Y",
-        "%d/%m/%Y",
-        "%Y/%m/%d",
-        "%d-%m-%Y"
-    ]
 
-    for fmt in formats:
+def _apply_bulk_insert_update(
+    db: Session,
+    batch: List[Tuple[int, str, Dict[str, Any]]],
+    duplicate_action: str,
+    audit: NewAuditTrailWriter
+) -> Tuple[int, int, int]:
+    """
+    Write one batch with a lookup, a bulk INSERT and a bulk UPDATE.
+
+    Existing products are looked up with a single IN query, new products are
+    written with one multi-row INSERT and changed products with one bulk UPDATE.
+    """
+    product_ids = [product_id for _, product_id, _ in batch]
+    existing_products = {
+        product.product_id: product
+        for product in db.query(NewProduct).filter(NewProduct.product_id.in_(product_ids))
+    }
+
+    to_insert = []
+    to_update = []
+    updated = 0
+    skipped = 0
+    for _, product_id, product_data in batch:
+        existing_product = existing_products.get(product_id)
+        if existing_product is None:
+            to_insert.append({**BULK_INSERT_DEFAULTS, **product_data, "product_id": product_id})
+        elif duplicate_action == "skip":
+            skipped += 1
+        else:
+            # Only fields whose value actually differs are written, like the ORM would
+            values = {
+                field: value for field, value in product_data.items()
+                if field != "company_id" and getattr(existing_product, field) != value
+            }
+            if values:
+                to_update.append((existing_product, values))
+            updated += 1
+
+    if to_insert:
+        # render_nulls keeps rows with empty optional fields in the same statement
+        inserted = db.execute(
+            insert(NewProduct).returning(*NewProduct.__table__.columns).execution_options(render_nulls=True),
+            to_insert
+        ).mappings().all()
+        queue_product_name_changes(db, product_name_changes(inserted))
+        for product in inserted:
+            audit.log_create(dict(product))
+
+    if to_update:
+        old_values = {product.id: get_model_dict(product) for product, _ in to_update}
+        db.execute(update(NewProduct), [{"id": product.id, **values} for product, values in to_update])
+        refreshed = (
+            db.query(NewProduct)
+            .filter(NewProduct.id.in_(list(old_values)))
+            .populate_existing()
+            .all()
+        )
+        new_values = [get_model_dict(product) for product in refreshed]
+        queue_product_name_changes(db, product_name_changes(new_values))
+        for values in new_values:
+            audit.log_update(values, old_values[values["id"]])
+
+    return len(to_insert), updated, skipped
+
+
+# Counters of a bulk upload, committed with every written batch
+BULK_COUNTERS = ["successful_records", "failed_records", "skipped_records", "updated_records"]
+
+# Row errors kept in BulkUpload.error_details; the reject report has them all
+STORED_ERRORS = 100
+
+
+def _row_errors(bulk_upload: BulkUpload) -> List[str]:
+    """The per-row messages stored on an upload, without any message about why an import stopped"""
+    if not bulk_upload.error_details:
+        return []
+    return [error for error in json.loads(bulk_upload.error_details) if error.startswith("Row ")]
+
+
+class _BulkUploadRun:
+    """
+    Running state of one bulk upload import.
+
+    Every commit writes a batch together with its queued audit rows, the
+    upload's counters and ``checkpoint_row``: the last source row whose outcome
+    is committed. Rejected rows are queued and only counted by the commit that
+    passes them, so an import resumed from its checkpoint neither repeats nor
+    loses a row. Counted rejects go to the reject report, if there is one,
+    before the commit that counts them. ``on_commit`` is called with the upload
+    after every commit; it must not raise, or the committed batch is replayed.
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        bulk_upload: BulkUpload,
+        reject_report: Optional[TextIO] = None,
+        on_commit: Optional[Callable[[BulkUpload], None]] = None
+    ):
+        self.db = db
+        self.bulk_upload = bulk_upload
+        self.on_commit = on_commit
+        self.audit = NewAuditTrailWriter(db, bulk_upload.uploaded_by, bulk_upload.id)
+        self.rejects: Deque[Tuple[Any, ...]] = deque()
+        self.reject_report = reject_report
+        self.reject_writer = csv.writer(reject_report) if reject_report is not None else None
+        if bulk_upload.checkpoint_row:
+            self.counters = {name: getattr(bulk_upload, name) or 0 for name in BULK_COUNTERS}
+            self.errors = _row_errors(bulk_upload)
+        else:
+            self.counters = dict.fromkeys(BULK_COUNTERS, 0)
+            self.errors = []
+
+    def add_rejects(self, rejects: pd.DataFrame) -> None:
+        """Queue a chunk's rejected rows"""
+        self.rejects.extend(reject_report_rows(rejects))
+
+    def reject(self, report_row: Tuple[Any, ...]) -> None:
+        """Count one rejected row: report it and keep its message while there is room"""
+        if len(self.errors) < STORED_ERRORS:
+            self.errors.append(f"Row {report_row[0]}: {report_row[3]}")
+        if self.reject_writer is not None:
+            self.reject_writer.writerow(report_row)
+        self.counters["failed_records"] += 1
+
+    def count_rejects(self, through_row: Optional[int] = None) -> None:
+        """Count the queued rejects up to ``through_row``, or all of them"""
+        while self.rejects and (through_row is None or self.rejects[0][0] <= through_row):
+            self.reject(self.rejects.popleft())
+
+    def commit(self, created: int, updated: int, skipped: int, through_row: int) -> None:
+        """Commit a written batch, its audit rows and the counters, checkpointed at ``through_row``"""
+        self.count_rejects(through_row)
+        if self.reject_report is not None:
+            self.reject_report.flush()
+        self.audit.flush()
+        bulk_upload = self.bulk_upload
+        bulk_upload.successful_records = self.counters["successful_records"] + created
+        bulk_upload.updated_records = self.counters["updated_records"] + updated
+        bulk_upload.skipped_records = self.counters["skipped_records"] + skipped
+        bulk_upload.failed_records = self.counters["failed_records"]
+        bulk_upload.processed_rows = (
+            bulk_upload.successful_records + bulk_upload.updated_records
+            + bulk_upload.skipped_records + bulk_upload.failed_records
+        )
+        bulk_upload.checkpoint_row = through_row
+        if self.errors:
+            bulk_upload.error_details = json.dumps(self.errors)
+        claim_bulk_upload(bulk_upload)
+        self.db.commit()
+        self.counters["successful_records"] += created
+        self.counters["updated_records"] += updated
+        self.counters["skipped_records"] += skipped
+        if self.on_commit is not None:
+            self.on_commit(bulk_upload)
+
+    def write_batch(self, batch: List[Tuple[int, str, Dict[str, Any]]]) -> None:
+        """
+        Write and commit one batch.
+
+        If the batch as a whole fails (e.g. a unique constraint race), it is rolled
+        back and replayed row by row so that only the offending rows are reported.
+        """
+        def commit_rows(rows):
+            created, updated, skipped = _apply_bulk_batch(
+                self.db, rows, self.bulk_upload.duplicate_action, self.audit
+            )
+            self.commit(created, updated, skipped, rows[-1][0])
+
+        if not batch:
+            return
+
         try:
-            return datetime.strptime(date_str, fmt)
-        except ValueError:
-            continue
+            commit_rows(batch)
+            return
+        except Exception:
+            self.db.rollback()
+            self.audit.discard()
 
-    raise ValueError(f"Unable to parse date: {date_str}")
+        for row in batch:
+            try:
+                commit_rows([row])
+            except Exception as e:
+                self.db.rollback()
+                self.audit.discard()
+                # Keep the report in row order
+                self.count_rejects(row[0])
+                self.reject(reject_report_row(row[0], "", "write_failed", str(e), row[2]))
+
+    def write_rows(self, valid: pd.DataFrame, batch_size: int) -> None:
+        """Write a chunk of validated rows in batches of at most ``batch_size``"""
+        batch = []
+        batch_product_ids = set()
+        for row_number, product_id, product_data in iter_product_rows(valid, self.bulk_upload.company_id):
+            # A product repeated within one batch must see its earlier row as
+            # existing, so flush what we have before queueing it again
+            if product_id in batch_product_ids or len(batch) >= batch_size:
+                self.write_batch(batch)
+                batch = []
+                batch_product_ids = set()
+
+            batch.append((row_number, product_id, product_data))
+            batch_product_ids.add(product_id)
+
+        self.write_batch(batch)
+
+    def write_copy_chunk(self, valid: pd.DataFrame, through_row: int) -> None:
+        """
+        Write and commit a chunk through COPY, checkpointed at ``through_row``.
+
+        If the chunk fails as a whole it is rolled back and written again through
+        the batched path, which narrows a failure down to the offending rows.
+        """
+        if valid.empty:
+            return
 
+        try:
+            created, updated, skipped = _apply_copy_chunk(self.db, self.bulk_upload, valid)
+            self.commit(created, updated, skipped, through_row)
+            return
+        except Exception:
+            self.db.rollback()
+
+        self.write_rows(valid, settings.bulk_upload_batch_size)
+
+
+def supports_copy_import(db: Session) -> bool:
+    """Whether the session's database can take the COPY import path (PostgreSQL via psycopg2)"""
+    dialect = db.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver == "psycopg2"
+
+
+def import_batch_size(db: Session, bulk_upload: BulkUpload, batch_size: Optional[int] = None) -> int:
+    """Rows per chunk an upload is read and written in: ``batch_size``, else its import mode's default"""
+    if bulk_upload.import_mode == "copy" and supports_copy_import(db):
+        return batch_size or settings.bulk_upload_copy_batch_size
+    return batch_size or settings.bulk_upload_batch_size
+
+
+def _copy_merge_sql(duplicate_action: str) -> str:
+    """
+    Build the statement that merges the staging table into new_products.
+
+    One statement with data-modifying CTEs: ``old`` snapshots the products the
+    chunk touches, ``written`` inserts (or, for "update", upserts) one row per
+    product_id and ``audit`` writes the matching new_audit_trail rows, whose
+    changes JSON has the same shape as the one built by ``compute_changes``.
+    It returns the number of staged rows, of products created, and the
+    (company_id, id, product_name, product_id) of the written products.
+
+    ``staged`` folds the rows of a repeated product_id into the product the
+    batched path would end up with applying them one by one: with "skip" the
+    first row wins, with "update" every field takes its last row's value,
+    except empty expiry/price cells, which keep the last earlier value.
+    Products get one audit row per chunk rather than one per row.
+    """
+    table = NewProduct.__table__
+    columns = ", ".join(PRODUCT_FIELDS)
+    order = "ASC" if duplicate_action == "skip" else "DESC"
+
+    def folded(field):
+        if duplicate_action == "update" and field in BULK_INSERT_DEFAULTS:
+            return f"(array_agg({field} ORDER BY row_number DESC) FILTER (WHERE {field} IS NOT NULL))[1] AS {field}"
+        return f"(array_agg({field} ORDER BY row_number {order}))[1] AS {field}"
+
+    staged_columns = ", ".join(folded(field) for field in PRODUCT_FIELDS)
+
+    if duplicate_action == "skip":
+        conflict = "DO NOTHING"
+    else:
+        values = {}
+        for field in PRODUCT_FIELDS:
+            values[field] = f"EXCLUDED.{field}"
+            if field in BULK_INSERT_DEFAULTS:
+                # Empty expiry/price cells keep the stored value
+                values[field] = f"COALESCE(EXCLUDED.{field}, n.{field})"
+        assignments = ", ".join(f"{field} = {value}" for field, value in values.items())
+        changed = " OR ".join(f"n.{field} IS DISTINCT FROM {value}" for field, value in values.items())
+        conflict = f"DO UPDATE SET {assignments}, updated_at = now() WHERE {changed}"
+
+    def as_json(alias, column):
+        # Numeric values are serialized as strings, like serialize_value does for Decimal
+        if isinstance(column.type, Numeric):
+            return f"to_json({alias}.{column.name}::text)"
+        return f"to_json({alias}.{column.name})"
+
+    change_values = ", ".join(
+        f"('{column.name}', {as_json('o', column)}, {as_json('w', column)})" for column in table.columns
+    )
 
-def parse_csv_decimal(decimal_str: str) -> Optional[Decimal]:
-    """Parse decimal string from CSV into Decimal object"""
-    if not decimal_str or decimal_str.strip() == "":
-        return None
+    return f"""
+        WITH staged AS (
+            SELECT product_id, {staged_columns}
+            FROM {COPY_STAGING_TABLE}
+            GROUP BY product_id
+        ),
+        old AS (
+            SELECT n.* FROM new_products n JOIN staged s ON s.product_id = n.product_id
+        ),
+        written AS (
+            INSERT INTO new_products AS n ({columns}, product_id, company_id)
+            SELECT {columns}, product_id, :company_id FROM staged
+            ON CONFLICT (product_id) {conflict}
+            RETURNING n.*
+        ),
+        audit AS (
+            INSERT INTO new_audit_trail (
+                product_id, product_unique_id, product_name, action_type, changes,
+                changed_by, company_id, bulk_upload_id
+            )
+            SELECT
+                w.id, w.product_id, w.product_name,
+                CASE WHEN o.id IS NULL THEN 'bulk_create' ELSE 'bulk_update' END,
+                (
+                    SELECT json_object_agg(c.key, json_build_object('old', c.old, 'new', c.new))
+                    FROM (VALUES {change_values}) AS c (key, old, new)
+                    WHERE o.id IS NULL OR c.old::text IS DISTINCT FROM c.new::text
+                )::text,
+                :manager_id, w.company_id, :bulk_upload_id
+            FROM written w LEFT JOIN old o ON o.product_id = w.product_id
+        )
+        SELECT
+            (SELECT count(*) FROM {COPY_STAGING_TABLE}) AS staged,
+            (SELECT count(*) FROM written w WHERE NOT EXISTS (
+                SELECT 1 FROM old o WHERE o.product_id = w.product_id
+            )) AS created,
+            (SELECT json_agg(json_build_array(w.company_id, w.id, w.product_name, w.product_id)) FROM written w) AS names
+    """
+
+
+def _apply_copy_chunk(db: Session, bulk_upload: BulkUpload, valid: pd.DataFrame) -> Tuple[int, int, int]:
+    """
+    Write a chunk of validated rows through a staging table, without committing.
+
+    The rows are streamed into a temporary table with COPY FROM STDIN and then
+    merged into new_products, audit rows included, by ``_copy_merge_sql``. The
+    staging table is dropped on commit. Returns (created, updated, skipped).
+    """
+    table = NewProduct.__table__
+    dialect = db.get_bind().dialect
+    staging_columns = ["row_number", "product_id", *PRODUCT_FIELDS]
+    column_types = ", ".join(
+        f"{field} {table.c[field].type.compile(dialect=dialect)}" for field in staging_columns[1:]
+    )
+
+    db.execute(text(
+        f"CREATE TEMPORARY TABLE {COPY_STAGING_TABLE} (row_number integer, {column_types}) ON COMMIT DROP"
+    ))
 
+    buffer = io.StringIO()
+    valid[staging_columns].to_csv(buffer, header=False, index=False, na_rep=COPY_NULL)
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
     try:
-        return Decimal(decimal_str.strip())
-    except InvalidOperation:
-        raise ValueError(f"Unable to parse decimal: {decimal_str}")
+        cursor.copy_expert(
+            f"COPY {COPY_STAGING_TABLE} ({', '.join(staging_columns)}) "
+            f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+    staged, created, names = db.execute(
+        text(_copy_merge_sql(bulk_upload.duplicate_action)),
+        {
+            "company_id": bulk_upload.company_id,
+            "manager_id": bulk_upload.uploaded_by,
+            "bulk_upload_id": bulk_upload.id
+        }
+    ).one()
+    queue_product_name_changes(db, [
+        (company_id, row_id, (product_name, product_id)) for company_id, row_id, product_name, product_id in names or []
+    ])
 
+    if bulk_upload.duplicate_action == "skip":
+        return created, 0, staged - created
+    return created, staged - created, 0
 
-def process_csv_bulk_upload(
+
+def current_worker_id() -> str:
+    """Identity of this process as recorded on the uploads it runs: host:pid"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_bulk_upload(bulk_upload: BulkUpload) -> None:
+    """Record this process as running an upload's import, alive as of now; the caller commits"""
+    bulk_upload.worker_id = current_worker_id()
+    bulk_upload.heartbeat_at = datetime.now(timezone.utc)
+
+
+def claim_bulk_uploads(db: Session, upload_ids: List[int]) -> None:
+    """Record this process as running the imports of those uploads still "processing", alive as of now"""
+    if not upload_ids:
+        return
+    db.execute(
+        update(BulkUpload)
+        .where(BulkUpload.id.in_(upload_ids), BulkUpload.upload_status == "processing")
+        .values(worker_id=current_worker_id(), heartbeat_at=datetime.now(timezone.utc))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+
+
+def create_bulk_upload(
     db: Session,
-    file: UploadFile,
+    filename: str,
     manager_id: int,
     company_id: str,
-    duplicate_action: str
-) -> BulkUploadRead:
-    """Process CSV file for bulk product upload"""
-
-    # Create bulk upload record
+    duplicate_action: str,
+    import_mode: str = "batch",
+    file_size: Optional[int] = None,
+    content_hash: Optional[str] = None,
+    dry_run: bool = False
+) -> BulkUpload:
+    """
+    Create the bulk upload record that tracks an import while it runs.
+
+    With ``file_size`` the record is an upload session instead: it starts in
+    "uploading" state and waits for that many bytes to be sent in chunks.
+    """
     bulk_upload = BulkUpload(
-        filename=file.filename,
-        upload_status="processing",
+        filename=filename,
+        upload_status="processing" if file_size is None else "uploading",
         duplicate_action=duplicate_action,
+        import_mode=import_mode,
+        file_size=file_size,
+        received_bytes=0,
+        checkpoint_row=0,
+        content_hash=content_hash,
+        dry_run=dry_run,
         uploaded_by=manager_id,
         company_id=company_id
     )
+    if file_size is None:
+        claim_bulk_upload(bulk_upload)
     db.add(bulk_upload)
     db.commit()
     db.refresh(bulk_upload)
+    return bulk_upload
 
-    try:
-        # Read CSV content
-        content = file.file.read().decode('utf-8')
-        csv_data = StringIO(content)
-
-        # Load CSV into pandas DataFrame
-        df = pd.read_csv(csv_data)
-
-        # Map column names to lowercase (support both formats)
-        column_mapping = {
-            'ProductName': 'product_name',
-            'ProductType': 'product_type',
-            'Location': 'location',
-            'SerialNumber': 'serial_number',
-            'BatchNumber': 'batch_number',
-            'LotNumber': 'lot_number',
-            'Expiry': 'expiry',
-            'Condition': 'condition',
-            'Quantity': 'quantity',
-            'Price': 'price',
-            'PaymentStatus': 'payment_status',
-            'Receiver': 'receiver',
-            'ReceiverContact': 'receiver_contact',
-            'Remark': 'remark'
-        }
 
-        # Normalize column names
-        df.columns = [column_mapping.get(col, col.lower()) for col in df.columns]
+def find_completed_bulk_upload(
+    db: Session,
+    company_id: str,
+    content_hash: str,
+    duplicate_action: str
+) -> Optional[BulkUpload]:
+    """The latest completed upload of the same file with the same duplicate action, if any"""
+    return (
+        db.query(BulkUpload)
+        .filter(
+            BulkUpload.company_id == company_id,
+            BulkUpload.content_hash == content_hash,
+            BulkUpload.duplicate_action == duplicate_action,
+            BulkUpload.upload_status == "completed",
+            BulkUpload.dry_run.is_(False)
+        )
+        .order_by(BulkUpload.id.desc())
+        .first()
+    )
 
-        # Validate required columns
-        required_columns = ['product_name', 'product_type', 'quantity']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        if missing_columns:
-            raise ValueError(f"Missing required columns: {missing_columns}")
 
-        total_records = len(df)
-        successful_records = 0
-        failed_records = 0
-        skipped_records = 0
-        updated_records = 0
-        errors = []
+def record_received_bytes(db: Session, bulk_upload: BulkUpload, received_bytes: int) -> BulkUpload:
+    """
+    Record that an upload session's file is complete up to ``received_bytes``.
 
-        # Process each row
-        for index, row in df.iterrows():
-            try:
-                # Convert row to dict and handle NaN values
-                row_dict = row.fillna("").to_dict()
-
-                # Validate CSV row
-                csv_row = CSVProductRow(**row_dict)
-
-                # Convert to NewProduct data
-                product_data = {
-                    "product_name": csv_row.product_name,
-                    "product_type": csv_row.product_type,
-                    "location": csv_row.location if csv_row.location else None,
-                    "serial_number": csv_row.serial_number if csv_row.serial_number else None,
-                    "batch_number": csv_row.batch_number if csv_row.batch_number else None,
-                    "lot_number": csv_row.lot_number if csv_row.lot_number else None,
-                    "condition": csv_row.condition if csv_row.condition else None,
-                    "quantity": csv_row.quantity,
-                    "payment_status": csv_row.payment_status if csv_row.payment_status else None,
-                    "receiver": csv_row.receiver if csv_row.receiver else None,
-                    "receiver_contact": csv_row.receiver_contact if csv_row.receiver_contact else None,
-                    "remark": csv_row.remark if csv_row.remark else None,
-                    "company_id": company_id
-                }
-
-                # Parse date
-                if csv_row.expiry:
-                    try:
-                        product_data["expiry"] = parse_csv_date(csv_row.expiry)
-                    except ValueError as e:
-                        errors.append(f"Row {index + 2}: {str(e)}")
-                        failed_records += 1
-                        continue
-
-                # Parse price
-                if csv_row.price:
-                    try:
-                        product_data["price"] = parse_csv_decimal(csv_row.price)
-                    except ValueError as e:
-                        errors.append(f"Row {index + 2}: {str(e)}")
-                        failed_records += 1
-                        continue
-
-                # Generate product_id
-                product_id = generate_product_id(
-                    csv_row.product_name,
-                    csv_row.batch_number,
-                    company_id
-                )
-
-                # Check if product already exists
-                existing_product = db.query(NewProduct).filter(
-                    NewProduct.product_id == product_id
-                ).first()
-
-                if existing_product:
-                    if duplicate_action == "skip":
-                        skipped_records += 1
-                        continue
-                    elif duplicate_action == "update":
-                        # Capture old values for audit
-                        old_values = get_model_dict(existing_product)
-
-                        # Update existing product
-                        for field, value in product_data.items():
-                            if field != "company_id":  # Don't update company_id
-                                setattr(existing_product, field, value)
-                        db.commit()
-                        db.refresh(existing_product)
-
-                        # Log audit trail for bulk update
-                        log_new_product_update(db, existing_product, old_values, manager_id, bulk_upload_id=bulk_upload.id)
-
-                        updated_records += 1
-                        continue
-
-                # Create new product
-                product_data["product_id"] = product_id
-                new_product = NewProduct(**product_data)
-                db.add(new_product)
-                db.commit()
-                db.refresh(new_product)
-
-                # Log audit trail for bulk create
-                log_new_product_create(db, new_product, manager_id, bulk_upload_id=bulk_upload.id)
-
-                successful_records += 1
+    Compared in the UPDATE itself, so a concurrent chunk that got further is
+    never moved back by one that read an older value.
+    """
+    current = func.coalesce(BulkUpload.received_bytes, 0)
+    db.execute(
+        update(BulkUpload)
+        .where(BulkUpload.id == bulk_upload.id)
+        .values(received_bytes=case((current < received_bytes, received_bytes), else_=current))
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    db.refresh(bulk_upload)
+    return bulk_upload
 
-            except Exception as e:
-                db.rollback()
-                errors.append(f"Row {index + 2}: {str(e)}")
-                failed_records += 1
-                continue
+
+def set_bulk_upload_status(
+    db: Session,
+    bulk_upload: BulkUpload,
+    upload_status: str,
+    error: Optional[str] = None
+) -> BulkUpload:
+    """Move a bulk upload to another state, e.g. when its import is queued again"""
+    bulk_upload.upload_status = upload_status
+    if upload_status == "processing":
+        claim_bulk_upload(bulk_upload)
+    if error is not None:
+        bulk_upload.error_details = json.dumps([error])
+    db.commit()
+    db.refresh(bulk_upload)
+    return bulk_upload
+
+
+def interrupt_bulk_upload(db: Session, bulk_upload: BulkUpload, resumable: bool) -> BulkUpload:
+    """
+    Mark an import that was stopped by a restart as "interrupted".
+
+    The created and updated counters are rebuilt from the new_audit_trail rows
+    tagged with the upload, which are committed together with its products;
+    an update that changed nothing leaves no audit row, so the committed
+    ``updated_records`` is kept when it is larger. Skipped and failed rows leave
+    no audit row either and keep their committed counts. ``resumable`` tells
+    whether the upload's file is still stored, so the import can be resumed.
+    """
+    audited = count_bulk_upload_audit_actions(db, bulk_upload.id)
+    bulk_upload.successful_records = audited.get("bulk_create", 0)
+    bulk_upload.updated_records = max(bulk_upload.updated_records or 0, audited.get("bulk_update", 0))
+
+    if resumable:
+        message = "Import interrupted by a restart; resume it to carry on from its checkpoint"
+    else:
+        message = "Import interrupted by a restart and its file is no longer stored; upload the file again"
+    bulk_upload.upload_status = "interrupted"
+    bulk_upload.error_details = json.dumps(_row_errors(bulk_upload)[:STORED_ERRORS - 1] + [message])
+    db.commit()
+    db.refresh(bulk_upload)
+    return bulk_upload
+
+
+def process_csv_bulk_upload(
+    db: Session,
+    file: UploadFile,
+    manager_id: int,
+    company_id: str,
+    duplicate_action: str,
+    batch_size: Optional[int] = None,
+    import_mode: str = "batch"
+) -> BulkUploadRead:
+    """Process CSV file for bulk product upload, synchronously"""
+    bulk_upload = create_bulk_upload(db, file.filename, manager_id, company_id, duplicate_action, import_mode)
+    run_bulk_upload(db, bulk_upload, file.file, batch_size=batch_size)
+    return BulkUploadRead.model_validate(bulk_upload)
+
+
+def run_bulk_upload(
+    db: Session,
+    bulk_upload: BulkUpload,
+    source: BinaryIO,
+    batch_size: Optional[int] = None,
+    reject_report: Optional[TextIO] = None,
+    on_commit: Optional[Callable[[BulkUpload], None]] = None
+) -> BulkUpload:
+    """
+    Import an upload file into an existing bulk upload record.
+
+    ``source`` is the file as uploaded, in any format ``read_upload_chunks``
+    accepts (chosen by the record's filename, or by content); compressed CSV
+    files are decompressed on the fly, with the decompressed size limited to
+    ``settings.bulk_upload_max_size_mb``.
+
+    The file is streamed in chunks of ``batch_size`` rows (defaults to
+    ``settings.bulk_upload_batch_size``); each chunk is validated column-wise
+    and its rows are written with one commit per batch. The upload's counters, ``processed_rows``
+    and the running ``total_records`` are committed with every batch, so the
+    status endpoint shows live progress while the import runs.
+
+    Every commit also records ``checkpoint_row``, the last row whose outcome is
+    committed. Running an upload that has a checkpoint again (after a crash or a
+    restart) resumes it: rows up to the checkpoint are read but not validated
+    or written again, and the counters carry on from their committed values.
+    It also refreshes the upload's ``worker_id`` and ``heartbeat_at``, which
+    tell whether the import is still running (see ``jobs.is_orphaned``).
+
+    Rejected rows, and rows that fail to write, are written to ``reject_report``
+    as CSV rows (see ``REJECT_REPORT_COLUMNS``) as the import goes; only the
+    first 100 messages are kept in ``error_details``. ``on_commit``, if given,
+    is called with the upload after every committed batch, e.g. to show progress.
+
+    Large files are validated on a process pool (see ``validate_chunks``) while
+    this function, the only user of ``db``, writes the results in file order.
+
+    Uploads in "copy" import mode write each chunk (``settings.bulk_upload_copy_batch_size``
+    rows by default) through COPY and a staging table when the database is
+    PostgreSQL, and fall back to the batched path elsewhere.
+    """
+    use_copy = bulk_upload.import_mode == "copy" and supports_copy_import(db)
+    batch_size = import_batch_size(db, bulk_upload, batch_size)
+    company_id = bulk_upload.company_id
+    checkpoint_row = bulk_upload.checkpoint_row or 0
+    total_records = 0
+
+    def unprocessed_chunks():
+        nonlocal total_records
+        max_bytes = settings.bulk_upload_max_size_mb * 1024 * 1024
+        with closing(read_upload_chunks(source, bulk_upload.filename, batch_size, max_bytes)) as chunks:
+            for chunk in chunks:
+                total_records += len(chunk)
+                if checkpoint_row:
+                    chunk = chunk[chunk.index + 2 > checkpoint_row]
+                if not chunk.empty:
+                    yield chunk
+
+    try:
+        run = _BulkUploadRun(db, bulk_upload, reject_report, on_commit)
+
+        chunks = unprocessed_chunks()
+        validated = validate_chunks(
+            chunks,
+            company_id,
+            workers=settings.bulk_upload_validation_workers,
+            min_rows=settings.bulk_upload_parallel_min_rows
+        )
+        # Closed here, while ``source`` is still open, when the import stops early
+        with closing(chunks), closing(validated):
+            for chunk_rows, valid, rejects in validated:
+                bulk_upload.total_records = total_records
+                run.add_rejects(rejects)
+
+                if use_copy:
+                    last_row = max(int(frame["row_number"].max()) for frame in (valid, rejects) if not frame.empty)
+                    run.write_copy_chunk(valid, last_row)
+                else:
+                    run.write_rows(valid, batch_size)
+
+        run.count_rejects()
+        counters = run.counters
 
         # Update bulk upload record
         bulk_upload.total_records = total_records
-        bulk_upload.successful_records = successful_records
-        bulk_upload.failed_records = failed_records
-        bulk_upload.skipped_records = skipped_records
-        bulk_upload.updated_records = updated_records
+        bulk_upload.successful_records = counters["successful_records"]
+        bulk_upload.failed_records = counters["failed_records"]
+        bulk_upload.skipped_records = counters["skipped_records"]
+        bulk_upload.updated_records = counters["updated_records"]
 
-        if errors:
-            bulk_upload.error_details = json.dumps(errors[:100])  # Limit errors stored
+        if run.errors:
+            bulk_upload.error_details = json.dumps(run.errors)
+        if reject_report is not None:
+            reject_report.flush()
 
-        if failed_records == 0:
+        if counters["failed_records"] == 0:
             bulk_upload.upload_status = "completed"
-        elif successful_records > 0 or updated_records > 0 or skipped_records > 0:
+        elif counters["successful_records"] > 0 or counters["updated_records"] > 0 or counters["skipped_records"] > 0:
             bulk_upload.upload_status = "partial"
         else:
             bulk_upload.upload_status = "failed"
 
+        bulk_upload.processed_rows = total_records
         db.commit()
         db.refresh(bulk_upload)
 
-        return BulkUploadRead.model_validate(bulk_upload)
+        return bulk_upload
 
     except Exception as e:
-        # Update bulk upload record with failure
+        db.rollback()
+        # Update bulk upload record with failure, keeping the committed row
+        # errors and checkpoint so the import can be resumed
         bulk_upload.upload_status = "failed"
-        bulk_upload.error_details = json.dumps([str(e)])
+        bulk_upload.error_details = json.dumps(_row_errors(bulk_upload)[:STORED_ERRORS - 1] + [str(e)])
         db.commit()
         db.refresh(bulk_upload)
 
-        return BulkUploadRead.model_validate(bulk_upload)
+        return bulk_upload
 
 
 def get_bulk_upload(db: Session, upload_id: int, company_id: Optional[str] = None) -> BulkUpload:
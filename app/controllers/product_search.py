@@ -0,0 +1,109 @@
+"""
+Product Search Controller
+Ranked full-text and prefix search over new products
+"""
+import re
+from typing import List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import column, func, literal_column, or_, select, table
+from sqlalchemy.orm import Session
+
+from app.models import NEW_PRODUCT_SEARCH_FIELDS, NewProduct
+
+# Words of a search query; underscores split words like the indexes do
+SEARCH_TERM = re.compile(r"[^\W_]+")
+
+# Terms of a query that are searched for, the rest are ignored
+MAX_SEARCH_TERMS = 8
+
+# Newest matches of a query that are ranked; results page through these only
+SEARCH_RANK_CANDIDATES = 5000
+
+_new_products_fts = table("new_products_fts", column("rowid"))
+
+
+def search_terms(q: str) -> List[str]:
+    """The lower-cased words of a search query"""
+    return SEARCH_TERM.findall(q.lower())[:MAX_SEARCH_TERMS]
+
+
+def search_new_products(
+    db: Session,
+    q: str,
+    company_id: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 20
+) -> Tuple[List[NewProduct], bool]:
+    """
+    Products whose searched fields hold every word of ``q``, best matches first.
+
+    Each word also matches the words it starts, so partial names and serial
+    numbers are found. Served by FTS5 ranked with bm25 on SQLite and by the
+    GIN-indexed search_vector ranked with ts_rank on PostgreSQL; other
+    databases fall back to unranked substring matching.
+
+    Ranking reads every candidate, so only the newest ``SEARCH_RANK_CANDIDATES``
+    matches are ranked: queries matching fewer products are ranked exactly,
+    broader ones keep a bounded cost. Returns the page and whether the query
+    matched more products than were ranked. Raises 400 for a page past the
+    ranked matches.
+    """
+    if skip + limit > SEARCH_RANK_CANDIDATES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Only the first {SEARCH_RANK_CANDIDATES} results of a search can be paged through; add words to narrow it"
+        )
+
+    terms = search_terms(q)
+    if not terms:
+        return [], False
+
+    company_conditions = [NewProduct.company_id == company_id] if company_id else []
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        fts = literal_column("new_products_fts")
+        # bm25 gives better matches lower scores
+        candidates = (
+            select(_new_products_fts.c.rowid.label("id"), (-func.bm25(fts)).label("score"))
+            .select_from(_new_products_fts)
+            .join(NewProduct, NewProduct.id == _new_products_fts.c.rowid)
+            .where(fts.op("MATCH")(" AND ".join(f'"{term}"*' for term in terms)), *company_conditions)
+            .order_by(_new_products_fts.c.rowid.desc())
+            .limit(SEARCH_RANK_CANDIDATES + 1)
+            .subquery()
+        )
+    elif dialect == "postgresql":
+        search_vector = literal_column("new_products.search_vector")
+        tsquery = func.to_tsquery("simple", " & ".join(f"{term}:*" for term in terms))
+        candidates = (
+            select(NewProduct.id.label("id"), func.ts_rank(search_vector, tsquery).label("score"))
+            .where(search_vector.op("@@")(tsquery), *company_conditions)
+            .order_by(NewProduct.id.desc())
+            .limit(SEARCH_RANK_CANDIDATES + 1)
+            .subquery()
+        )
+    else:
+        query = db.query(NewProduct).filter(*company_conditions)
+        for term in terms:
+            query = query.filter(or_(*(getattr(NewProduct, field).ilike(f"%{term}%") for field in NEW_PRODUCT_SEARCH_FIELDS)))
+        return query.order_by(NewProduct.id).offset(skip).limit(limit).all(), False
+
+    # One candidate more than is ranked tells whether the query matched more
+    ranked = select(
+        candidates.c.id,
+        candidates.c.score,
+        func.row_number().over(order_by=candidates.c.id.desc()).label("position"),
+        func.count().over().label("matched")
+    ).subquery()
+    rows = (
+        db.query(NewProduct, ranked.c.matched)
+        .join(ranked, ranked.c.id == NewProduct.id)
+        .filter(ranked.c.position <= SEARCH_RANK_CANDIDATES)
+        .order_by(ranked.c.score.desc(), NewProduct.id)
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+    # An empty page lies past every match, so the query matched fewer than were ranked
+    return [product for product, _ in rows], bool(rows) and rows[0].matched > SEARCH_RANK_CANDIDATES
@@ -0,0 +1,720 @@
+"""
+Bulk Upload Ingestion
+Streams upload files as DataFrames and validates them column-wise.
+
+``validate_frame`` applies the same rules as ``CSVProductRow`` plus the date,
+decimal and product_id handling of the importer, but on whole columns at once.
+``validate_chunks`` spreads that work over a process pool for large files.
+``read_upload_chunks`` reads CSV (plain, gzip or zip), Excel, Parquet and
+NDJSON uploads into the same text chunks; compressed files are decompressed on
+the fly by ``open_upload``. Rejected rows are reported as CSV rows built by
+``reject_report_rows``.
+"""
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import re
+import struct
+import threading
+import zipfile
+from contextlib import contextmanager
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+# Map column names to lowercase (support both formats)
+CSV_COLUMN_MAPPING = {
+    'ProductName': 'product_name',
+    'ProductType': 'product_type',
+    'Location': 'location',
+    'SerialNumber': 'serial_number',
+    'BatchNumber': 'batch_number',
+    'LotNumber': 'lot_number',
+    'Expiry': 'expiry',
+    'Condition': 'condition',
+    'Quantity': 'quantity',
+    'Price': 'price',
+    'PaymentStatus': 'payment_status',
+    'Receiver': 'receiver',
+    'ReceiverContact': 'receiver_contact',
+    'Remark': 'remark'
+}
+
+CSV_REQUIRED_COLUMNS = ['product_name', 'product_type', 'quantity']
+
+# Header of a reject report: the problem, then the row's cells under the
+# template's column names, so fixed rows can be uploaded again as they are
+REJECT_REPORT_COLUMNS = ['RowNumber', 'ErrorField', 'ErrorCode', 'ErrorMessage', *CSV_COLUMN_MAPPING]
+
+CSV_DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%m/%d/%Y",
+    "%d/%m/%Y",
+    "%Y/%m/%d",
+    "%d-%m-%Y"
+]
+
+PAYMENT_STATUSES = ["Paid", "Pending", "Unpaid"]
+
+# Bounds of the Integer column quantity is stored in (32 bits on PostgreSQL)
+QUANTITY_MIN, QUANTITY_MAX = -2 ** 31, 2 ** 31 - 1
+
+# NewProduct fields produced for every valid row, in column order
+PRODUCT_FIELDS = [
+    'product_name', 'product_type', 'location', 'serial_number', 'batch_number',
+    'lot_number', 'expiry', 'condition', 'quantity', 'price', 'payment_status',
+    'receiver', 'receiver_contact', 'remark'
+]
+
+# Fields stored as NULL when their cell is empty
+OPTIONAL_FIELDS = [
+    'location', 'serial_number', 'batch_number', 'lot_number', 'condition',
+    'payment_status', 'receiver', 'receiver_contact', 'remark'
+]
+
+# Fields that are left out of a row's data when empty, so that updates keep
+# the existing value instead of clearing it
+OMIT_IF_EMPTY_FIELDS = ['expiry', 'price']
+
+# Whole numbers exported by spreadsheets as floats, e.g. "12345.0"
+_INTEGER_FLOAT = re.compile(r"^(\d+)\.0+$")
+
+# Accepted upload file name endings, mapped to their format
+UPLOAD_FORMATS = {
+    '.csv.gz': 'gzip',
+    '.zip': 'zip',
+    '.csv': 'csv',
+    '.xlsx': 'xlsx',
+    '.parquet': 'parquet',
+    '.ndjson': 'ndjson',
+    '.jsonl': 'ndjson'
+}
+
+UNSUPPORTED_FILE_MESSAGE = (
+    "Unsupported file type: upload a .csv, .csv.gz, .zip (holding one CSV file), "
+    ".xlsx, .parquet or .ndjson file"
+)
+
+# Process pool shared by all imports, created on first use
+_validation_pool: Optional[ProcessPoolExecutor] = None
+_validation_pool_workers = 0
+_validation_pool_lock = threading.Lock()
+
+
+def parse_csv_date(date_str: str) -> Optional[datetime]:
+    """Parse date string from CSV into datetime object"""
+    if not date_str or date_str.strip() == "":
+        return None
+
+    date_str = date_str.strip()
+    for fmt in CSV_DATE_FORMATS:
+        try:
+            return datetime.strptime(date_str, fmt)
+        except ValueError:
+            continue
+
+    raise ValueError(f"Unable to parse date: {date_str}")
+
+
+def parse_csv_decimal(decimal_str: str) -> Optional[Decimal]:
+    """Parse decimal string from CSV into Decimal object"""
+    if not decimal_str or decimal_str.strip() == "":
+        return None
+
+    try:
+        return Decimal(decimal_str.strip())
+    except InvalidOperation:
+        raise ValueError(f"Unable to parse decimal: {decimal_str}")
+
+
+def upload_format(filename: str) -> Optional[str]:
+    """The format of an upload from its file name ("csv", "gzip" or "zip"), or None if not accepted"""
+    name = (filename or "").lower()
+    for suffix, file_format in UPLOAD_FORMATS.items():
+        if name.endswith(suffix):
+            return file_format
+    return None
+
+
+def sniff_upload_format(source: BinaryIO) -> Optional[str]:
+    """Guess an upload's format from its content; ``source`` must be seekable and is rewound"""
+    position = source.tell()
+    head = source.read(512)
+    source.seek(position)
+
+    if head.startswith(b"PAR1"):
+        return 'parquet'
+    if head.startswith(b"\x1f\x8b"):
+        return 'gzip'
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(source) as archive:
+                names = archive.namelist()
+        except zipfile.BadZipFile:
+            return None
+        finally:
+            source.seek(position)
+        if "[Content_Types].xml" in names and any(name.startswith("xl/") for name in names):
+            return 'xlsx'
+        return 'zip'
+    if head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"{"):
+        return 'ndjson'
+    return None
+
+
+def detect_upload_format(source: BinaryIO, filename: str) -> Optional[str]:
+    """An upload's format from its file name, or from its content when the name does not tell"""
+    return upload_format(filename) or sniff_upload_format(source)
+
+
+def _size_limit_error(max_bytes: int) -> ValueError:
+    return ValueError(f"Decompressed file size exceeds {max_bytes // (1024 * 1024)}MB limit")
+
+
+def _zip_entry(archive: zipfile.ZipFile) -> zipfile.ZipInfo:
+    """The single file in a zip upload; folders and macOS resource forks are ignored"""
+    entries = [
+        entry for entry in archive.infolist()
+        if not entry.is_dir() and not entry.filename.startswith("__MACOSX/")
+    ]
+    if len(entries) != 1:
+        raise ValueError("Zip files must contain exactly one CSV file")
+    return entries[0]
+
+
+class _LimitedReader(io.RawIOBase):
+    """Binary reader that fails once more than ``max_bytes`` have been read from ``stream``"""
+
+    def __init__(self, stream: BinaryIO, max_bytes: int):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.stream.read(len(buffer))
+        self.bytes_read += len(data)
+        if self.bytes_read > self.max_bytes:
+            raise _size_limit_error(self.max_bytes)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def check_upload_file(path: str, filename: str, max_bytes: int) -> None:
+    """
+    Cheap upfront checks of a stored upload, raising ValueError.
+
+    The format must be known from the file name or content. Zip files must hold
+    a single file whose declared size is within ``max_bytes``; gzip files must
+    start with the gzip magic number and declare (in their trailer) a size
+    within ``max_bytes``; Excel and Parquet files must declare an uncompressed
+    size within ``max_bytes``. Declared sizes can lie, so ``open_upload``
+    enforces the limit again while decompressing CSV files.
+    """
+    with open(path, "rb") as source:
+        file_format = detect_upload_format(source, filename)
+
+    if file_format is None:
+        raise ValueError(UNSUPPORTED_FILE_MESSAGE)
+    elif file_format == 'zip':
+        try:
+            with zipfile.ZipFile(path) as archive:
+                entry = _zip_entry(archive)
+        except zipfile.BadZipFile:
+            raise ValueError("File is not a valid zip archive")
+        if entry.file_size > max_bytes:
+            raise _size_limit_error(max_bytes)
+    elif file_format == 'gzip':
+        with open(path, "rb") as source:
+            # 18 bytes: the smallest possible gzip file
+            if os.path.getsize(path) < 18 or source.read(2) != b"\x1f\x8b":
+                raise ValueError("File is not a valid gzip file")
+            # ISIZE: uncompressed size of the last member, modulo 2**32
+            source.seek(-4, os.SEEK_END)
+            if struct.unpack("<I", source.read(4))[0] > max_bytes:
+                raise _size_limit_error(max_bytes)
+    elif file_format == 'xlsx':
+        try:
+            with zipfile.ZipFile(path) as archive:
+                size = sum(entry.file_size for entry in archive.infolist())
+        except zipfile.BadZipFile:
+            raise ValueError("File is not a valid Excel workbook")
+        if size > max_bytes:
+            raise _size_limit_error(max_bytes)
+    elif file_format == 'parquet':
+        pq = _import_pyarrow_parquet()
+        try:
+            metadata = pq.ParquetFile(path).metadata
+        except Exception:
+            raise ValueError("File is not a valid Parquet file")
+        size = sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+        if size > max_bytes:
+            raise _size_limit_error(max_bytes)
+
+
+@contextmanager
+def open_upload(source: BinaryIO, filename: str, max_bytes: Optional[int] = None) -> Iterator[BinaryIO]:
+    """
+    Open an upload as a stream of CSV bytes, decompressing gzip and zip files on the fly.
+
+    Nothing is written to disk; reading past ``max_bytes`` decompressed bytes
+    raises ValueError, so compression bombs are cut off while being read.
+    """
+    file_format = detect_upload_format(source, filename)
+    if file_format == 'gzip':
+        with gzip.GzipFile(fileobj=source, mode="rb") as stream:
+            yield stream if max_bytes is None else _LimitedReader(stream, max_bytes)
+    elif file_format == 'zip':
+        with zipfile.ZipFile(source) as archive:
+            entry = _zip_entry(archive)
+            if max_bytes is not None and entry.file_size > max_bytes:
+                raise _size_limit_error(max_bytes)
+            with archive.open(entry) as stream:
+                yield stream if max_bytes is None else _LimitedReader(stream, max_bytes)
+    else:
+        yield source
+
+
+def normalize_columns(frame: pd.DataFrame) -> pd.DataFrame:
+    """Normalize column names and check that the required columns are present"""
+    frame.columns = [CSV_COLUMN_MAPPING.get(col, col.lower()) for col in frame.columns]
+
+    missing_columns = [col for col in CSV_REQUIRED_COLUMNS if col not in frame.columns]
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {missing_columns}")
+    return frame
+
+
+def read_csv_chunks(source: BinaryIO, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """
+    Stream a CSV file as DataFrames of at most ``chunk_size`` rows.
+
+    The file is parsed straight from the binary stream, so memory use depends on
+    the chunk size and not on the file size. Every column is read as text, empty
+    cells included, so chunks do not depend on pandas' per-chunk type inference.
+    """
+    with pd.read_csv(source, chunksize=chunk_size, encoding="utf-8", dtype=str) as reader:
+        for chunk in reader:
+            yield normalize_columns(chunk.fillna(""))
+
+
+def read_upload_chunks(
+    source: BinaryIO,
+    filename: str,
+    chunk_size: int,
+    max_bytes: Optional[int] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream an upload of any accepted format as DataFrames of at most ``chunk_size`` rows.
+
+    Chunks look the same whatever the format: normalized column names, text
+    cells (typed values converted without losing digits, see ``_cell_text``)
+    and an index giving each row's number in errors (index + 2). CSV files may
+    be gzip or zip compressed; Excel and Parquet files must be seekable.
+    """
+    file_format = detect_upload_format(source, filename)
+    if file_format == 'parquet':
+        yield from _read_parquet_chunks(source, chunk_size)
+    elif file_format == 'xlsx':
+        yield from _read_xlsx_chunks(source, chunk_size)
+    elif file_format == 'ndjson':
+        stream = source if max_bytes is None else io.BufferedReader(_LimitedReader(source, max_bytes))
+        yield from _read_ndjson_chunks(stream, chunk_size)
+    else:
+        with open_upload(source, filename, max_bytes) as stream:
+            yield from read_csv_chunks(stream, chunk_size)
+
+
+def _cell_text(value: Any) -> str:
+    """
+    A typed cell value as the text a CSV export would ideally have held.
+
+    Whole floats lose their ".0" (so phone numbers and identifiers stored as
+    numbers keep their digits), other floats keep their shortest exact form and
+    datetimes use a format ``parse_csv_date`` accepts.
+    """
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, float):
+        if value != value:
+            return ""
+        if value.is_integer():
+            return str(int(value))
+        return repr(value)
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def _import_pyarrow_parquet():
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet uploads need the pyarrow package, which is not installed")
+    return pq
+
+
+def _arrow_text(column) -> np.ndarray:
+    """A pyarrow column as text cells, converted by Arrow a whole column at a time"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if pa.types.is_timestamp(column.type):
+        # strftime's %S carries the fraction of a second, which is cut off
+        text = pc.utf8_slice_codeunits(pc.strftime(column, format="%Y-%m-%d %H:%M:%S"), 0, 19)
+    else:
+        try:
+            text = pc.cast(column, pa.string())
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            text = pa.array([_cell_text(value) for value in column.to_pylist()], pa.string())
+    return pc.fill_null(text, "").to_numpy(zero_copy_only=False)
+
+
+def _read_parquet_chunks(source: BinaryIO, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Stream a Parquet file's record batches as text chunks"""
+    pq = _import_pyarrow_parquet()
+    parquet_file = pq.ParquetFile(source)
+    offset = 0
+    for batch in parquet_file.iter_batches(batch_size=chunk_size):
+        index = pd.RangeIndex(offset, offset + batch.num_rows)
+        offset += batch.num_rows
+        frame = pd.DataFrame(
+            {name: _arrow_text(column) for name, column in zip(batch.schema.names, batch.columns)},
+            index=index
+        )
+        yield normalize_columns(frame)
+
+
+def _read_xlsx_chunks(source: BinaryIO, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Stream the first sheet of an Excel workbook as text chunks; row numbers are sheet rows"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("Excel uploads need the openpyxl package, which is not installed")
+
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ValueError("No columns to parse from file")
+        columns = [(position, _cell_text(name).strip()) for position, name in enumerate(header)]
+        columns = [(position, name) for position, name in columns if name]
+
+        names = [name for _, name in columns]
+        records, index = [], []
+        chunks = 0
+        for sheet_row, row in enumerate(rows, start=2):
+            if all(value is None for value in row):
+                continue
+            records.append([_cell_text(row[position]) if position < len(row) else "" for position, _ in columns])
+            index.append(sheet_row - 2)
+            if len(records) >= chunk_size:
+                yield normalize_columns(pd.DataFrame(records, columns=names, index=index))
+                records, index = [], []
+                chunks += 1
+        if records or not chunks:
+            yield normalize_columns(pd.DataFrame(records, columns=names, index=index))
+    finally:
+        workbook.close()
+
+
+def _read_ndjson_chunks(stream: BinaryIO, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Stream newline-delimited JSON objects as text chunks; row numbers are line numbers"""
+    records, index = [], []
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(f"Line {line_number}: invalid JSON")
+        if not isinstance(record, dict):
+            raise ValueError(f"Line {line_number}: expected a JSON object")
+        records.append({key: _cell_text(value) for key, value in record.items()})
+        index.append(line_number - 2)
+        if len(records) >= chunk_size:
+            yield normalize_columns(pd.DataFrame.from_records(records, index=index).fillna(""))
+            records, index = [], []
+    if records:
+        yield normalize_columns(pd.DataFrame.from_records(records, index=index).fillna(""))
+
+
+def _text_column(frame: pd.DataFrame, column: str) -> pd.Series:
+    """A column as stripped text, empty when the file does not have it"""
+    if column not in frame.columns:
+        return pd.Series("", index=frame.index, dtype=object)
+    return frame[column].astype(str).str.strip()
+
+
+def _empty_to_none(values: pd.Series) -> pd.Series:
+    """Turn empty strings into None, as the importer stores them"""
+    return values.astype(object).where(values != "", None)
+
+
+def _normalize_identifiers(values: pd.Series) -> pd.Series:
+    """Strip identifiers, dropping a spreadsheet's trailing ".0" from whole numbers"""
+    return values.str.replace(_INTEGER_FLOAT, r"\1", regex=True)
+
+
+def _normalize_phones(values: pd.Series) -> pd.Series:
+    """Strip formatting from phone numbers that are digits once cleaned"""
+    values = values.str.replace(_INTEGER_FLOAT, r"\1", regex=True)
+    cleaned = values.str.replace(r"[+\- ()]", "", regex=True)
+    return cleaned.where(cleaned.str.isdigit(), values)
+
+
+def _parse_dates(values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    Parse dates trying each of CSV_DATE_FORMATS in order, a column at a time.
+
+    Returns (parsed datetimes or None, mask of cells that could not be parsed).
+    Cells no format matches are retried with ``parse_csv_date`` so that dates
+    outside pandas' timestamp range behave exactly as before.
+    """
+    parsed = pd.Series(None, index=values.index, dtype=object)
+    pending = values != ""
+    for fmt in CSV_DATE_FORMATS:
+        if not pending.any():
+            break
+        attempt = pd.to_datetime(values[pending], format=fmt, errors="coerce")
+        matched = attempt.notna()
+        parsed[attempt.index[matched]] = [timestamp.to_pydatetime() for timestamp in attempt[matched]]
+        pending[attempt.index[matched]] = False
+
+    invalid = pd.Series(False, index=values.index)
+    for index in values.index[pending]:
+        try:
+            parsed[index] = parse_csv_date(values[index])
+        except ValueError:
+            invalid[index] = True
+    return parsed, invalid
+
+
+def _parse_decimals(values: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """Parse prices into Decimals; returns (parsed Decimals or None, invalid mask)"""
+    parsed = pd.Series(None, index=values.index, dtype=object)
+    invalid = pd.Series(False, index=values.index)
+
+    present = values != ""
+    numeric = pd.to_numeric(values[present], errors="coerce")
+    finite_index = numeric.index[numeric.notna() & np.isfinite(numeric)]
+    parsed[finite_index] = [Decimal(value) for value in values[finite_index]]
+
+    # Anything pandas does not read as a finite number gets Decimal's own verdict
+    for index in numeric.index.difference(finite_index):
+        try:
+            parsed[index] = parse_csv_decimal(values[index])
+        except ValueError:
+            invalid[index] = True
+    return parsed, invalid
+
+
+def generate_product_ids(product_names: pd.Series, batch_numbers: pd.Series, company_id: str) -> pd.Series:
+    """Column-wise form of ``generate_product_id``: NAME_BATCH_COMPANY"""
+    name_part = product_names.str.strip().str.replace(" ", "_").str.upper()
+    batch_part = batch_numbers.str.strip().str.replace(" ", "_").str.upper()
+    return name_part + "_" + batch_part + "_" + company_id.strip().upper()
+
+
+def validate_frame(frame: pd.DataFrame, company_id: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Validate and normalize a chunk of upload rows column by column.
+
+    ``frame`` holds text cells with normalized column names and the file's row
+    index. Returns ``(valid, rejects)``:
+
+    - ``valid`` has the NewProduct fields (empty values as None, expiry as
+      datetime, price as Decimal), ``product_id`` and ``row_number``
+    - ``rejects`` has the original cells plus ``row_number``, ``field``,
+      ``code`` and ``message``; only the first problem of each row is reported
+    """
+    row_numbers = pd.Series(frame.index + 2, index=frame.index)
+
+    # Raw values keep their surrounding whitespace, like the CSV cells did
+    def raw(column):
+        if column not in frame.columns:
+            return pd.Series("", index=frame.index, dtype=object)
+        return frame[column].astype(str)
+
+    result = pd.DataFrame(index=frame.index)
+    for column in ['product_name', 'product_type', 'location', 'condition', 'receiver', 'remark']:
+        result[column] = raw(column)
+
+    for column in ['serial_number', 'batch_number', 'lot_number']:
+        result[column] = _normalize_identifiers(_text_column(frame, column))
+    result['receiver_contact'] = _normalize_phones(_text_column(frame, 'receiver_contact'))
+    result['payment_status'] = _text_column(frame, 'payment_status')
+
+    quantity_text = _text_column(frame, 'quantity')
+    quantity = pd.to_numeric(quantity_text, errors="coerce")
+    quantity_invalid = quantity.isna() | ~np.isfinite(quantity)
+    quantity = np.trunc(quantity.where(~quantity_invalid, 0))
+    # Checked before the cast, which would wrap larger values around
+    quantity_out_of_range = (quantity < QUANTITY_MIN) | (quantity > QUANTITY_MAX)
+    result['quantity'] = quantity.where(~quantity_out_of_range, 0).astype("int64")
+
+    expiry_text = _text_column(frame, 'expiry')
+    result['expiry'], expiry_invalid = _parse_dates(expiry_text)
+
+    price_text = _text_column(frame, 'price')
+    result['price'], price_invalid = _parse_decimals(price_text)
+
+    # Checks in the order the row-by-row importer reported them
+    checks = [
+        ('quantity', 'invalid_integer', quantity_invalid,
+         lambda index: "quantity must be a valid integer"),
+        ('quantity', 'out_of_range', quantity_out_of_range,
+         lambda index: f"quantity must be between {QUANTITY_MIN} and {QUANTITY_MAX}"),
+        ('payment_status', 'invalid_choice',
+         (result['payment_status'] != "") & ~result['payment_status'].isin(PAYMENT_STATUSES),
+         lambda index: "payment_status must be one of: Paid, Pending, Unpaid"),
+        ('expiry', 'invalid_date', expiry_invalid,
+         lambda index: f"Unable to parse date: {expiry_text[index]}"),
+        ('price', 'invalid_decimal', price_invalid,
+         lambda index: f"Unable to parse decimal: {price_text[index]}"),
+        ('batch_number', 'required', result['batch_number'] == "",
+         lambda index: "batch_number is required to generate product_id"),
+    ]
+
+    rejected = pd.Series(False, index=frame.index)
+    reject_field = pd.Series("", index=frame.index, dtype=object)
+    reject_code = pd.Series("", index=frame.index, dtype=object)
+    reject_message = pd.Series("", index=frame.index, dtype=object)
+    for field, code, failed, message in checks:
+        new_failures = failed & ~rejected
+        if new_failures.any():
+            failed_index = frame.index[new_failures]
+            reject_field[failed_index] = field
+            reject_code[failed_index] = code
+            reject_message[failed_index] = [message(index) for index in failed_index]
+            rejected |= new_failures
+
+    rejects = frame[rejected].copy()
+    rejects['row_number'] = row_numbers[rejected]
+    rejects['field'] = reject_field[rejected]
+    rejects['code'] = reject_code[rejected]
+    rejects['message'] = reject_message[rejected]
+
+    valid = result[~rejected].copy()
+    valid['product_id'] = generate_product_ids(valid['product_name'], valid['batch_number'], company_id)
+    for column in OPTIONAL_FIELDS:
+        valid[column] = _empty_to_none(valid[column])
+    for column in OMIT_IF_EMPTY_FIELDS:
+        valid[column] = valid[column].astype(object).where(valid[column].notna(), None)
+    valid['row_number'] = row_numbers[~rejected]
+    return valid, rejects
+
+
+def iter_product_rows(valid: pd.DataFrame, company_id: str) -> Iterator[Tuple[int, str, Dict[str, Any]]]:
+    """Yield (row_number, product_id, NewProduct data) for each validated row"""
+    records = valid[PRODUCT_FIELDS].to_dict("records")
+    for row_number, product_id, product_data in zip(valid['row_number'], valid['product_id'], records):
+        for field in OMIT_IF_EMPTY_FIELDS:
+            if product_data[field] is None:
+                del product_data[field]
+        product_data["company_id"] = company_id
+        yield int(row_number), product_id, product_data
+
+
+def reject_report_rows(rejects: pd.DataFrame) -> List[Tuple[Any, ...]]:
+    """Reject report rows, in ``REJECT_REPORT_COLUMNS`` order, for the rejects of ``validate_frame``"""
+    cells = [
+        rejects[column].fillna("") if column in rejects.columns else [""] * len(rejects)
+        for column in CSV_COLUMN_MAPPING.values()
+    ]
+    return list(zip(
+        rejects['row_number'].astype(int), rejects['field'], rejects['code'], rejects['message'], *cells
+    ))
+
+
+def reject_report_row(row_number: int, field: str, code: str, message: str, values: Dict[str, Any]) -> Tuple[Any, ...]:
+    """A reject report row for a row known by its NewProduct values, e.g. one that failed to write"""
+    cells = (_cell_text(values.get(column)) for column in CSV_COLUMN_MAPPING.values())
+    return (row_number, field, code, message, *cells)
+
+
+def _get_validation_pool(workers: int) -> ProcessPoolExecutor:
+    """The shared validation pool, (re)created when missing or resized"""
+    global _validation_pool, _validation_pool_workers
+    with _validation_pool_lock:
+        if _validation_pool is None or _validation_pool_workers != workers:
+            if _validation_pool is not None:
+                _validation_pool.shutdown(wait=False)
+            # Workers are spawned rather than forked: the API process runs threads
+            _validation_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _validation_pool_workers = workers
+        return _validation_pool
+
+
+def _discard_validation_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next import starts a fresh one"""
+    global _validation_pool
+    with _validation_pool_lock:
+        if _validation_pool is pool:
+            _validation_pool = None
+    pool.shutdown(wait=False)
+
+
+def validate_chunks(
+    chunks: Iterable[pd.DataFrame],
+    company_id: str,
+    workers: int = 1,
+    min_rows: int = 0
+) -> Iterator[Tuple[int, pd.DataFrame, pd.DataFrame]]:
+    """
+    Validate a stream of chunks, yielding (rows in chunk, valid, rejects) in file order.
+
+    Chunks are validated in-process until ``min_rows`` rows have been read, so
+    small files never pay for a process pool. Past that, and when ``workers`` is
+    above 1, chunks are sent to the shared process pool with at most two per
+    worker in flight; the caller stays the only consumer of the results.
+    """
+    pending = deque()
+    pool = None
+    rows_read = 0
+    try:
+        for chunk in chunks:
+            rows_read += len(chunk)
+            if pool is None and workers > 1 and rows_read > min_rows:
+                pool = _get_validation_pool(workers)
+
+            if pool is None:
+                yield (len(chunk), *validate_frame(chunk, company_id))
+                continue
+
+            pending.append((len(chunk), pool.submit(validate_frame, chunk, company_id)))
+            while len(pending) >= workers * 2:
+                rows, future = pending.popleft()
+                yield (rows, *future.result())
+
+        while pending:
+            rows, future = pending.popleft()
+            yield (rows, *future.result())
+    except BrokenProcessPool:
+        _discard_validation_pool(pool)
+        raise
+    finally:
+        for _, future in pending:
+            future.cancel()
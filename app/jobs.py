@@ -0,0 +1,469 @@
+"""
+Background Jobs
+Runs bulk upload imports on a bounded in-process worker pool, one import per
+company at a time, and recovers the imports a restart interrupted
+"""
+import csv
+import hashlib
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, TextIO, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.controllers.bulk_preview import preview_bulk_upload
+from app.controllers.new_products import (
+    claim_bulk_upload, claim_bulk_uploads, current_worker_id, interrupt_bulk_upload, run_bulk_upload
+)
+from app.database import SessionLocal
+from app.ingest import REJECT_REPORT_COLUMNS
+from app.models import BulkUpload
+
+COPY_CHUNK_SIZE = 1024 * 1024
+
+# Weight of the latest finished job in the import speed used for estimates
+SPEED_SMOOTHING = 0.3
+
+
+class _QueuedJob:
+    """A bulk upload job waiting for, or holding, a worker"""
+
+    def __init__(self, upload_id: int, company_id: str, size: int, run: Callable[[], None]):
+        self.upload_id = upload_id
+        self.company_id = company_id
+        self.size = size
+        self.run = run
+        self.future: Future = Future()
+        self.started_at: Optional[float] = None
+
+
+class BulkUploadScheduler:
+    """
+    Runs bulk upload jobs on at most ``max_workers`` threads, one job per company at a time.
+
+    Jobs start in the order they were submitted, except that a job waits while
+    another job of its company runs: imports of one company would otherwise
+    race on the same product_ids, and the cap bounds the database connections
+    used by imports. Start times are estimated from the file sizes and the
+    speed (bytes per second) of the jobs that finished so far.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bulk-upload")
+        self._lock = threading.Lock()
+        self._pending: List[_QueuedJob] = []
+        self._running: Dict[str, _QueuedJob] = {}
+        self._bytes_per_second: Optional[float] = None
+
+    def submit(self, upload_id: int, company_id: str, size: int, run: Callable[[], None]) -> Future:
+        """Queue ``run`` as the job of an upload of ``size`` bytes"""
+        job = _QueuedJob(upload_id, company_id, size, run)
+        with self._lock:
+            self._pending.append(job)
+            self._dispatch()
+        return job.future
+
+    def _dispatch(self) -> None:
+        """Start the first waiting jobs whose company is idle while workers are free; lock held"""
+        for job in list(self._pending):
+            if len(self._running) >= self.max_workers:
+                break
+            if job.company_id in self._running:
+                continue
+            self._pending.remove(job)
+            self._running[job.company_id] = job
+            job.started_at = time.monotonic()
+            self._executor.submit(self._run, job)
+
+    def _run(self, job: _QueuedJob) -> None:
+        if job.future.set_running_or_notify_cancel():
+            try:
+                job.run()
+            except BaseException as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(None)
+
+        with self._lock:
+            del self._running[job.company_id]
+            seconds = time.monotonic() - job.started_at
+            if job.size and seconds > 0:
+                speed = job.size / seconds
+                if self._bytes_per_second is None:
+                    self._bytes_per_second = speed
+                else:
+                    self._bytes_per_second += SPEED_SMOOTHING * (speed - self._bytes_per_second)
+            self._dispatch()
+
+    def _estimated_waits(self) -> Dict[int, float]:
+        """Seconds until each waiting job should start, replaying the dispatch rule; lock held"""
+        speed = self._bytes_per_second
+        if speed is None:
+            return {}
+
+        now = time.monotonic()
+        finishes = {
+            company_id: max(0.0, job.size / speed - (now - job.started_at))
+            for company_id, job in self._running.items()
+        }
+        waiting = list(self._pending)
+        waits = {}
+        clock = 0.0
+        while waiting:
+            finishes = {company_id: finish for company_id, finish in finishes.items() if finish > clock}
+            for job in list(waiting):
+                if len(finishes) >= self.max_workers:
+                    break
+                if job.company_id not in finishes:
+                    waits[job.upload_id] = clock
+                    finishes[job.company_id] = clock + job.size / speed
+                    waiting.remove(job)
+            if waiting:
+                clock = min(finishes.values())
+        return waits
+
+    def upload_ids(self) -> List[int]:
+        """Ids of the uploads whose jobs are waiting or running"""
+        with self._lock:
+            return [job.upload_id for job in self._pending] + [job.upload_id for job in self._running.values()]
+
+    def queue_status(self, upload_id: int) -> Tuple[Optional[int], Optional[datetime]]:
+        """(position, estimated start) of a waiting job, 1 being next; (None, None) otherwise"""
+        with self._lock:
+            for position, job in enumerate(self._pending, start=1):
+                if job.upload_id == upload_id:
+                    wait = self._estimated_waits().get(upload_id)
+                    if wait is None:
+                        return position, None
+                    return position, datetime.now(timezone.utc) + timedelta(seconds=wait)
+        return None, None
+
+
+_scheduler = BulkUploadScheduler(settings.bulk_upload_workers)
+
+
+def upload_path(upload_id: int) -> str:
+    """Local path of the source file for a bulk upload"""
+    return os.path.join(settings.bulk_upload_dir, f"{upload_id}.upload")
+
+
+def preview_path(upload_id: int) -> str:
+    """Local path of the changes a dry run found, as NDJSON"""
+    return os.path.join(settings.bulk_upload_dir, f"{upload_id}.preview.ndjson")
+
+
+def reject_report_path(upload_id: int) -> str:
+    """Local path of the CSV report of a bulk upload's rejected rows"""
+    return os.path.join(settings.bulk_upload_dir, f"{upload_id}.rejects.csv")
+
+
+def open_reject_report(upload_id: int, checkpoint_row: int = 0) -> TextIO:
+    """
+    Open the reject report of a bulk upload for appending.
+
+    A new report starts with its header. When an import resumes after
+    ``checkpoint_row``, rows reported past the checkpoint are dropped first:
+    the resumed import reports them again.
+    """
+    os.makedirs(settings.bulk_upload_dir, exist_ok=True)
+    path = reject_report_path(upload_id)
+    if checkpoint_row and os.path.exists(path):
+        kept_path = path + ".tmp"
+        with open(path, newline="", encoding="utf-8") as source, \
+                open(kept_path, "w", newline="", encoding="utf-8") as target:
+            reader = csv.reader(source)
+            writer = csv.writer(target)
+            writer.writerow(next(reader, REJECT_REPORT_COLUMNS))
+            writer.writerows(row for row in reader if int(row[0]) <= checkpoint_row)
+        os.replace(kept_path, path)
+    else:
+        with open(path, "w", newline="", encoding="utf-8") as target:
+            csv.writer(target).writerow(REJECT_REPORT_COLUMNS)
+    return open(path, "a", newline="", encoding="utf-8")
+
+
+def save_upload_file(source: BinaryIO, max_bytes: Optional[int] = None, digest: Optional[Any] = None) -> str:
+    """
+    Copy an uploaded file to local storage in fixed-size chunks.
+
+    Returns the path of a temporary file, to be handed to ``attach_upload_file``
+    once the bulk upload record exists. Raises ValueError, leaving nothing behind,
+    if the file is larger than ``max_bytes``. ``digest``, a hashlib object, is
+    updated with the file's content as it is copied.
+    """
+    os.makedirs(settings.bulk_upload_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=settings.bulk_upload_dir, suffix=".part")
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as target:
+            while True:
+                chunk = source.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise ValueError(f"File size exceeds {max_bytes // (1024 * 1024)}MB limit")
+                target.write(chunk)
+                if digest is not None:
+                    digest.update(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a stored file, read in fixed-size chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        for chunk in iter(lambda: source.read(COPY_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def chunked_upload_path(upload_id: int) -> str:
+    """Local path of a file being received in chunks for a bulk upload"""
+    return os.path.join(settings.bulk_upload_dir, f"{upload_id}.uploading")
+
+
+def open_chunked_upload(upload_id: int, offset: int) -> BinaryIO:
+    """Open the file of a chunked upload, creating it if needed, for writing at ``offset``"""
+    os.makedirs(settings.bulk_upload_dir, exist_ok=True)
+    fd = os.open(chunked_upload_path(upload_id), os.O_RDWR | os.O_CREAT, 0o644)
+    target = os.fdopen(fd, "r+b")
+    target.seek(offset)
+    return target
+
+
+def write_chunked_upload(upload_id: int, offset: int, chunk: BinaryIO) -> None:
+    """Write the whole of ``chunk``, a received byte range, into a chunked upload's file at ``offset``"""
+    chunk.seek(0)
+    with open_chunked_upload(upload_id, offset) as target:
+        shutil.copyfileobj(chunk, target, COPY_CHUNK_SIZE)
+
+
+def attach_upload_file(path: str, upload_id: int) -> str:
+    """Move a stored file into place as the source of a bulk upload"""
+    target = upload_path(upload_id)
+    os.replace(path, target)
+    return target
+
+
+def run_bulk_upload_job(
+    upload_id: int,
+    batch_size: Optional[int] = None,
+    session_factory: Callable[[], Session] = SessionLocal,
+    source_path: Optional[str] = None
+) -> None:
+    """
+    Import a stored upload file using a session of its own, or preview it for a dry run.
+
+    The upload is claimed by this process before anything is read, as the job
+    may have waited in the queue since its last heartbeat. Rejected rows are
+    written to the upload's reject report as the import goes.
+    The file is removed once the import is done, unless the upload failed part
+    way: it is kept so the import can be resumed from its checkpoint. An upload
+    that failed because every row was rejected has nothing left to resume. A
+    file given as ``source_path`` instead of the stored one is left where it is.
+    """
+    db = session_factory()
+    try:
+        bulk_upload = db.get(BulkUpload, upload_id)
+        if bulk_upload is None:
+            return
+        claim_bulk_upload(bulk_upload)
+        db.commit()
+
+        path = source_path or upload_path(upload_id)
+        try:
+            with open(path, "rb") as source, \
+                    open_reject_report(upload_id, bulk_upload.checkpoint_row or 0) as reject_report:
+                if bulk_upload.dry_run:
+                    with open(preview_path(upload_id), "w", encoding="utf-8") as target:
+                        preview_bulk_upload(db, bulk_upload, source, target, reject_report, batch_size=batch_size)
+                else:
+                    run_bulk_upload(db, bulk_upload, source, batch_size=batch_size, reject_report=reject_report)
+        except Exception as e:
+            db.rollback()
+            bulk_upload.upload_status = "failed"
+            bulk_upload.error_details = json.dumps([str(e)])
+            db.commit()
+            return
+
+        rejected_all = bool(bulk_upload.total_records) and bulk_upload.failed_records == bulk_upload.total_records
+        if (bulk_upload.upload_status != "failed" or rejected_all) and source_path is None:
+            os.remove(path)
+    finally:
+        db.close()
+
+
+def submit_bulk_upload(
+    upload_id: int,
+    batch_size: Optional[int] = None,
+    session_factory: Callable[[], Session] = SessionLocal,
+    source_path: Optional[str] = None
+) -> Future:
+    """
+    Queue a stored upload for import on the worker pool, behind any other import of its company.
+
+    The upload is claimed by this process as it is queued, see ``BulkUploadSweeper``
+    for the heartbeat of queued jobs. ``source_path`` imports a file kept
+    elsewhere instead, see ``run_bulk_upload_job``.
+    """
+    db = session_factory()
+    try:
+        bulk_upload = db.get(BulkUpload, upload_id)
+        company_id = bulk_upload.company_id
+        claim_bulk_upload(bulk_upload)
+        db.commit()
+    finally:
+        db.close()
+
+    path = source_path or upload_path(upload_id)
+    size = os.path.getsize(path) if os.path.exists(path) else 0
+    return _scheduler.submit(
+        upload_id, company_id, size,
+        lambda: run_bulk_upload_job(upload_id, batch_size, session_factory, source_path)
+    )
+
+
+def get_queue_status(upload_id: int) -> Tuple[Optional[int], Optional[datetime]]:
+    """Queue position and estimated start time of an upload waiting for import"""
+    return _scheduler.queue_status(upload_id)
+
+
+def _process_exists(pid: int) -> bool:
+    """Whether a process of this host is still running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Running, as another user
+    return True
+
+
+def is_orphaned(bulk_upload: BulkUpload, at_startup: bool = False) -> bool:
+    """
+    Whether a "processing" upload has no process left to finish its import.
+
+    Its ``worker_id`` tells which process claimed it. One of this host is
+    asked whether it still runs; one of another host is trusted until its
+    ``heartbeat_at`` is older than ``settings.bulk_upload_heartbeat_timeout``.
+    An upload without a worker predates them. An upload that names this
+    process is its own, except ``at_startup``, before this process queued any
+    import: it was then left by an earlier one that had the same pid.
+    """
+    if not bulk_upload.worker_id:
+        return True
+    if bulk_upload.worker_id == current_worker_id():
+        return at_startup
+    host, _, pid = bulk_upload.worker_id.rpartition(":")
+    if host == socket.gethostname():
+        return not _process_exists(int(pid))
+    heartbeat_at = bulk_upload.heartbeat_at
+    if heartbeat_at is None:
+        return True
+    if heartbeat_at.tzinfo is None:
+        heartbeat_at = heartbeat_at.replace(tzinfo=timezone.utc)  # SQLite drops the offset
+    return datetime.now(timezone.utc) - heartbeat_at > timedelta(seconds=settings.bulk_upload_heartbeat_timeout)
+
+
+def recover_interrupted_bulk_uploads(
+    session_factory: Callable[[], Session] = SessionLocal,
+    at_startup: bool = True
+) -> List[int]:
+    """
+    Mark the uploads a stopped process left in "processing" as "interrupted".
+
+    Run at startup, before any import is queued, then periodically by
+    ``BulkUploadSweeper`` with ``at_startup`` off. Only orphaned uploads are
+    recovered (see ``is_orphaned``): those still run by the CLI, a drop
+    folder watcher or another API process are left alone. Their counters are
+    rebuilt from the audit trail, and they can be resumed if their file is
+    still stored. The uploads are found through the upload_status index and
+    their audit rows through the bulk_upload_id one. Returns the ids of the
+    recovered uploads.
+    """
+    db = session_factory()
+    try:
+        orphaned = [
+            bulk_upload for bulk_upload in (
+                db.query(BulkUpload)
+                .filter(BulkUpload.upload_status == "processing")
+                .order_by(BulkUpload.id)
+            )
+            if is_orphaned(bulk_upload, at_startup)
+        ]
+        for bulk_upload in orphaned:
+            interrupt_bulk_upload(db, bulk_upload, resumable=os.path.exists(upload_path(bulk_upload.id)))
+        return [bulk_upload.id for bulk_upload in orphaned]
+    finally:
+        db.close()
+
+
+class BulkUploadSweeper:
+    """
+    Keeps the heartbeat of this process's imports fresh and recovers the imports no process runs.
+
+    Every ``interval`` seconds the uploads waiting or running on ``scheduler``
+    are claimed again, so other processes see them alive while they wait for a
+    worker or work through a long batch, and orphaned "processing" uploads are
+    marked "interrupted". Startup only recovers imports whose process is known
+    to be gone: those of a host replaced by a deploy look alive until their
+    heartbeat times out, and are recovered by a later sweep.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        scheduler: Optional[BulkUploadScheduler] = None
+    ):
+        self.session_factory = session_factory
+        self.scheduler = scheduler or _scheduler
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def sweep(self) -> List[int]:
+        """Refresh the heartbeat of this process's imports, then recover orphaned ones; returns their ids"""
+        db = self.session_factory()
+        try:
+            claim_bulk_uploads(db, self.scheduler.upload_ids())
+        finally:
+            db.close()
+        return recover_interrupted_bulk_uploads(self.session_factory, at_startup=False)
+
+    def run(self, interval: float) -> None:
+        """Sweep every ``interval`` seconds until ``stop`` is called"""
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Warning: bulk upload sweep failed: {e}")
+
+    def start(self, interval: float) -> None:
+        """Run the sweeper on a background thread"""
+        self._thread = threading.Thread(target=self.run, args=(interval,), name="bulk-upload-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop sweeping"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def start_bulk_upload_sweeper() -> BulkUploadSweeper:
+    """Start sweeping every ``BULK_UPLOAD_RECOVERY_INTERVAL`` seconds in the background"""
+    sweeper = BulkUploadSweeper()
+    sweeper.start(settings.bulk_upload_recovery_interval)
+    return sweeper
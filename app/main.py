@@ -1,6 +1,10 @@
+from contextlib import asynccontextmanager
+
 from fastapi import Depends, FastAPI
 
 from app.database import create_tables
+from app.jobs import recover_interrupted_bulk_uploads, start_bulk_upload_sweeper
+from app.watcher import start_drop_folder_watcher
 from app.utils import roles_required
 from app.routes.auth import router as auth_router
 from app.routes.companies import router as company_router
@@ -11,7 +15,20 @@ from app.routes.users import router as user_router
 from app.routes.audit import router as audit_router
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Imports that were running when the last process stopped never finish on their own
+    recover_interrupted_bulk_uploads()
+    # Those of processes replaced by a deploy only show up once their heartbeat times out
+    sweeper = start_bulk_upload_sweeper()
+    watcher = start_drop_folder_watcher()
+    yield
+    if watcher is not None:
+        watcher.stop()
+    sweeper.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 create_tables()
 
@@ -1,5 +1,5 @@
 from calendar import c
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Text, Numeric
+from sqlalchemy import DDL, BigInteger, Boolean, Column, DateTime, ForeignKey, Index, Integer, String, Text, Numeric, event
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 
@@ -147,23 +147,82 @@ class NewProduct(Base):
 
     company = relationship("Company", back_populates="new_products")
 
+    __table_args__ = (
+        Index("ix_new_products_company_id_id", "company_id", "id"),
+        Index("ix_new_products_company_id_product_type", "company_id", "product_type"),
+        Index("ix_new_products_company_id_location", "company_id", "location"),
+        Index("ix_new_products_company_id_condition", "company_id", "condition"),
+        Index("ix_new_products_company_id_payment_status", "company_id", "payment_status"),
+        Index("ix_new_products_company_id_expiry", "company_id", "expiry"),
+        Index("ix_new_products_company_id_product_name", "company_id", "product_name"),
+    )
+
     def __repr__(self):
         return f"<NewProduct(product_id={self.product_id}, name={self.product_name}, type={self.product_type})>"
 
 
+
+# Columns of new_products covered by product search
+NEW_PRODUCT_SEARCH_FIELDS = ["product_name", "product_type", "serial_number", "batch_number", "lot_number", "remark"]
+
+# Search index of new_products, maintained by the database itself so that every
+# write path (ORM, bulk upserts, COPY imports, reverts) keeps it in sync:
+# on SQLite an external-content FTS5 table updated by triggers, on PostgreSQL
+# a generated tsvector column with a GIN index
+_search_columns = ", ".join(NEW_PRODUCT_SEARCH_FIELDS)
+_new_search_values = ", ".join(f"new.{field}" for field in NEW_PRODUCT_SEARCH_FIELDS)
+_old_search_values = ", ".join(f"old.{field}" for field in NEW_PRODUCT_SEARCH_FIELDS)
+_search_document = " || ' ' || ".join(f"coalesce({field}, '')" for field in NEW_PRODUCT_SEARCH_FIELDS)
+
+NEW_PRODUCT_SEARCH_DDL = {
+    "sqlite": [
+        f"CREATE VIRTUAL TABLE new_products_fts USING fts5("
+        f"{_search_columns}, content='new_products', content_rowid='id', prefix='2 3')",
+        f"CREATE TRIGGER new_products_fts_insert AFTER INSERT ON new_products BEGIN "
+        f"INSERT INTO new_products_fts(rowid, {_search_columns}) VALUES (new.id, {_new_search_values}); END",
+        f"CREATE TRIGGER new_products_fts_delete AFTER DELETE ON new_products BEGIN "
+        f"INSERT INTO new_products_fts(new_products_fts, rowid, {_search_columns}) "
+        f"VALUES ('delete', old.id, {_old_search_values}); END",
+        f"CREATE TRIGGER new_products_fts_update AFTER UPDATE OF {_search_columns} ON new_products BEGIN "
+        f"INSERT INTO new_products_fts(new_products_fts, rowid, {_search_columns}) "
+        f"VALUES ('delete', old.id, {_old_search_values}); "
+        f"INSERT INTO new_products_fts(rowid, {_search_columns}) VALUES (new.id, {_new_search_values}); END",
+    ],
+    "postgresql": [
+        f"ALTER TABLE new_products ADD COLUMN search_vector tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('simple', {_search_document})) STORED",
+        "CREATE INDEX ix_new_products_search_vector ON new_products USING gin (search_vector)",
+    ],
+}
+
+for _dialect, _statements in NEW_PRODUCT_SEARCH_DDL.items():
+    for _statement in _statements:
+        event.listen(NewProduct.__table__, "after_create", DDL(_statement).execute_if(dialect=_dialect))
+event.listen(NewProduct.__table__, "before_drop", DDL("DROP TABLE IF EXISTS new_products_fts").execute_if(dialect="sqlite"))
+
 class BulkUpload(Base):
     __tablename__ = "bulk_uploads"
 
     id = Column(Integer, primary_key=True, index=True)
     filename = Column(String, nullable=False)
-    upload_status = Column(String, default="processing")  # processing, completed, failed, partial
+    upload_status = Column(String, default="processing", index=True)  # uploading, processing, completed, failed, partial, previewed, interrupted, reverted
     total_records = Column(Integer, default=0)
     successful_records = Column(Integer, default=0)
     failed_records = Column(Integer, default=0)
     skipped_records = Column(Integer, default=0)  # For duplicates when skip is chosen
     updated_records = Column(Integer, default=0)  # For duplicates when update is chosen
+    processed_rows = Column(Integer, nullable=False, default=0, server_default="0")  # Rows handled so far, committed with each batch
     error_details = Column(Text, nullable=True)  # JSON string of errors
     duplicate_action = Column(String, nullable=True)  # "skip", "update"
+    import_mode = Column(String, default="batch")  # "batch", "copy"
+    checkpoint_row = Column(Integer, default=0)  # Last source row whose outcome is committed; imports resume after it
+    file_size = Column(BigInteger, nullable=True)  # Declared size of a file sent in chunks
+    received_bytes = Column(BigInteger, default=0)  # Contiguous bytes of that file received so far
+    content_hash = Column(String(64), nullable=True)  # SHA-256 of the uploaded file, to spot re-submitted files
+    dry_run = Column(Boolean, nullable=False, default=False, server_default="0")  # Preview the changes without writing
+    preview_summary = Column(Text, nullable=True)  # JSON string of a dry run's counts
+    worker_id = Column(String, nullable=True)  # host:pid of the process running the import
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)  # Last time that process claimed or committed a batch
 
     uploaded_by = Column(Integer, ForeignKey("managers.id"), nullable=False)
     company_id = Column(String(10), ForeignKey("companies.id"), nullable=False)
@@ -173,6 +232,10 @@ class BulkUpload(Base):
     manager = relationship("Manager")
     company = relationship("Company")
 
+    __table_args__ = (
+        Index("ix_bulk_uploads_company_id_content_hash", "company_id", "content_hash"),
+    )
+
     def __repr__(self):
         return f"<BulkUpload(id={self.id}, filename={self.filename}, status={self.upload_status})>"
 
@@ -217,5 +280,9 @@ class NewAuditTrail(Base):
     company = relationship("Company")
     bulk_upload = relationship("BulkUpload")
 
+    __table_args__ = (
+        Index("ix_new_audit_trail_bulk_upload_id_id", "bulk_upload_id", "id"),
+    )
+
     def __repr__(self):
         return f"<NewAuditTrail(id={self.id}, product_id={self.product_id}, action={self.action_type})>"
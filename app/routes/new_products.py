@@ -1,48 +1,227 @@
-from typing import List
-
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+import hashlib
+import os
+import re
+import tempfile
+from datetime import date
+from typing import List, Optional, Tuple, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status, UploadFile, File, Form, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
 
+from app.autocomplete import product_names
 from app.controllers.new_products import (
-    create_new_product, get_new_product, get_new_products,
+    create_new_product, get_new_product, get_new_products, get_new_products_page, count_new_product_facets,
     update_new_product, delete_new_product,
-    process_csv_bulk_upload, get_bulk_upload, get_bulk_uploads
+    create_bulk_upload, get_bulk_upload, get_bulk_uploads, IMPORT_MODES,
+    record_received_bytes, set_bulk_upload_status, find_completed_bulk_upload
 )
+from app.controllers.bulk_preview import read_preview_changes
+from app.controllers.bulk_revert import revert_bulk_upload
+from app.controllers.product_search import search_new_products
+from app.controllers.audit import get_bulk_upload_audit_page, count_bulk_upload_audit_actions
 from app.database import get_db
+from app.config import settings
+from app.ingest import check_upload_file
+from app.jobs import (
+    save_upload_file, attach_upload_file, submit_bulk_upload,
+    chunked_upload_path, write_chunked_upload, upload_path, file_sha256, preview_path, reject_report_path,
+    get_queue_status
+)
 from app.models import Manager
 from app.utils import get_current_user, roles_required
 from app.validators import (
-    NewProductCreate, NewProductRead, NewProductUpdate,
-    BulkUploadCreate, BulkUploadRead
+    NewProductCreate, NewProductRead, NewProductUpdate, NewProductFilters, NewProductPage, NewProductSearchPage,
+    ProductNameSuggestion, BulkUploadCreate, BulkUploadRead, BulkUploadPreview, BulkUploadRevert, BulkUploadChanges
 )
 
 router = APIRouter(prefix="/new-products", tags=["New Products"])
 
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+# Request body gathered before each write of a chunk to its spool file, which
+# also keeps up to this much in memory before going to disk
+CHUNK_WRITE_BUFFER_BYTES = 1024 * 1024
+
+# Largest page of the keyset-paginated listings
+MAX_PAGE_SIZE = 1000
+
+# Most suggestions one autocomplete lookup returns
+MAX_AUTOCOMPLETE_LIMIT = 50
+
+
+def _validate_bulk_upload_options(duplicate_action: str, import_mode: str) -> None:
+    """Reject unknown duplicate actions and import modes"""
+    if duplicate_action not in ["skip", "update"]:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="duplicate_action must be either 'skip' or 'update'"
+        )
+
+    if import_mode not in IMPORT_MODES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="import_mode must be either 'batch' or 'copy'"
+        )
+
+
+def _parse_content_range(content_range: str, file_size: int) -> Tuple[int, int]:
+    """Parse a ``bytes start-end/total`` header into the (start, end) of a chunk, end exclusive"""
+    match = CONTENT_RANGE.match(content_range.strip())
+    if not match:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Content-Range must look like 'bytes start-end/total'"
+        )
+
+    start, last, total = (int(value) for value in match.groups())
+    if total != file_size or start > last or last >= file_size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Content-Range must lie within the declared file size of {file_size} bytes"
+        )
+    return start, last + 1
+
 # ── LIST NEW PRODUCTS ────────────────────────────────────────────────────────
-@router.get("/", response_model=List[NewProductRead], dependencies=[Depends(roles_required(["employee", "admin", "manager"]))])
+@router.get("/", response_model=Union[List[NewProductRead], NewProductPage], dependencies=[Depends(roles_required(["employee", "admin", "manager"]))])
 def list_new_products(
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
+    product_type: Optional[List[str]] = Query(None),
+    location: Optional[List[str]] = Query(None),
+    condition: Optional[List[str]] = Query(None),
+    payment_status: Optional[List[str]] = Query(None),
+    expiry_from: Optional[date] = None,
+    expiry_to: Optional[date] = None,
+    sort: str = "id",
+    facets: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """List all new products.
+    """List new products.
     - Managers see products of their company.
     - Employees see products of the company their manager belongs to.
     - Admins see all products.
+
+    ``product_type``, ``location``, ``condition`` and ``payment_status`` keep
+    the products with any of the given values (repeat the parameter for more
+    than one), ``expiry_from`` and ``expiry_to`` the products expiring on or
+    between those days. ``sort`` is a field name, prefixed with ``-`` to sort
+    descending; products without a value come last.
+
+    Without ``cursor`` or ``facets`` the products come as a list, paged with
+    ``skip`` and ``limit``. Otherwise the response is a page with ``items``
+    and ``next_cursor``, the ``cursor`` of the next page (an empty ``cursor``
+    asks for the first one); deep pages cost the same as the first one.
+    ``facets``, a comma-separated list of product_type, location, condition
+    and payment_status, adds the number of matching products per value of each.
+    """
+    user_obj = current_user['user']
+    if current_user['role'] == 'manager':
+        company_id_to_filter = user_obj.company_id
+    elif current_user['role'] == 'employee':
+        if not user_obj.manager:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Employee not associated with a manager")
+        company_id_to_filter = user_obj.manager.company_id
+    elif current_user['role'] == 'admin':
+        company_id_to_filter = None  # Admin sees all products
+    else:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied for this role")
+
+    filters = NewProductFilters(
+        product_type=product_type,
+        location=location,
+        condition=condition,
+        payment_status=payment_status,
+        expiry_from=expiry_from,
+        expiry_to=expiry_to
+    )
+    if cursor is None and facets is None:
+        return get_new_products(db, company_id=company_id_to_filter, skip=skip, limit=limit, filters=filters, sort=sort)
+
+    products, next_cursor = get_new_products_page(
+        db, company_id=company_id_to_filter, cursor=cursor, limit=max(1, min(limit, MAX_PAGE_SIZE)),
+        filters=filters, sort=sort
+    )
+    facet_counts = None
+    if facets is not None:
+        facet_counts = count_new_product_facets(
+            db, [facet.strip() for facet in facets.split(",") if facet.strip()],
+            company_id=company_id_to_filter, filters=filters
+        )
+    return NewProductPage(items=products, next_cursor=next_cursor, facets=facet_counts)
+
+
+# ── SEARCH NEW PRODUCTS ──────────────────────────────────────────────────────
+@router.get("/search", response_model=NewProductSearchPage, dependencies=[Depends(roles_required(["employee", "admin", "manager"]))])
+def search_products(
+    q: str = Query(..., min_length=1),
+    skip: int = 0,
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Search new products by words of their name, type, serial, batch and lot numbers and remark.
+
+    Every word of ``q`` has to match, as a whole word or the start of one;
+    the best matches come first, paged with ``skip`` and ``limit``. Only the
+    newest 5000 matches are ranked: ``truncated`` says the query matched more,
+    and pages past them are rejected with 400.
+    """
+    user_obj = current_user['user']
+    if current_user['role'] == 'manager':
+        company_id_to_filter = user_obj.company_id
+    elif current_user['role'] == 'employee':
+        if not user_obj.manager:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Employee not associated with a manager")
+        company_id_to_filter = user_obj.manager.company_id
+    elif current_user['role'] == 'admin':
+        company_id_to_filter = None  # Admin searches all products
+    else:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied for this role")
+
+    products, truncated = search_new_products(
+        db, q, company_id=company_id_to_filter, skip=max(0, skip), limit=max(1, min(limit, MAX_PAGE_SIZE))
+    )
+    return NewProductSearchPage(items=products, truncated=truncated)
+
+
+# ── AUTOCOMPLETE PRODUCT NAMES ───────────────────────────────────────────────
+@router.get("/autocomplete", response_model=List[ProductNameSuggestion], dependencies=[Depends(roles_required(["employee", "admin", "manager"]))])
+def autocomplete_product_names(
+    prefix: str = Query(..., min_length=1),
+    limit: int = 10,
+    company_id: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Product names of the caller's company starting with ``prefix``, ignoring case, in name order.
+
+    Served from an in-memory index of the company's names, so keystrokes do
+    not query the database once it is built. Admins pass ``company_id``.
     """
     user_obj = current_user['user']
     if current_user['role'] == 'manager':
-        return get_new_products(db, company_id=user_obj.company_id, skip=skip, limit=limit)
+        company_id_to_filter = user_obj.company_id
     elif current_user['role'] == 'employee':
         if not user_obj.manager:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Employee not associated with a manager")
-        return get_new_products(db, company_id=user_obj.manager.company_id, skip=skip, limit=limit)
+        company_id_to_filter = user_obj.manager.company_id
     elif current_user['role'] == 'admin':
-        return get_new_products(db, skip=skip, limit=limit)  # Admin sees all products
+        if not company_id:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="company_id is required for admins")
+        company_id_to_filter = company_id
     else:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied for this role")
 
+    suggestions = product_names.complete(db, company_id_to_filter, prefix, max(1, min(limit, MAX_AUTOCOMPLETE_LIMIT)))
+    return [
+        ProductNameSuggestion(product_name=product_name, product_id=product_id)
+        for product_name, product_id in suggestions
+    ]
+
 
 # ── GET NEW PRODUCT ──────────────────────────────────────────────────────────
 @router.get("/{product_id}", response_model=NewProductRead, dependencies=[Depends(roles_required(["employee", "admin", "manager"]))])
@@ -135,43 +314,270 @@ def delete_new_product_endpoint(
 
 
 # ── BULK UPLOAD CSV ─────────────────────────────────────────────────────────
-@router.post("/bulk-upload", response_model=BulkUploadRead, dependencies=[Depends(roles_required(["manager"]))])
+@router.post("/bulk-upload", response_model=BulkUploadRead, status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(roles_required(["manager"]))])
 def bulk_upload_products(
+    response: Response,
     duplicate_action: str = Form(..., description="Action for duplicates: 'skip' or 'update'"),
+    import_mode: str = Form("batch", description="'batch', or 'copy' for COPY-based imports of large files on PostgreSQL"),
+    force: bool = Form(False, description="Import the file even if the same file was imported before"),
+    dry_run: bool = Form(False, description="Only work out what the import would change, see GET /new-products/bulk-upload/{upload_id}/preview"),
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Bulk upload products from CSV file (managers only)"""
+    """Bulk upload products from a file (managers only).
+
+    Accepts CSV (plain, .csv.gz or a .zip holding one CSV file), Excel (.xlsx),
+    Parquet and NDJSON files; the format comes from the file extension, or from
+    the content when the extension is not recognized.
+
+    The file is stored and queued for import; the response is returned right away
+    with the upload in "processing" state. Poll GET /new-products/bulk-upload/{upload_id}
+    for progress and the final result.
+
+    If the company already completed an upload of the same file (by SHA-256)
+    with the same duplicate_action, that upload is returned with status 200 and
+    nothing is imported, unless ``force`` is set.
+
+    With ``dry_run`` nothing is written either: the upload ends in "previewed"
+    state with the counters the import would reach, and the changes it would
+    make are listed by GET /new-products/bulk-upload/{upload_id}/preview.
+    """
     user_obj = current_user['user']
 
-    # Validate file type
-    if not file.filename.lower().endswith('.csv'):
+    # Validate file size
+    max_bytes = settings.bulk_upload_max_size_mb * 1024 * 1024
+    if file.size and file.size > max_bytes:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Only CSV files are allowed"
+            detail=f"File size exceeds {settings.bulk_upload_max_size_mb}MB limit"
         )
 
-    # Validate file size (10MB limit)
-    if file.size and file.size > 10 * 1024 * 1024:  # 10MB in bytes
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="File size exceeds 10MB limit"
-        )
+    _validate_bulk_upload_options(duplicate_action, import_mode)
+
+    # Store the file before creating the record, so rejected uploads leave no trace
+    digest = hashlib.sha256()
+    try:
+        stored_path = save_upload_file(file.file, max_bytes=max_bytes, digest=digest)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    content_hash = digest.hexdigest()
+
+    # A re-submitted file gets the result of its earlier import
+    if not force and not dry_run:
+        previous_upload = find_completed_bulk_upload(db, user_obj.company_id, content_hash, duplicate_action)
+        if previous_upload is not None:
+            os.remove(stored_path)
+            response.status_code = status.HTTP_200_OK
+            return BulkUploadRead.model_validate(previous_upload)
+
+    # Validate file type; compressed files are size-checked here, and limited again while decompressing
+    try:
+        check_upload_file(stored_path, file.filename, max_bytes)
+    except ValueError as e:
+        os.remove(stored_path)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    bulk_upload = create_bulk_upload(
+        db,
+        filename=file.filename,
+        manager_id=user_obj.id,
+        company_id=user_obj.company_id,
+        duplicate_action=duplicate_action,
+        import_mode=import_mode,
+        content_hash=content_hash,
+        dry_run=dry_run
+    )
+    attach_upload_file(stored_path, bulk_upload.id)
 
-    # Validate duplicate_action
-    if duplicate_action not in ["skip", "update"]:
+    submit_bulk_upload(bulk_upload.id)
+    return BulkUploadRead.model_validate(bulk_upload)
+
+
+# ── BULK UPLOAD IN CHUNKS ──────────────────────────────────────────────────
+@router.post("/bulk-upload/sessions", response_model=BulkUploadRead, status_code=status.HTTP_201_CREATED, dependencies=[Depends(roles_required(["manager"]))])
+def create_bulk_upload_session(
+    filename: str = Form(..., description="Name of the file, its extension picks the format"),
+    file_size: int = Form(..., description="Size of the file in bytes"),
+    duplicate_action: str = Form(..., description="Action for duplicates: 'skip' or 'update'"),
+    import_mode: str = Form("batch", description="'batch', or 'copy' for COPY-based imports of large files on PostgreSQL"),
+    dry_run: bool = Form(False, description="Only work out what the import would change"),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Open a session to send a large file in chunks (managers only).
+
+    Send the file with PUT /new-products/bulk-upload/{upload_id}/content, one
+    byte range per request, then start the import with
+    POST /new-products/bulk-upload/{upload_id}/finalize. After a dropped
+    connection, ``received_bytes`` of the upload says where to carry on.
+    """
+    user_obj = current_user['user']
+
+    max_bytes = settings.bulk_upload_max_size_mb * 1024 * 1024
+    if file_size <= 0 or file_size > max_bytes:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="duplicate_action must be either 'skip' or 'update'"
+            detail=f"File size must be between 1 byte and the {settings.bulk_upload_max_size_mb}MB limit"
         )
 
-    return process_csv_bulk_upload(
-        db=db,
-        file=file,
+    _validate_bulk_upload_options(duplicate_action, import_mode)
+
+    bulk_upload = create_bulk_upload(
+        db,
+        filename=filename,
         manager_id=user_obj.id,
         company_id=user_obj.company_id,
-        duplicate_action=duplicate_action
+        duplicate_action=duplicate_action,
+        import_mode=import_mode,
+        file_size=file_size,
+        dry_run=dry_run
+    )
+    return BulkUploadRead.model_validate(bulk_upload)
+
+
+@router.put("/bulk-upload/{upload_id}/content", response_model=BulkUploadRead, dependencies=[Depends(roles_required(["manager"]))])
+async def upload_bulk_upload_chunk(
+    upload_id: int,
+    request: Request,
+    content_range: str = Header(..., description="Byte range of this chunk: 'bytes start-end/total'"),
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Store one byte range of a chunked upload's file.
+
+    Chunks may be sent again, but may not leave a gap: each range has to start
+    at or before ``received_bytes``.
+    """
+    user_obj = current_user['user']
+    # The session and the file are blocking, so they are used from the threadpool
+    bulk_upload = await run_in_threadpool(get_bulk_upload, db, upload_id, company_id=user_obj.company_id)
+
+    if bulk_upload.upload_status != "uploading":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Bulk upload is not waiting for file content"
+        )
+
+    start, end = _parse_content_range(content_range, bulk_upload.file_size)
+    received_bytes = bulk_upload.received_bytes or 0
+    if start > received_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Chunk starts at byte {start}, expected a chunk starting at or before byte {received_bytes}"
+        )
+
+    # The chunk is spooled first and only written to the upload's file once it
+    # is known to be complete, so a truncated retry leaves the bytes already received alone
+    received = 0
+    pending = bytearray()
+    spool = tempfile.SpooledTemporaryFile(max_size=CHUNK_WRITE_BUFFER_BYTES)
+    try:
+        async for piece in request.stream():
+            received += len(piece)
+            if received > end - start:
+                break
+            pending += piece
+            if len(pending) >= CHUNK_WRITE_BUFFER_BYTES:
+                await run_in_threadpool(spool.write, bytes(pending))
+                pending.clear()
+
+        if received != end - start:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Chunk body must be exactly {end - start} bytes, as given by Content-Range"
+            )
+
+        await run_in_threadpool(spool.write, bytes(pending))
+        await run_in_threadpool(write_chunked_upload, upload_id, start, spool)
+    finally:
+        await run_in_threadpool(spool.close)
+
+    bulk_upload = await run_in_threadpool(record_received_bytes, db, bulk_upload, end)
+    return BulkUploadRead.model_validate(bulk_upload)
+
+
+@router.post("/bulk-upload/{upload_id}/finalize", response_model=BulkUploadRead, status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(roles_required(["manager"]))])
+def finalize_bulk_upload(
+    upload_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Queue a chunked upload for import once its whole file has been received"""
+    user_obj = current_user['user']
+    bulk_upload = get_bulk_upload(db, upload_id, company_id=user_obj.company_id)
+
+    if bulk_upload.upload_status != "uploading":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Bulk upload is not waiting for file content"
+        )
+    if (bulk_upload.received_bytes or 0) != bulk_upload.file_size:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Received {bulk_upload.received_bytes or 0} of {bulk_upload.file_size} bytes"
+        )
+
+    stored_path = chunked_upload_path(upload_id)
+    try:
+        check_upload_file(stored_path, bulk_upload.filename, settings.bulk_upload_max_size_mb * 1024 * 1024)
+    except ValueError as e:
+        os.remove(stored_path)
+        set_bulk_upload_status(db, bulk_upload, "failed", error=str(e))
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    attach_upload_file(stored_path, upload_id)
+    bulk_upload.content_hash = file_sha256(upload_path(upload_id))
+    bulk_upload = set_bulk_upload_status(db, bulk_upload, "processing")
+
+    submit_bulk_upload(upload_id)
+    return BulkUploadRead.model_validate(bulk_upload)
+
+
+# ── RESUME BULK UPLOAD ─────────────────────────────────────────────────────
+@router.post("/bulk-upload/{upload_id}/resume", response_model=BulkUploadRead, status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(roles_required(["manager"]))])
+def resume_bulk_upload(
+    upload_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Queue a failed or interrupted import again; it carries on after its last committed batch"""
+    user_obj = current_user['user']
+    bulk_upload = get_bulk_upload(db, upload_id, company_id=user_obj.company_id)
+
+    if bulk_upload.upload_status not in ("failed", "interrupted") or not os.path.exists(upload_path(upload_id)):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Only failed or interrupted bulk uploads whose file is still stored can be resumed"
+        )
+
+    bulk_upload = set_bulk_upload_status(db, bulk_upload, "processing")
+
+    submit_bulk_upload(upload_id)
+    return BulkUploadRead.model_validate(bulk_upload)
+
+
+# ── REVERT BULK UPLOAD ─────────────────────────────────────────────────────
+@router.post("/bulk-upload/{upload_id}/revert", response_model=BulkUploadRevert, dependencies=[Depends(roles_required(["manager"]))])
+def revert_bulk_upload_endpoint(
+    upload_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Undo an import: delete the products it created and restore the ones it changed.
+
+    Products edited or deleted since the import are left as they are and
+    listed in ``conflicts``.
+    """
+    user_obj = current_user['user']
+    bulk_upload = get_bulk_upload(db, upload_id, company_id=user_obj.company_id)
+
+    bulk_upload, deleted, restored, conflicts = revert_bulk_upload(db, bulk_upload, user_obj.id)
+    return BulkUploadRevert(
+        bulk_upload=BulkUploadRead.model_validate(bulk_upload),
+        deleted=deleted,
+        restored=restored,
+        conflicts=conflicts
     )
 
 
@@ -182,7 +588,12 @@ def get_bulk_upload_status(
     db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_user)
 ):
-    """Get bulk upload status by ID"""
+    """Get bulk upload status by ID, including live progress while it is processing.
+
+    Imports of one company run one at a time, so a "processing" upload may be
+    waiting for a worker: ``queue_position`` (1 is next) and
+    ``estimated_start`` tell when it should start.
+    """
     user_obj = current_user['user']
     company_id_to_filter = None
 
@@ -191,7 +602,109 @@ def get_bulk_upload_status(
         company_id_to_filter = user_obj.company_id
 
     bulk_upload = get_bulk_upload(db, upload_id, company_id=company_id_to_filter)
-    return BulkUploadRead.model_validate(bulk_upload)
+    queue_position, estimated_start = get_queue_status(upload_id)
+    return BulkUploadRead.model_validate(bulk_upload).model_copy(
+        update={"queue_position": queue_position, "estimated_start": estimated_start}
+    )
+
+
+# ── BULK UPLOAD PREVIEW ────────────────────────────────────────────────────
+@router.get("/bulk-upload/{upload_id}/preview", response_model=BulkUploadPreview, dependencies=[Depends(roles_required(["manager", "admin"]))])
+def get_bulk_upload_preview(
+    upload_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Page through the changes a dry run found, in file order, with its summary"""
+    user_obj = current_user['user']
+    company_id_to_filter = None
+
+    # Managers can only see uploads from their company
+    if current_user['role'] == 'manager':
+        company_id_to_filter = user_obj.company_id
+
+    bulk_upload = get_bulk_upload(db, upload_id, company_id=company_id_to_filter)
+    if not bulk_upload.dry_run or bulk_upload.upload_status != "previewed":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Bulk upload is not a finished dry run"
+        )
+
+    return BulkUploadPreview(
+        upload=BulkUploadRead.model_validate(bulk_upload),
+        changes=read_preview_changes(preview_path(upload_id), skip=skip, limit=limit),
+        skip=skip,
+        limit=limit
+    )
+
+
+# ── BULK UPLOAD CHANGES ────────────────────────────────────────────────────
+@router.get("/bulk-upload/{upload_id}/changes", response_model=BulkUploadChanges, dependencies=[Depends(roles_required(["manager", "admin"]))])
+def get_bulk_upload_changes(
+    upload_id: int,
+    after: Optional[int] = None,
+    limit: int = 100,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Page through the products an import created or changed, with their field diffs.
+
+    Pages follow the audit trail in id order: pass the previous page's
+    ``next_cursor`` as ``after``. The first page also counts the changes per
+    action type; later pages skip the count so each costs one index range scan.
+    """
+    user_obj = current_user['user']
+    company_id_to_filter = None
+
+    # Managers can only see uploads from their company
+    if current_user['role'] == 'manager':
+        company_id_to_filter = user_obj.company_id
+
+    bulk_upload = get_bulk_upload(db, upload_id, company_id=company_id_to_filter)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    audits = get_bulk_upload_audit_page(db, upload_id, after=after, limit=limit)
+
+    return BulkUploadChanges(
+        upload=BulkUploadRead.model_validate(bulk_upload),
+        counts=count_bulk_upload_audit_actions(db, upload_id) if after is None else None,
+        changes=audits,
+        next_cursor=audits[-1].id if len(audits) == limit else None,
+        limit=limit
+    )
+
+
+# ── BULK UPLOAD REJECTED ROWS ──────────────────────────────────────────────
+@router.get("/bulk-upload/{upload_id}/errors", response_class=FileResponse, dependencies=[Depends(roles_required(["manager", "admin"]))])
+def get_bulk_upload_errors(
+    upload_id: int,
+    db: Session = Depends(get_db),
+    current_user: dict = Depends(get_current_user)
+):
+    """Download the rows of an upload that were rejected, as CSV.
+
+    Each row carries its row number and the problem (field, code, message),
+    then its cells under the template's column names, so the fixed rows can be
+    uploaded again as they are. While the import runs, this is the report so far.
+    """
+    user_obj = current_user['user']
+    company_id_to_filter = None
+
+    # Managers can only see uploads from their company
+    if current_user['role'] == 'manager':
+        company_id_to_filter = user_obj.company_id
+
+    bulk_upload = get_bulk_upload(db, upload_id, company_id=company_id_to_filter)
+    path = reject_report_path(upload_id)
+    if not os.path.exists(path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No rejected rows report for this bulk upload"
+        )
+
+    stem = os.path.basename(bulk_upload.filename).split(".")[0] or "upload"
+    return FileResponse(path, media_type="text/csv", filename=f"{stem}-rejects.csv")
 
 
 # ── LIST BULK UPLOADS ───────────────────────────────────────────────────────
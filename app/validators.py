@@ -1,7 +1,8 @@
-from datetime import datetime
+import json
+from datetime import date, datetime
 from decimal import Decimal
 from pydantic import BaseModel, EmailStr, Field, field_validator  # Ensure EmailStr is imported
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 
 class Token(BaseModel):
     access_token: str
@@ -144,6 +145,36 @@ class NewProductRead(NewProductBase):
         from_attributes = True
 
 
+class NewProductFilters(BaseModel):
+    product_type: Optional[List[str]] = None  # Any of the values
+    location: Optional[List[str]] = None
+    condition: Optional[List[str]] = None
+    payment_status: Optional[List[str]] = None
+    expiry_from: Optional[date] = None  # Inclusive
+    expiry_to: Optional[date] = None  # Inclusive
+
+
+class NewProductFacetCount(BaseModel):
+    value: Optional[str] = None  # None counts the products without a value
+    count: int
+
+
+class NewProductPage(BaseModel):
+    items: List[NewProductRead]
+    next_cursor: Optional[str] = None  # Pass as ``cursor`` for the next page; None on the last one
+    facets: Optional[Dict[str, List[NewProductFacetCount]]] = None  # Only when asked for with ``facets``
+
+
+class NewProductSearchPage(BaseModel):
+    items: List[NewProductRead]
+    truncated: bool = False  # More products matched than are ranked; add words to the query to see them
+
+
+class ProductNameSuggestion(BaseModel):
+    product_name: str
+    product_id: str
+
+
 # CSV Bulk Upload Models
 class BulkUploadCreate(BaseModel):
     duplicate_action: str  # "skip" or "update"
@@ -165,8 +196,18 @@ class BulkUploadRead(BaseModel):
     failed_records: int
     skipped_records: int
     updated_records: int
+    processed_rows: int = 0
     error_details: Optional[str] = None
     duplicate_action: Optional[str] = None
+    import_mode: Optional[str] = None
+    checkpoint_row: Optional[int] = 0
+    file_size: Optional[int] = None
+    received_bytes: Optional[int] = 0
+    content_hash: Optional[str] = None
+    dry_run: Optional[bool] = False
+    preview_summary: Optional[str] = None
+    queue_position: Optional[int] = None  # Set while the upload waits for a worker
+    estimated_start: Optional[datetime] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -174,6 +215,60 @@ class BulkUploadRead(BaseModel):
         from_attributes = True
 
 
+class BulkUploadRevertConflict(BaseModel):
+    product_id: int
+    product_unique_id: Optional[str] = None
+    reason: str
+
+
+class BulkUploadRevert(BaseModel):
+    bulk_upload: BulkUploadRead
+    deleted: int  # Products the upload created
+    restored: int  # Products the upload changed, back to their earlier values
+    conflicts: List[BulkUploadRevertConflict]  # Products changed since, left as they are
+
+
+class BulkUploadChange(BaseModel):
+    row_number: int
+    product_id: str
+    action: str  # "create" or "update"
+    changes: Dict[str, Dict[str, Any]]
+
+
+class BulkUploadPreview(BaseModel):
+    upload: BulkUploadRead
+    changes: List[BulkUploadChange]
+    skip: int
+    limit: int
+
+
+class BulkUploadAuditEntry(BaseModel):
+    id: int
+    product_id: int
+    product_unique_id: Optional[str] = None
+    product_name: str
+    action_type: str  # "bulk_create" or "bulk_update"
+    changes: Dict[str, Dict[str, Any]]
+    changed_by: int
+    created_at: datetime
+
+    @field_validator('changes', mode='before')
+    @classmethod
+    def parse_changes(cls, v):
+        return json.loads(v) if isinstance(v, str) else v
+
+    class Config:
+        from_attributes = True
+
+
+class BulkUploadChanges(BaseModel):
+    upload: BulkUploadRead
+    counts: Optional[Dict[str, int]] = None  # Audit rows per action type, on the first page only
+    changes: List[BulkUploadAuditEntry]
+    next_cursor: Optional[int] = None  # Pass as ``after`` for the next page; None on the last one
+    limit: int
+
+
 # CSV Row validation for bulk upload
 class CSVProductRow(BaseModel):
     product_name: str
@@ -0,0 +1,216 @@
+"""
+Drop Folder Watcher
+Imports the files sites drop into a shared directory, with one subdirectory per company
+
+    {BULK_UPLOAD_WATCH_DIR}/{company_id}/              new files
+    {BULK_UPLOAD_WATCH_DIR}/{company_id}/processing/   files being imported, as {upload_id}-{name}
+    {BULK_UPLOAD_WATCH_DIR}/{company_id}/done/         imported files, completed or partial
+    {BULK_UPLOAD_WATCH_DIR}/{company_id}/failed/       files that could not be imported
+"""
+import os
+import re
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.controllers.new_products import create_bulk_upload, find_completed_bulk_upload, set_bulk_upload_status
+from app.database import SessionLocal
+from app.ingest import check_upload_file
+from app.jobs import file_sha256, is_orphaned, submit_bulk_upload
+from app.models import BulkUpload, Company, Manager
+
+CLAIMED_FILE = re.compile(r"^(\d+)-(.+)$")
+
+# Suffixes of files still being written by an exporter
+PARTIAL_SUFFIXES = (".part", ".tmp", ".partial", ".crdownload")
+
+
+class DropFolderWatcher:
+    """
+    Polls the drop folder and imports new files through the bulk upload pipeline.
+
+    A file is picked up once its size and modification time did not change
+    between two scans, so files still being written are left alone. It is
+    claimed by renaming it into ``processing/`` under the id of a new bulk
+    upload: if another watcher renamed it first, the rename fails and the
+    upload is dropped. Imports are queued on the bulk upload worker pool, so
+    they are bounded by ``BULK_UPLOAD_WORKERS`` and run one per company, and
+    are recorded like uploads sent to the API, by the company's first manager.
+    Finished files are moved to ``done/`` or ``failed/``.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        duplicate_action: str = "update",
+        batch_size: Optional[int] = None,
+        session_factory: Callable[[], Session] = SessionLocal
+    ):
+        self.root = root
+        self.duplicate_action = duplicate_action
+        self.batch_size = batch_size
+        self.session_factory = session_factory
+        self._seen: Dict[str, Tuple[int, int]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _company_dirs(self, db: Session) -> List[Tuple[str, str]]:
+        """(company_id, directory) of the drop folder's company subdirectories"""
+        if not os.path.isdir(self.root):
+            return []
+        company_ids = {company_id for company_id, in db.query(Company.id)}
+        return [
+            (entry.name, entry.path) for entry in os.scandir(self.root)
+            if entry.is_dir() and entry.name in company_ids
+        ]
+
+    def _move(self, path: str, company_dir: str, folder: str, name: Optional[str] = None) -> str:
+        """Move a file into one of a company's work folders"""
+        target_dir = os.path.join(company_dir, folder)
+        os.makedirs(target_dir, exist_ok=True)
+        target = os.path.join(target_dir, name or os.path.basename(path))
+        os.replace(path, target)
+        return target
+
+    def _submit(self, upload_id: int, claimed: str, company_dir: str) -> Future:
+        """Queue the import of a claimed file; the future is done once the file left ``processing/``"""
+        finished: Future = Future()
+
+        def finish(imported: Future) -> None:
+            try:
+                db = self.session_factory()
+                try:
+                    failed = imported.exception() is not None or db.get(BulkUpload, upload_id).upload_status == "failed"
+                finally:
+                    db.close()
+                finished.set_result(self._move(claimed, company_dir, "failed" if failed else "done"))
+            except Exception as e:
+                finished.set_exception(e)
+
+        submit_bulk_upload(upload_id, self.batch_size, self.session_factory, source_path=claimed).add_done_callback(finish)
+        return finished
+
+    def _claim(self, db: Session, company_id: str, company_dir: str, name: str) -> Optional[Future]:
+        """Claim a new file and queue its import; None if it is not imported"""
+        manager = db.query(Manager.id).filter(Manager.company_id == company_id).order_by(Manager.id).first()
+        if manager is None:
+            return None
+
+        bulk_upload = create_bulk_upload(db, name, manager.id, company_id, self.duplicate_action)
+        os.makedirs(os.path.join(company_dir, "processing"), exist_ok=True)
+        claimed = os.path.join(company_dir, "processing", f"{bulk_upload.id}-{name}")
+        try:
+            os.rename(os.path.join(company_dir, name), claimed)
+        except FileNotFoundError:
+            # Another watcher claimed it first
+            db.delete(bulk_upload)
+            db.commit()
+            return None
+
+        try:
+            check_upload_file(claimed, name, settings.bulk_upload_max_size_mb * 1024 * 1024)
+        except ValueError as e:
+            set_bulk_upload_status(db, bulk_upload, "failed", str(e))
+            self._move(claimed, company_dir, "failed")
+            return None
+
+        content_hash = file_sha256(claimed)
+        previous_upload = find_completed_bulk_upload(db, company_id, content_hash, self.duplicate_action)
+        if previous_upload is not None:
+            # Same file as an earlier feed: nothing to import
+            db.delete(bulk_upload)
+            db.commit()
+            self._move(claimed, company_dir, "done", f"{previous_upload.id}-{name}")
+            return None
+
+        bulk_upload.content_hash = content_hash
+        db.commit()
+        return self._submit(bulk_upload.id, claimed, company_dir)
+
+    def resume_claimed(self) -> List[Future]:
+        """
+        Deal with the files a previous run left in ``processing/``.
+
+        Imports that did not finish, or failed before their file was moved, are
+        queued again and carry on from their checkpoint, unless another process
+        is still running them (see ``is_orphaned``); files whose import
+        finished are moved to ``done/``, and files without an upload go back to
+        the drop folder.
+        """
+        futures = []
+        db = self.session_factory()
+        try:
+            for company_id, company_dir in self._company_dirs(db):
+                processing = os.path.join(company_dir, "processing")
+                if not os.path.isdir(processing):
+                    continue
+                for entry in os.scandir(processing):
+                    match = CLAIMED_FILE.match(entry.name)
+                    bulk_upload = db.get(BulkUpload, int(match.group(1))) if match else None
+                    if bulk_upload is None or bulk_upload.company_id != company_id:
+                        os.replace(entry.path, os.path.join(company_dir, match.group(2) if match else entry.name))
+                    elif bulk_upload.upload_status == "processing" and not is_orphaned(bulk_upload):
+                        continue
+                    elif bulk_upload.upload_status in ("processing", "interrupted", "failed"):
+                        set_bulk_upload_status(db, bulk_upload, "processing")
+                        futures.append(self._submit(bulk_upload.id, entry.path, company_dir))
+                    else:
+                        self._move(entry.path, company_dir, "done")
+        finally:
+            db.close()
+        return futures
+
+    def scan(self) -> List[Future]:
+        """Claim and queue the files that did not change since the last scan"""
+        futures = []
+        seen = {}
+        db = self.session_factory()
+        try:
+            for company_id, company_dir in self._company_dirs(db):
+                for entry in os.scandir(company_dir):
+                    if not entry.is_file() or entry.name.startswith(".") or entry.name.endswith(PARTIAL_SUFFIXES):
+                        continue
+                    stat = entry.stat()
+                    seen[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                    if self._seen.get(entry.path) != seen[entry.path]:
+                        continue
+                    future = self._claim(db, company_id, company_dir, entry.name)
+                    if future is not None:
+                        futures.append(future)
+        finally:
+            db.close()
+        self._seen = seen
+        return futures
+
+    def run(self, interval: float) -> None:
+        """Scan every ``interval`` seconds until ``stop`` is called"""
+        self.resume_claimed()
+        while not self._stop.is_set():
+            try:
+                self.scan()
+            except Exception as e:
+                print(f"Warning: drop folder scan of {self.root} failed: {e}")
+            self._stop.wait(interval)
+
+    def start(self, interval: float) -> None:
+        """Run the watcher on a background thread"""
+        self._thread = threading.Thread(target=self.run, args=(interval,), name="drop-folder-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop scanning; imports already queued carry on"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def start_drop_folder_watcher() -> Optional[DropFolderWatcher]:
+    """Start watching ``BULK_UPLOAD_WATCH_DIR`` in the background, if it is set"""
+    if not settings.bulk_upload_watch_dir:
+        return None
+    watcher = DropFolderWatcher(settings.bulk_upload_watch_dir, settings.bulk_upload_watch_duplicate_action)
+    watcher.start(settings.bulk_upload_watch_interval)
+    return watcher
@@ -0,0 +1,1086 @@
+#!/usr/bin/env python3
+"""
+Tests for the batched bulk upload engine, run against an in-memory SQLite database
+"""
+import asyncio
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from datetime import date, datetime, timedelta, timezone
+from io import BytesIO
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException, Request, UploadFile
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base
+from app.models import Company, Manager, NewProduct, NewAuditTrail, BulkUpload
+from app.config import settings
+from app.validators import NewProductCreate, NewProductFilters, NewProductUpdate
+from app.controllers import new_products
+from app.controllers.new_products import process_csv_bulk_upload, create_bulk_upload, find_completed_bulk_upload
+from app.controllers.bulk_preview import preview_bulk_upload
+from app.controllers.bulk_revert import revert_bulk_upload
+from app.controllers.audit import get_bulk_upload_audit_page, count_bulk_upload_audit_actions
+from app.controllers import product_search
+from app.controllers.product_search import search_new_products
+from app import cli, ingest
+from app.autocomplete import product_names
+from app.routes.new_products import upload_bulk_upload_chunk
+from app.watcher import DropFolderWatcher
+from app.ingest import (
+    read_csv_chunks, validate_frame, validate_chunks, iter_product_rows, check_upload_file, open_upload
+)
+from app.jobs import (
+    save_upload_file, attach_upload_file, submit_bulk_upload, upload_path, chunked_upload_path, open_reject_report, reject_report_path,
+    BulkUploadScheduler, BulkUploadSweeper, recover_interrupted_bulk_uploads
+)
+
+# Chunk readers left open past their file show up as unraisable exceptions
+pytestmark = pytest.mark.filterwarnings("error::pytest.PytestUnraisableExceptionWarning")
+
+HEADER = "ProductName,ProductType,Location,BatchNumber,Expiry,Quantity,Price,PaymentStatus,ReceiverContact\n"
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = factory()
+    session.add(Company(id="COMP1", name="Test Co", size=10))
+    session.add(Manager(id=1, email="m@example.com", password="x", name="Manager", company_id="COMP1"))
+    session.commit()
+    session.close()
+    return factory
+
+
+@pytest.fixture
+def pg_session_factory():
+    """Sessions on the PostgreSQL scratch database of TEST_DATABASE_URL, whose tables are recreated"""
+    database_url = os.getenv("TEST_DATABASE_URL")
+    if not database_url:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    engine = create_engine(database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    session = factory()
+    session.add(Company(id="COMP1", name="Test Co", size=10))
+    session.add(Manager(id=1, email="m@example.com", password="x", name="Manager", company_id="COMP1"))
+    session.commit()
+    session.close()
+    yield factory
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def db(session_factory):
+    session = session_factory()
+    yield session
+    session.close()
+
+
+def validate(csv_text, company_id="COMP1"):
+    chunk = next(read_csv_chunks(BytesIO(csv_text.encode("utf-8")), 1000))
+    return validate_frame(chunk, company_id)
+
+
+def upload(db, csv_text, duplicate_action="skip", **kwargs):
+    file = UploadFile(file=BytesIO(csv_text.encode("utf-8")), filename="products.csv")
+    return process_csv_bulk_upload(
+        db, file, manager_id=1, company_id="COMP1", duplicate_action=duplicate_action, **kwargs
+    )
+
+
+def count_statements(db):
+    statements = []
+    event.listen(db.get_bind(), "before_cursor_execute",
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    return statements
+
+
+def test_counters_and_errors(db):
+    csv_text = HEADER + (
+        "Widget,Tools,A,B1,2025-12-31,10,9.99,Paid,+1 234-567\n"
+        "Gadget,Tools,A,B2,not-a-date,5,1.00,Paid,\n"
+        "Gizmo,Tools,A,B3,,5,1.00,Owed,\n"
+        "Doohickey,Tools,A,B4,,3,,,\n"
+    )
+    result = upload(db, csv_text, batch_size=2)
+
+    assert result.total_records == 4
+    assert result.successful_records == 2
+    assert result.failed_records == 2
+    assert result.upload_status == "partial"
+    errors = json.loads(result.error_details)
+    assert errors[0] == "Row 3: Unable to parse date: not-a-date"
+    assert errors[1].startswith("Row 4: ")
+
+    widget = db.query(NewProduct).filter(NewProduct.product_id == "WIDGET_B1_COMP1").one()
+    assert widget.receiver_contact == "1234567"
+    assert str(widget.price) == "9.99"
+
+    audits = db.query(NewAuditTrail).filter(NewAuditTrail.bulk_upload_id == result.id).all()
+    assert sorted(a.action_type for a in audits) == ["bulk_create", "bulk_create"]
+    changes = json.loads(audits[0].changes)
+    assert changes["created_at"]["new"] is not None
+
+
+@pytest.fixture(params=["upsert", "insert_update"])
+def write_path(request, monkeypatch):
+    if request.param == "insert_update":
+        monkeypatch.setattr(new_products, "UPSERT_INSERTS", {})
+    return request.param
+
+
+def test_skip_and_update_duplicates(db, write_path):
+    upload(db, HEADER + "Widget,Tools,A,B1,,10,9.99,Paid,\nGadget,Tools,A,B2,,1,,,\n")
+
+    skipped = upload(db, HEADER + "Widget,Tools,B,B1,,20,,,\nNew,Tools,A,B9,,1,,,\n")
+    assert (skipped.successful_records, skipped.skipped_records, skipped.updated_records) == (1, 1, 0)
+
+    updated = upload(db, HEADER + "Widget,Tools,B,B1,,20,,,\nGadget,Tools,A,B2,,1,,,\n", "update")
+    assert (updated.successful_records, updated.skipped_records, updated.updated_records) == (0, 0, 2)
+    assert updated.upload_status == "completed"
+
+    widget = db.query(NewProduct).filter(NewProduct.product_id == "WIDGET_B1_COMP1").one()
+    db.refresh(widget)
+    assert (widget.location, widget.quantity, str(widget.price)) == ("B", 20, "9.99")
+
+    # Gadget was unchanged, so only Widget gets an audit entry
+    audits = db.query(NewAuditTrail).filter(NewAuditTrail.bulk_upload_id == updated.id).all()
+    assert [a.product_unique_id for a in audits] == ["WIDGET_B1_COMP1"]
+    changes = json.loads(audits[0].changes)
+    assert changes["quantity"] == {"old": 10, "new": 20}
+    assert changes["location"] == {"old": "A", "new": "B"}
+
+
+def test_duplicate_rows_within_one_file(db, write_path):
+    csv_text = HEADER + "Widget,Tools,A,B1,,1,,,\nWidget,Tools,A,B1,,2,,,\n"
+
+    result = upload(db, csv_text, "update")
+    assert (result.successful_records, result.updated_records) == (1, 1)
+    assert db.query(NewProduct).one().quantity == 2
+
+
+def test_batches_share_statements(db):
+    rows = "".join(f"Item {i},Tools,A,B{i},,1,,,\n" for i in range(50))
+    statements = count_statements(db)
+
+    result = upload(db, HEADER + rows, batch_size=25)
+
+    assert result.successful_records == 50
+    assert db.query(NewAuditTrail).count() == 50
+    inserts = [s for s in statements if s.startswith("INSERT INTO new_products")]
+    assert len(inserts) == 2
+
+
+def test_background_job_reports_progress(db, session_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_upload_dir", str(tmp_path))
+    rows = "".join(f"Item {i},Tools,A,B{i},,1,,,\n" for i in range(30))
+
+    bulk_upload = create_bulk_upload(db, "products.csv", 1, "COMP1", "skip")
+    assert bulk_upload.upload_status == "processing"
+    attach_upload_file(save_upload_file(BytesIO((HEADER + rows).encode("utf-8"))), bulk_upload.id)
+
+    submit_bulk_upload(bulk_upload.id, batch_size=10, session_factory=session_factory).result(timeout=30)
+
+    db.refresh(bulk_upload)
+    assert bulk_upload.upload_status == "completed"
+    assert (bulk_upload.total_records, bulk_upload.processed_rows) == (30, 30)
+    assert not os.path.exists(upload_path(bulk_upload.id))
+
+
+def test_file_of_an_import_that_rejected_every_row_is_removed(db, session_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_upload_dir", str(tmp_path))
+    rows = "".join(f"Item {i},Tools,A,B{i},,many,,,\n" for i in range(5))
+
+    bulk_upload = create_bulk_upload(db, "products.csv", 1, "COMP1", "skip")
+    attach_upload_file(save_upload_file(BytesIO((HEADER + rows).encode("utf-8"))), bulk_upload.id)
+
+    submit_bulk_upload(bulk_upload.id, session_factory=session_factory).result(timeout=30)
+
+    db.refresh(bulk_upload)
+    assert (bulk_upload.upload_status, bulk_upload.failed_records) == ("failed", 5)
+    assert not os.path.exists(upload_path(bulk_upload.id))
+
+
+def test_repeated_files_are_found_by_content_hash(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_upload_dir", str(tmp_path))
+    content = (HEADER + "Widget,Tools,A,B1,,10,,,\n").encode("utf-8")
+
+    digest = hashlib.sha256()
+    save_upload_file(BytesIO(content), digest=digest)
+    content_hash = digest.hexdigest()
+    assert content_hash == hashlib.sha256(content).hexdigest()
+
+    bulk_upload = create_bulk_upload(db, "products.csv", 1, "COMP1", "skip", content_hash=content_hash)
+    assert find_completed_bulk_upload(db, "COMP1", content_hash, "skip") is None
+
+    new_products.run_bulk_upload(db, bulk_upload, BytesIO(content))
+    assert find_completed_bulk_upload(db, "COMP1", content_hash, "skip").id == bulk_upload.id
+    assert find_completed_bulk_upload(db, "COMP1", content_hash, "update") is None
+    assert find_completed_bulk_upload(db, "COMP2", content_hash, "skip") is None
+
+
+def test_oversized_upload_leaves_nothing_behind(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_upload_dir", str(tmp_path))
+
+    with pytest.raises(ValueError):
+        save_upload_file(BytesIO(b"x" * (3 * 1024 * 1024)), max_bytes=2 * 1024 * 1024)
+    assert os.listdir(tmp_path) == []
+
+
+def test_received_bytes_never_move_back(db, session_factory):
+    bulk_upload = create_bulk_upload(db, "products.csv", 1, "COMP1", "skip", file_size=200)
+    stale = session_factory()
+    stale_upload = stale.get(BulkUpload, bulk_upload.id)
+
+    new_products.record_received_bytes(db, bulk_upload, 150)
+    # Read before the other chunk was recorded, so it still holds 0
+    assert stale_upload.received_bytes == 0
+    stale_upload = new_products.record_received_bytes(stale, stale_upload, 100)
+    stale.close()
+
+    assert stale_upload.received_bytes == 150
+    db.refresh(bulk_upload)
+    assert bulk_upload.received_bytes == 150
+
+
+def send_chunk(db, bulk_upload, content_range, body):
+    """Call the chunk endpoint with ``body`` as the request body"""
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+
+    async def receive():
+        return messages.pop(0)
+
+    request = Request({"type": "http", "method": "PUT", "headers": []}, receive)
+    user = {"user": SimpleNamespace(company_id=bulk_upload.company_id)}
+    return asyncio.run(upload_bulk_upload_chunk(bulk_upload.id, request, content_range, db, user))
+
+
+def test_chunk_of_the_wrong_length_leaves_the_file_alone(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_upload_dir", str(tmp_path))
+    bulk_upload = create_bulk_upload(db, "products.csv", 1, "COMP1", "skip", file_size=10)
+
+    assert send_chunk(db, bulk_upload, "bytes 0-5/10", b"abcdef").received_bytes == 6
+    # A retry of the same range, cut off or padded, is rejected before any write
+    for body in (b"xy", b"xyzxyzxyz"):
+        with pytest.raises(HTTPException) as error:
+            send_chunk(db, bulk_upload, "bytes 0-5/10", body)
+        assert error.value.status_code == 400
+
+    assert send_chunk(db, bulk_upload, "bytes 6-9/10", b"ghij").received_bytes == 10
+    with open(chunked_upload_path(bulk_upload.id), "rb") as stored:
+        assert stored.read() == b"abcdefghij"
+
+
+def test_validate_frame_normalizes_columns():
+    csv_text = (
+        "product_name,product_type,serial_number,batch_number,expiry,quantity,price,receiver_contact,remark\n"
+        "Box Set,Books, 12345.0 ,b 7,31/12/2025,10.9,1_000,(555) 123-4567,\n"
+        "Lamp,Home,,B8,2025-12-31 08:30:00,2,,555-CALL,note\n"
+    )
+    valid, rejects = validate(csv_text)
+    assert rejects.empty
+
+    rows = list(iter_product_rows(valid, "COMP1"))
+    (row_number, product_id, box), (_, _, lamp) = rows
+    assert (row_number, product_id) == (2, "BOX_SET_B_7_COMP1")
+    assert box["serial_number"] == "12345"
+    assert box["quantity"] == 10
+    assert str(box["price"]) == "1000"
+    assert box["expiry"].isoformat() == "2025-12-31T00:00:00"
+    assert box["receiver_contact"] == "5551234567"
+    assert box["remark"] is None
+
+    assert lamp["expiry"].isoformat() == "2025-12-31T08:30:00"
+    assert lamp["receiver_contact"] == "555-CALL"
+    assert "price" not in lamp
+
+
+def test_validate_frame_rejects_with_first_error():
+    csv_text = (
+        "product_name,product_type,batch_number,expiry,quantity,price,payment_status\n"
+        "A,T,B1,,ten,,Paid\n"
+        "B,T,B2,soon,1,,Maybe\n"
+        "C,T,B3,soon,1,abc,\n"
+        "D,T,B4,,1,abc,\n"
+        "E,T,,,1,,\n"
+        "F,T,B6,,1,,\n"
+        "G,T,B7,,99999999999999999999,,\n"
+    )
+    valid, rejects = validate(csv_text)
+
+    assert list(valid["row_number"]) == [7]
+    assert list(zip(rejects["row_number"], rejects["field"], rejects["message"])) == [
+        (2, "quantity", "quantity must be a valid integer"),
+        (3, "payment_status", "payment_status must be one of: Paid, Pending, Unpaid"),
+        (4, "expiry", "Unable to parse date: soon"),
+        (5, "price", "Unable to parse decimal: abc"),
+        (6, "batch_number", "batch_number is required to generate product_id"),
+        (8, "quantity", "quantity must be between -2147483648 and 2147483647"),
+    ]
+    assert list(rejects["product_name"]) == ["A", "B", "C", "D", "E", "G"]
+
+
+def test_upsert_writes_one_statement_per_batch(db):
+    upload(db, HEADER + "".join(f"Item {i},Tools,A,B{i},,1,,,\n" for i in range(20)))
+    statements = count_statements(db)
+
+    rows = "".join(f"Item {i},Tools,A,B{i},,{2 if i < 5 else 1},,,\n" for i in range(20))
+    result = upload(db, HEADER + rows, "update", batch_size=20)
+
+    assert (result.successful_records, result.updated_records) == (0, 20)
+    writes = [s for s in statements if s.startswith("INSERT INTO new_products")]
+    assert len(writes) == 1 and "ON CONFLICT (product_id) DO UPDATE" in writes[0]
+    assert db.query(NewAuditTrail).filter(NewAuditTrail.bulk_upload_id == result.id).count() == 5
+
+
+def test_copy_mode_falls_back_to_batches_off_postgresql(db):
+    rows = "".join(f"Item {i},Tools,A,B{i},,1,,,\n" for i in range(30))
+    statements = count_statements(db)
+
+    result = upload(db, HEADER + rows + "Item 0,Tools,A,B0,,5,,,\n", "update", import_mode="copy")
+
+    assert result.import_mode == "copy"
+    assert (result.successful_records, result.updated_records) == (30, 1)
+    assert not any("COPY" in s or "new_products_staging" in s for s in statements)
+
+
+
+@pytest.mark.parametrize("duplicate_action", ["skip", "update"])
+def test_copy_mode_matches_batch_mode_on_postgresql(pg_session_factory, duplicate_action, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_upload_copy_batch_size", 3)
+    existing = HEADER + "Widget,Tools,A,B1,2026-01-01,1,5.00,,\nGadget,Tools,A,B2,,1,,,\n"
+    rows = HEADER + (
+        "Widget,Tools,B,B1,,2,,,\n"
+        "Bolt,Parts,C,B3,2026-02-01,1,1.50,,\n"
+        "Bolt,Parts,,B3,,3,,,\n"
+        "Gadget,Tools,D,B2,2026-03-01,4,2.00,,\n"
+        "Nut,Parts,E,B4,,1,,,\n"
+        "Nut,Parts,F,B4,2026-04-01,2,,,\n"
+        "Washer,Parts,G,B5,not a date,1,,,\n"
+    )
+
+    def import_twice(import_mode):
+        db = pg_session_factory()
+        try:
+            for model in (NewAuditTrail, BulkUpload, NewProduct):
+                db.query(model).delete()
+            db.commit()
+            upload(db, existing, duplicate_action, import_mode=import_mode)
+            result = upload(db, rows, duplicate_action, import_mode=import_mode)
+            products = {
+                product.product_id: {field: getattr(product, field) for field in ingest.PRODUCT_FIELDS}
+                for product in db.query(NewProduct)
+            }
+            counters = (result.successful_records, result.updated_records, result.skipped_records, result.failed_records)
+            return counters, products
+        finally:
+            db.close()
+
+    batch = import_twice("batch")
+    assert import_twice("copy") == batch
+    assert len(batch[1]) == 4
+
+
+def test_validate_chunks_on_process_pool_keeps_file_order():
+    rows = "".join(f"Item {i},Tools,A,{'' if i % 7 == 0 else f'B{i}'},2025-01-0{i % 9 + 1},{i},1.5,,\n" for i in range(100))
+    csv_bytes = (HEADER + rows).encode("utf-8")
+
+    def run(**kwargs):
+        return list(validate_chunks(read_csv_chunks(BytesIO(csv_bytes), 10), "COMP1", **kwargs))
+
+    serial = run()
+    parallel = run(workers=2, min_rows=20)
+
+    assert [rows for rows, _, _ in parallel] == [10] * 10
+    for (_, valid, rejects), (_, expected_valid, expected_rejects) in zip(parallel, serial):
+        assert valid.equals(expected_valid)
+        assert rejects.equals(expected_rejects)
+
+
+def test_small_files_are_validated_in_process(db, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_upload_validation_workers", 4)
+    monkeypatch.setattr(settings, "bulk_upload_parallel_min_rows", 100)
+    monkeypatch.setattr(ingest, "_get_validation_pool", lambda workers: pytest.fail("pool started"))
+
+    result = upload(db, HEADER + "".join(f"Item {i},Tools,A,B{i},,1,,,\n" for i in range(100)), batch_size=10)
+    assert result.successful_records == 100
+
+
+def test_audit_rows_of_a_rolled_back_batch_are_dropped(db, monkeypatch):
+    apply_bulk_batch = new_products._apply_bulk_batch
+
+    def fail_whole_batches(db, batch, duplicate_action, audit):
+        result = apply_bulk_batch(db, batch, duplicate_action, audit)
+        if len(batch) > 1:
+            raise RuntimeError("batch failed")
+        return result
+
+    monkeypatch.setattr(new_products, "_apply_bulk_batch", fail_whole_batches)
+    result = upload(db, HEADER + "".join(f"Item {i},Tools,A,B{i},,1,,,\n" for i in range(3)))
+
+    assert result.successful_records == 3
+    audits = db.query(NewAuditTrail).filter(NewAuditTrail.bulk_upload_id == result.id).all()
+    assert sorted(a.product_unique_id for a in audits) == ["ITEM_0_B0_COMP1", "ITEM_1_B1_COMP1", "ITEM_2_B2_COMP1"]
+
+
+def compressed(csv_text, file_format):
+    if file_format == "gzip":
+        return gzip.compress(csv_text.encode("utf-8"))
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("products.csv", csv_text)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("filename,file_format", [("products.csv.gz", "gzip"), ("products.zip", "zip")])
+def test_compressed_uploads_are_decoded_on_the_fly(db, filename, file_format):
+    csv_text = HEADER + "".join(f"Item {i},Tools,A,B{i},,1,,,\n" for i in range(20))
+    file = UploadFile(file=BytesIO(compressed(csv_text, file_format)), filename=filename)
+
+    result = process_csv_bulk_upload(db, file, manager_id=1, company_id="COMP1", duplicate_action="skip")
+
+    assert (result.upload_status, result.successful_records) == ("completed", 20)
+
+
+def test_compressed_uploads_are_limited_by_decompressed_size(tmp_path):
+    csv_text = HEADER + "Item,Tools,A,B1,,1,,,\n" * 50000
+    limit = len(csv_text) // 2
+
+    for filename, file_format in [("bomb.csv.gz", "gzip"), ("bomb.zip", "zip")]:
+        path = tmp_path / filename
+        path.write_bytes(compressed(csv_text, file_format))
+        with pytest.raises(ValueError, match="Decompressed file size exceeds"):
+            check_upload_file(str(path), filename, limit)
+        # Declared sizes can lie, so reading enforces the limit too
+        with open(path, "rb") as source, pytest.raises(ValueError, match="Decompressed file size exceeds"):
+            with open_upload(source, filename, limit) as stream:
+                for _ in read_csv_chunks(stream, 1000):
+                    pass
+
+
+def test_zip_uploads_must_hold_one_file(tmp_path):
+    path = tmp_path / "two.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("a.csv", HEADER)
+        archive.writestr("b.csv", HEADER)
+
+    with pytest.raises(ValueError, match="exactly one CSV file"):
+        check_upload_file(str(path), "two.zip", 1024 * 1024)
+
+
+TYPED_ROWS = [
+    {"ProductName": "Widget", "ProductType": "Tools", "SerialNumber": 12345.0, "BatchNumber": 7,
+     "Expiry": datetime(2025, 12, 31), "Quantity": 10, "Price": 9.99, "ReceiverContact": 5551234567.0},
+    {"ProductName": "Gadget", "ProductType": "Tools", "SerialNumber": None, "BatchNumber": "B2",
+     "Expiry": None, "Quantity": "ten", "Price": None, "ReceiverContact": None},
+]
+
+
+def typed_upload(rows, file_format):
+    buffer = BytesIO()
+    if file_format == "parquet":
+        pyarrow = pytest.importorskip("pyarrow")
+        import pyarrow.parquet as pq
+        columns = {key: [row[key] for row in rows] for key in rows[0]}
+        columns["BatchNumber"] = [str(value) for value in columns["BatchNumber"]]
+        columns["Quantity"] = [10, None]  # Integer column with a null
+        pq.write_table(pyarrow.table(columns), buffer)
+    elif file_format == "xlsx":
+        openpyxl = pytest.importorskip("openpyxl")
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(list(rows[0]))
+        sheet.append([None] * len(rows[0]))
+        for row in rows:
+            sheet.append(list(row.values()))
+        workbook.save(buffer)
+    else:
+        lines = [json.dumps(row, default=lambda value: value.strftime("%Y-%m-%d")) for row in rows]
+        buffer.write(("\n".join(lines) + "\n").encode("utf-8"))
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.parametrize("file_format,failed_row", [("parquet", 3), ("xlsx", 4), ("ndjson", 2)])
+def test_typed_formats_keep_their_values(db, file_format, failed_row):
+    # Extensions are optional: the format is sniffed from the content
+    file = UploadFile(file=typed_upload(TYPED_ROWS, file_format), filename="export")
+
+    result = process_csv_bulk_upload(db, file, manager_id=1, company_id="COMP1", duplicate_action="skip")
+
+    widget = db.query(NewProduct).filter(NewProduct.product_id == "WIDGET_7_COMP1").one()
+    assert (widget.serial_number, widget.receiver_contact, widget.quantity) == ("12345", "5551234567", 10)
+    assert (str(widget.price), widget.expiry.date()) == ("9.99", date(2025, 12, 31))
+    # Rows are numbered like the source: data rows after a header, sheet rows, lines
+    assert (result.successful_records, result.failed_records) == (1, 1)
+    assert json.loads(result.error_details) == [f"Row {failed_row}: quantity must be a valid integer"]
+
+
+def test_unknown_files_are_rejected(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_text("just some text")
+
+    with pytest.raises(ValueError, match="Unsupported file type"):
+        check_upload_file(str(path), "notes.txt", 1024 * 1024)
+
+
+class Crash(BaseException):
+    """Stands in for the process dying: not caught by the importer"""
+
+
+def test_crashed_import_resumes_from_its_checkpoint(db, monkeypatch):
+    rows = "".join(
+        f"Item {i},Tools,A,B{i},,{'x' if i % 7 == 3 else 1},,,\n" for i in range(40)
+    )
+    bulk_upload = create_bulk_upload(db, "products.csv", 1, "COMP1", "skip")
+    apply_bulk_batch = new_products._apply_bulk_batch
+    calls = []
+
+    def crash_on_third_batch(db, batch, duplicate_action, audit):
+        calls.append(batch)
+        if len(calls) == 3:
+            raise Crash()
+        return apply_bulk_batch(db, batch, duplicate_action, audit)
+
+    monkeypatch.setattr(new_products, "_apply_bulk_batch", crash_on_third_batch)
+    with pytest.raises(Crash):
+        new_products.run_bulk_upload(db, bulk_upload, BytesIO((HEADER + rows).encode("utf-8")), batch_size=10)
+    db.rollback()
+
+    # Two batches of valid rows, and the rejects among them, are committed
+    assert bulk_upload.upload_status == "processing"
+    assert bulk_upload.checkpoint_row == calls[1][-1][0]
+    assert (bulk_upload.successful_records, bulk_upload.failed_records) == (17, 3)
+
+    monkeypatch.setattr(new_products, "_apply_bulk_batch", apply_bulk_batch)
+    new_products.run_bulk_upload(db, bulk_upload, BytesIO((HEADER + rows).encode("utf-8")), batch_size=10)
+
+    assert bulk_upload.upload_status == "partial"
+    assert (bulk_upload.total_records, bulk_upload.processed_rows) == (40, 40)
+    assert (bulk_upload.successful_records, bulk_upload.failed_records) == (34, 6)
+    assert len(json.loads(bulk_upload.error_details)) == 6
+    assert db.query(NewProduct).count() == 34
+    assert db.query(NewAuditTrail).filter(NewAuditTrail.bulk_upload_id == bulk_upload.id).count() == 34
+
+
+def test_restart_marks_orphaned_imports_interrupted(db, session_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_upload_dir", str(tmp_path))
+    rows = "".join(f"Item {i},Tools,A,B{i},,1,,,\n" for i in range(30))
+    bulk_upload = create_bulk_upload(db, "products.csv", 1, "COMP1", "skip")
+    attach_upload_file(save_upload_file(BytesIO((HEADER + rows).encode("utf-8"))), bulk_upload.id)
+    without_file = create_bulk_upload(db, "products.csv", 1, "COMP1", "skip")
+    finished = upload(db, HEADER + "Widget,Tools,A,B1,,10,,,\n")
+    apply_bulk_batch = new_products._apply_bulk_batch
+    calls = []
+
+    def crash_on_second_batch(db, batch, duplicate_action, audit):
+        calls.append(batch)
+        if len(calls) == 2:
+            raise Crash()
+        return apply_bulk_batch(db, batch, duplicate_action, audit)
+
+    monkeypatch.setattr(new_products, "_apply_bulk_batch", crash_on_second_batch)
+    with pytest.raises(Crash):
+        with open(upload_path(bulk_upload.id), "rb") as source:
+            new_products.run_bulk_upload(db, bulk_upload, source, batch_size=10)
+    db.rollback()
+    monkeypatch.setattr(new_products, "_apply_bulk_batch", apply_bulk_batch)
+    # Counters that drifted from what was committed
+    db.query(BulkUpload).filter(BulkUpload.id == bulk_upload.id).update({"successful_records": 25})
+    db.commit()
+
+    assert recover_interrupted_bulk_uploads(session_factory) == [bulk_upload.id, without_file.id]
+
+    db.expire_all()
+    assert bulk_upload.upload_status == "interrupted"
+    assert (bulk_upload.successful_records, bulk_upload.checkpoint_row) == (10, 11)
+    assert "resume it" in json.loads(bulk_upload.error_details)[-1]
+    assert without_file.upload_status == "interrupted"
+    assert "upload the file again" in json.loads(without_file.error_details)[-1]
+    assert finished.upload_status == "completed"
+
+    submit_bulk_upload(bulk_upload.id, batch_size=10, session_factory=session_factory).result(timeout=30)
+    db.refresh(bulk_upload)
+    assert bulk_upload.upload_status == "completed"
+    assert bulk_upload.successful_records == db.query(NewProduct).count() - 1 == 30
+
+
+def test_restart_leaves_imports_of_live_processes_alone(db, session_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_upload_dir", str(tmp_path / "uploads"))
+    host = socket.gethostname()
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    stale = datetime.now(timezone.utc) - timedelta(seconds=settings.bulk_upload_heartbeat_timeout + 60)
+    owners = {
+        "cli": (f"{host}:{os.getppid()}", None),
+        "exited": (f"{host}:{exited.pid}", None),
+        "other host": ("elsewhere:1", datetime.now(timezone.utc)),
+        "silent host": ("elsewhere:2", stale),
+    }
+    uploads = {}
+    for name, (worker_id, heartbeat_at) in owners.items():
+        uploads[name] = create_bulk_upload(db, "feed.csv", 1, "COMP1", "skip")
+        uploads[name].worker_id, uploads[name].heartbeat_at = worker_id, heartbeat_at
+    db.commit()
+
+    assert recover_interrupted_bulk_uploads(session_factory) == [uploads["exited"].id, uploads["silent host"].id]
+
+    # A drop folder watcher does not queue again a file another process is importing
+    processing = tmp_path / "drop" / "COMP1" / "processing"
+    processing.mkdir(parents=True)
+    (processing / f"{uploads['cli'].id}-feed.csv").write_text(HEADER + "Widget,Tools,A,B1,,1,,,\n")
+    watcher = DropFolderWatcher(str(tmp_path / "drop"), session_factory=session_factory)
+    assert watcher.resume_claimed() == []
+    db.expire_all()
+    assert uploads["cli"].upload_status == "processing"
+    assert os.listdir(processing) == [f"{uploads['cli'].id}-feed.csv"]
+
+
+def test_sweeps_keep_queued_imports_alive_and_recover_replaced_hosts(db, session_factory):
+    stale = datetime.now(timezone.utc) - timedelta(seconds=settings.bulk_upload_heartbeat_timeout + 60)
+    # Left by the process a deploy replaced, which committed moments ago
+    replaced = create_bulk_upload(db, "feed.csv", 1, "COMP1", "skip")
+    replaced.worker_id, replaced.heartbeat_at = "replaced-host:1", datetime.now(timezone.utc)
+    # Queued here long enough ago that its heartbeat looks stale elsewhere
+    queued = create_bulk_upload(db, "feed.csv", 1, "COMP2", "skip")
+    queued.heartbeat_at = stale
+    db.commit()
+
+    release = threading.Event()
+    scheduler = BulkUploadScheduler(max_workers=1)
+    scheduler.submit(queued.id, "COMP2", 0, release.wait)
+    sweeper = BulkUploadSweeper(session_factory, scheduler)
+    try:
+        assert sweeper.sweep() == []
+
+        db.expire_all()
+        assert queued.upload_status == "processing"
+        assert queued.heartbeat_at.replace(tzinfo=timezone.utc) > stale + timedelta(seconds=60)
+
+        replaced.heartbeat_at = stale
+        db.commit()
+        assert sweeper.sweep() == [replaced.id]
+    finally:
+        release.set()
+    db.expire_all()
+    assert (replaced.upload_status, queued.upload_status) == ("interrupted", "processing")
+
+
+def test_revert_undoes_an_upload_except_later_edits(db, write_path):
+    upload(db, HEADER + "Widget,Tools,A,B1,2025-12-31,10,9.90,Paid,\nGadget,Tools,A,B2,,1,5,,\n")
+    csv_text = HEADER + (
+        "Widget,Tools,B,B1,2026-01-31,20,12.50,Paid,\n"
+        "Gadget,Tools,C,B2,,2,,,\n"
+        "New,Tools,A,B9,,1,,,\n"
+        "New,Tools,D,B9,,3,,,\n"
+    )
+    later = upload(db, csv_text, duplicate_action="update")
+    gadget = db.query(NewProduct).filter(NewProduct.product_id == "GADGET_B2_COMP1").one()
+    new_products.update_new_product(db, gadget.id, NewProductUpdate(quantity=7), manager_id=1)
+
+    reverted, deleted, restored, conflicts = revert_bulk_upload(db, db.get(BulkUpload, later.id), 1)
+
+    assert (reverted.upload_status, deleted, restored) == ("reverted", 1, 1)
+    assert conflicts == [{"product_id": gadget.id, "product_unique_id": "GADGET_B2_COMP1", "reason": "edited after the upload"}]
+    products = {product.product_id: product for product in db.query(NewProduct).populate_existing()}
+    assert set(products) == {"WIDGET_B1_COMP1", "GADGET_B2_COMP1"}
+    widget = products["WIDGET_B1_COMP1"]
+    assert (widget.location, widget.quantity, str(widget.price)) == ("A", 10, "9.90")
+    assert widget.expiry.date() == date(2025, 12, 31)
+    assert (products["GADGET_B2_COMP1"].location, products["GADGET_B2_COMP1"].quantity) == ("C", 7)
+    revert_audits = db.query(NewAuditTrail.action_type).filter(
+        NewAuditTrail.bulk_upload_id.is_(None), NewAuditTrail.changed_by == 1
+    ).all()
+    assert sorted(action for action, in revert_audits) == ["delete", "update", "update"]
+
+    with pytest.raises(HTTPException) as error:
+        revert_bulk_upload(db, reverted, 1)
+    assert error.value.status_code == 409
+
+
+def test_revert_spots_edits_that_leave_no_audit_row(db, write_path):
+    imported = upload(db, HEADER + "Widget,Tools,A,B1,,10,,,\nGadget,Tools,A,B2,,1,,,\n")
+    # The upload ran a minute ago; timestamps of SQLite have whole seconds
+    db.query(NewAuditTrail).filter(NewAuditTrail.bulk_upload_id == imported.id).update(
+        {"created_at": datetime.now(timezone.utc) - timedelta(minutes=1)}
+    )
+    db.commit()
+    widget = db.query(NewProduct).filter(NewProduct.product_id == "WIDGET_B1_COMP1").one()
+    # Admins edit without a manager id, so no audit row is written
+    new_products.update_new_product(db, widget.id, NewProductUpdate(quantity=7))
+
+    reverted, deleted, restored, conflicts = revert_bulk_upload(db, db.get(BulkUpload, imported.id), 1)
+
+    assert (deleted, restored) == (1, 0)
+    assert conflicts == [{"product_id": widget.id, "product_unique_id": "WIDGET_B1_COMP1", "reason": "edited after the upload"}]
+    assert [product.quantity for product in db.query(NewProduct).populate_existing()] == [7]
+
+
+def test_upload_changes_are_paged_by_audit_id(db):
+    upload(db, HEADER + "".join(f"Item {i},Tools,A,B{i},,1,,,\n" for i in range(5)))
+    rows = "".join(f"Item {i},Tools,B,B{i},,2,,,\n" for i in range(25))
+    result = upload(db, HEADER + rows, duplicate_action="update")
+
+    pages = []
+    after = None
+    while True:
+        page = get_bulk_upload_audit_page(db, result.id, after=after, limit=10)
+        pages.append(page)
+        if len(page) < 10:
+            break
+        after = page[-1].id
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    audits = [audit for page in pages for audit in page]
+    assert [audit.product_unique_id for audit in audits] == [f"ITEM_{i}_B{i}_COMP1" for i in range(25)]
+    assert json.loads(audits[0].changes)["location"] == {"old": "A", "new": "B"}
+    assert count_bulk_upload_audit_actions(db, result.id) == {"bulk_create": 20, "bulk_update": 5}
+
+
+
+def test_product_listing_is_paged_by_cursor(db):
+    db.add(Company(id="COMP2", name="Other Co", size=10))
+    db.commit()
+    upload(db, HEADER + "".join(f"Item {i},Tools,A,B{i},,1,,,\n" for i in range(25)))
+    db.add(NewProduct(product_name="Other", product_type="Tools", quantity=1, product_id="OTHER", company_id="COMP2"))
+    db.commit()
+
+    pages = []
+    cursor = ""
+    while cursor is not None:
+        products, cursor = new_products.get_new_products_page(db, company_id="COMP1", cursor=cursor, limit=10)
+        pages.append(products)
+
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [product.product_id for page in pages for product in page] == [f"ITEM_{i}_B{i}_COMP1" for i in range(25)]
+    with pytest.raises(HTTPException) as error:
+        new_products.get_new_products_page(db, cursor="not a cursor")
+    assert error.value.status_code == 400
+
+
+
+def test_product_listing_filters_sorts_and_counts_facets(db):
+    rows = "".join(
+        f"Item {i},{'Tools' if i % 2 else 'Parts'},{'A' if i % 3 else ''},B{i},{f'2026-0{i % 9 + 1}-15' if i % 4 else ''},1,,,\n"
+        for i in range(20)
+    )
+    upload(db, HEADER + rows)
+    filters = NewProductFilters(product_type=["Tools"], expiry_from=date(2026, 2, 1), expiry_to=date(2026, 6, 15))
+
+    pages = []
+    cursor = ""
+    while cursor is not None:
+        products, cursor = new_products.get_new_products_page(db, "COMP1", cursor, limit=2, filters=filters, sort="-expiry")
+        pages.append(products)
+
+    listed = [product for page in pages for product in page]
+    assert [(product.expiry.month, product.batch_number) for product in listed] == [
+        (6, "B5"), (5, "B13"), (4, "B3"), (3, "B11"), (2, "B19"), (2, "B1")
+    ]
+    by_location = new_products.get_new_products(db, "COMP1", sort="location")
+    assert [product.location for product in by_location] == ["A"] * 13 + [None] * 7
+
+    facets = new_products.count_new_product_facets(db, ["product_type", "location"], "COMP1", filters)
+    assert facets == {
+        "product_type": [{"value": "Tools", "count": 6}],
+        "location": [{"value": "A", "count": 5}, {"value": None, "count": 1}]
+    }
+    with pytest.raises(HTTPException) as error:
+        new_products.get_new_products_page(db, "COMP1", new_products.encode_cursor([listed[0].id]), sort="-expiry")
+    assert error.value.status_code == 400
+
+
+def test_product_search_follows_every_write(db, write_path):
+    def found(q):
+        products, truncated = search_new_products(db, q, "COMP1")
+        assert not truncated
+        return [product.batch_number for product in products]
+
+    upload(db, HEADER + "Claw Hammer,Tools,A,B1,,1,,,\nHammer Drill,Power Tools,A,B2,,1,,,\nSaw,Tools,A,B3,,1,,,\n")
+    assert sorted(found("hamm")) == ["B1", "B2"]
+    assert found("claw ham") == ["B1"]
+    assert found("power_tools") == ["B2"]
+    assert found("'\"*") == []
+
+    result = upload(db, HEADER + "Saw,Tools,B,B3,,1,,,\nClaw Hammer,Tools,A,B1,,5,,,\n", duplicate_action="update")
+    saw = db.query(NewProduct).filter(NewProduct.batch_number == "B3").one()
+    new_products.update_new_product(db, saw.id, NewProductUpdate(remark="Blade cracked"), manager_id=1)
+    assert found("crack") == ["B3"]
+    drill = db.query(NewProduct).filter(NewProduct.batch_number == "B2").one()
+    new_products.delete_new_product(db, drill.id, manager_id=1)
+    assert found("hammer") == ["B1"]
+
+    revert_bulk_upload(db, db.get(BulkUpload, result.id), 1)
+    assert found("crack") == ["B3"]
+    assert found("b1") == ["B1"]
+
+
+def test_product_search_ranks_the_newest_matches_only(db, monkeypatch):
+    monkeypatch.setattr(product_search, "SEARCH_RANK_CANDIDATES", 3)
+    upload(db, HEADER + "".join(f"Hammer {i},Tools,A,B{i},,1,,,\n" for i in range(5)) + "Saw,Tools,A,S1,,1,,,\n")
+
+    products, truncated = search_new_products(db, "hammer", "COMP1", limit=3)
+    assert truncated
+    assert sorted(product.batch_number for product in products) == ["B2", "B3", "B4"]
+    # Narrower queries are ranked in full
+    products, truncated = search_new_products(db, "hammer 1", "COMP1", limit=3)
+    assert ([product.batch_number for product in products], truncated) == (["B1"], False)
+    with pytest.raises(HTTPException) as error:
+        search_new_products(db, "hammer", "COMP1", skip=2, limit=2)
+    assert error.value.status_code == 400
+
+
+def test_autocomplete_index_follows_writes_without_rebuilding(db, write_path):
+    product_names.clear()
+    upload(db, HEADER + "Claw Hammer,Tools,A,B1,,1,,,\nclaw clamp,Tools,A,B2,,1,,,\nDrill,Tools,A,B3,,1,,,\n")
+    statements = count_statements(db)
+
+    assert product_names.complete(db, "COMP1", "CLA", 10) == [
+        ("claw clamp", "CLAW_CLAMP_B2_COMP1"), ("Claw Hammer", "CLAW_HAMMER_B1_COMP1")
+    ]
+    assert len(statements) == 1
+
+    drill = db.query(NewProduct).filter(NewProduct.batch_number == "B3").one()
+    new_products.update_new_product(db, drill.id, NewProductUpdate(product_name="Clamp"), manager_id=1)
+    clamp = new_products.create_new_product(
+        db, NewProductCreate(product_name="Clasp", product_type="Tools", batch_number="B4", quantity=1, company_id="COMP1"), 1
+    )
+    new_products.delete_new_product(db, clamp.id, manager_id=1)
+    statements.clear()
+    assert [name for name, _ in product_names.complete(db, "COMP1", "cla", 10)] == ["Clamp", "claw clamp", "Claw Hammer"]
+    assert product_names.complete(db, "COMP1", "d", 10) == []
+    assert product_names.complete(db, "COMP1", "c", 1) == [("Clamp", "CLAMP_B3_COMP1")]
+    assert statements == []
+
+    # Bulk uploads and reverts apply the rows they wrote too
+    clevis = upload(db, HEADER + "Clevis,Tools,A,B5,,1,,,\nclaw hammer,Tools,B,B1,,2,,,\n", duplicate_action="update")
+    statements.clear()
+    assert [name for name, _ in product_names.complete(db, "COMP1", "cl", 10)] == ["Clamp", "claw clamp", "claw hammer", "Clevis"]
+    revert_bulk_upload(db, db.get(BulkUpload, clevis.id), 1)
+    statements.clear()
+    assert [name for name, _ in product_names.complete(db, "COMP1", "cl", 10)] == ["Clamp", "claw clamp", "Claw Hammer"]
+    assert statements == []
+
+
+def test_cli_import_is_recorded_as_a_bulk_upload(db, session_factory, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(settings, "bulk_upload_dir", str(tmp_path))
+    monkeypatch.setattr(cli, "SessionLocal", session_factory)
+    path = tmp_path / "feed.csv"
+    path.write_text(HEADER + "".join(f"Item {i},Tools,A,B{i},,{'x' if i == 3 else 1},,,\n" for i in range(25)))
+    args = ["import-products", str(path), "--company", "COMP1", "--manager", "m@example.com", "--batch-size", "10"]
+
+    assert cli.main(args) == 0
+    bulk_upload = db.query(BulkUpload).one()
+    assert (bulk_upload.filename, bulk_upload.upload_status, bulk_upload.uploaded_by) == ("feed.csv", "partial", 1)
+    assert (bulk_upload.successful_records, bulk_upload.failed_records) == (24, 1)
+    assert bulk_upload.content_hash == hashlib.sha256(path.read_bytes()).hexdigest()
+    assert os.path.exists(reject_report_path(bulk_upload.id))
+    assert "24 created" in capsys.readouterr().out
+
+    assert cli.main(args[:-2] + ["--company", "OTHER"]) == 1
+    assert "does not belong" in capsys.readouterr().err
+
+
+def test_drop_folder_files_are_claimed_once_stable(db, session_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_upload_dir", str(tmp_path / "uploads"))
+    company_dir = tmp_path / "drop" / "COMP1"
+    company_dir.mkdir(parents=True)
+    (tmp_path / "drop" / "UNKNOWN").mkdir()
+    (tmp_path / "drop" / "UNKNOWN" / "feed.csv").write_text(HEADER)
+    feed = HEADER + "".join(f"Item {i},Tools,A,B{i},,1,,,\n" for i in range(30))
+    (company_dir / "feed.csv").write_text(feed)
+    (company_dir / "notes.txt").write_text("not a product file")
+    (company_dir / "next.csv.part").write_text(HEADER)
+    watcher = DropFolderWatcher(str(tmp_path / "drop"), "update", batch_size=10, session_factory=session_factory)
+
+    assert watcher.scan() == []
+    for future in watcher.scan():
+        future.result(timeout=30)
+
+    imported, rejected = db.query(BulkUpload).order_by(BulkUpload.filename).all()
+    assert (imported.filename, imported.upload_status, imported.successful_records) == ("feed.csv", "completed", 30)
+    assert imported.content_hash == hashlib.sha256(feed.encode("utf-8")).hexdigest()
+    assert (rejected.filename, rejected.upload_status) == ("notes.txt", "failed")
+    assert sorted(os.listdir(company_dir / "done")) == [f"{imported.id}-feed.csv"]
+    assert sorted(os.listdir(company_dir / "failed")) == [f"{rejected.id}-notes.txt"]
+    assert sorted(os.listdir(company_dir / "processing")) == []
+    assert sorted(os.listdir(company_dir)) == ["done", "failed", "next.csv.part", "processing"]
+    assert os.listdir(tmp_path / "drop" / "UNKNOWN") == ["feed.csv"]
+
+    # The next hour's feed is the same file: nothing is imported
+    (company_dir / "feed.csv").write_text(feed)
+    watcher.scan()
+    assert watcher.scan() == []
+    assert db.query(BulkUpload).count() == 2
+    assert os.listdir(company_dir / "done") == [f"{imported.id}-feed.csv"]
+
+
+def test_drop_folder_resumes_claimed_files(db, session_factory, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_upload_dir", str(tmp_path / "uploads"))
+    processing = tmp_path / "drop" / "COMP1" / "processing"
+    processing.mkdir(parents=True)
+    bulk_upload = create_bulk_upload(db, "feed.csv", 1, "COMP1", "skip")
+    bulk_upload.upload_status = "interrupted"
+    db.commit()
+    (processing / f"{bulk_upload.id}-feed.csv").write_text(HEADER + "Widget,Tools,A,B1,,1,,,\n")
+    (processing / "99-lost.csv").write_text(HEADER)
+    watcher = DropFolderWatcher(str(tmp_path / "drop"), session_factory=session_factory)
+
+    for future in watcher.resume_claimed():
+        future.result(timeout=30)
+
+    db.refresh(bulk_upload)
+    assert (bulk_upload.upload_status, bulk_upload.successful_records) == ("completed", 1)
+    assert os.listdir(tmp_path / "drop" / "COMP1" / "done") == [f"{bulk_upload.id}-feed.csv"]
+    assert "lost.csv" in os.listdir(tmp_path / "drop" / "COMP1")
+
+
+@pytest.mark.parametrize("duplicate_action", ["skip", "update"])
+def test_dry_run_previews_what_the_import_does(db, duplicate_action):
+    upload(db, HEADER + "Widget,Tools,A,B1,2025-12-31,10,9.90,Paid,\nGadget,Tools,A,B2,,1,5,,\n")
+    products_before = db.query(NewProduct).count()
+    audits_before = db.query(NewAuditTrail).count()
+    csv_text = HEADER + (
+        "Widget,Tools,B,B1,,10,,Paid,\n"           # location changes, empty expiry/price kept
+        "Gadget,Tools,A,B2,,1,5.0,,\n"             # same values
+        "Doohickey,Tools,A,B3,,3,,,\n"             # new
+        "Doohickey,Tools,A,B3,,4,,,\n"             # repeated: updates the row above
+        "Broken,Tools,A,B4,,x,,,\n"                # rejected
+    )
+
+    bulk_upload = create_bulk_upload(db, "products.csv", 1, "COMP1", duplicate_action, dry_run=True)
+    target = io.StringIO()
+    preview_bulk_upload(db, bulk_upload, BytesIO(csv_text.encode("utf-8")), target)
+
+    assert bulk_upload.upload_status == "previewed"
+    assert db.query(NewProduct).count() == products_before
+    assert db.query(NewAuditTrail).count() == audits_before
+
+    # The preview's counters are the ones the import ends with
+    imported = upload(db, csv_text, duplicate_action)
+    counters = ["total_records", "successful_records", "updated_records", "skipped_records", "failed_records"]
+    assert [getattr(bulk_upload, name) for name in counters] == [getattr(imported, name) for name in counters]
+
+    changes = [json.loads(line) for line in target.getvalue().splitlines()]
+    summary = json.loads(bulk_upload.preview_summary)
+    if duplicate_action == "skip":
+        assert [(c["row_number"], c["action"]) for c in changes] == [(4, "create")]
+        assert (summary["create"], summary["skip"], summary["reject"]) == (1, 3, 1)
+    else:
+        assert [(c["row_number"], c["action"]) for c in changes] == [(2, "update"), (4, "create"), (5, "update")]
+        assert changes[0]["changes"] == {"location": {"old": "A", "new": "B"}}
+        assert changes[1]["changes"]["quantity"] == {"old": None, "new": 3}
+        assert changes[2]["changes"] == {"quantity": {"old": 3, "new": 4}}
+        assert (summary["create"], summary["update"], summary["unchanged"]) == (1, 2, 1)
+        assert summary["fields"] == {"location": 1, "quantity": 1}
+
+
+def test_dry_run_reads_chunks_of_the_import_batch_size(db, monkeypatch):
+    chunk_sizes = []
+    read_upload_chunks = ingest.read_upload_chunks
+
+    def recording_read_upload_chunks(source, filename, chunk_size, max_bytes):
+        chunk_sizes.append(chunk_size)
+        return read_upload_chunks(source, filename, chunk_size, max_bytes)
+
+    monkeypatch.setattr("app.controllers.bulk_preview.read_upload_chunks", recording_read_upload_chunks)
+    csv_text = HEADER + "".join(f"Item {i},Tools,A,B{i},,1,,,\n" for i in range(5))
+    for import_mode, batch_size in [("batch", None), ("copy", None), ("batch", 2)]:
+        bulk_upload = create_bulk_upload(db, "products.csv", 1, "COMP1", "skip", import_mode=import_mode, dry_run=True)
+        preview_bulk_upload(db, bulk_upload, BytesIO(csv_text.encode("utf-8")), io.StringIO(), batch_size=batch_size)
+
+    # Copy mode falls back to batches off PostgreSQL, and so does its preview
+    assert chunk_sizes == [settings.bulk_upload_batch_size, settings.bulk_upload_batch_size, 2]
+
+
+def test_rejected_rows_are_reported_in_full(db):
+    rows = "".join(f"Item {i},Tools,A,B{i},,{'x' if i % 2 else 1},,,\n" for i in range(250))
+    bulk_upload = create_bulk_upload(db, "products.csv", 1, "COMP1", "skip")
+    report = io.StringIO()
+    new_products.run_bulk_upload(db, bulk_upload, BytesIO((HEADER + rows).encode("utf-8")), batch_size=40, reject_report=report)
+
+    assert (bulk_upload.successful_records, bulk_upload.failed_records) == (125, 125)
+    assert len(json.loads(bulk_upload.error_details)) == 100
+
+    reported = list(csv.DictReader(io.StringIO(report.getvalue()), fieldnames=ingest.REJECT_REPORT_COLUMNS))
+    assert len(reported) == 125
+    assert reported[0]["RowNumber"] == "3"
+    assert (reported[0]["ErrorField"], reported[0]["ErrorCode"]) == ("quantity", "invalid_integer")
+    assert (reported[0]["ProductName"], reported[0]["Quantity"]) == ("Item 1", "x")
+
+
+def test_resumed_reject_report_drops_rows_past_the_checkpoint(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "bulk_upload_dir", str(tmp_path))
+    with open_reject_report(7) as report:
+        writer = csv.writer(report)
+        for row_number in (3, 5, 9):
+            writer.writerow([row_number, "quantity", "invalid_integer", "quantity must be a valid integer"])
+
+    with open_reject_report(7, checkpoint_row=5):
+        pass
+
+    with open(reject_report_path(7), newline="", encoding="utf-8") as report:
+        rows = list(csv.reader(report))
+    assert rows[0] == ingest.REJECT_REPORT_COLUMNS
+    assert [row[0] for row in rows[1:]] == ["3", "5"]
+
+
+def test_scheduler_runs_one_job_per_company_within_the_cap():
+    scheduler = BulkUploadScheduler(max_workers=2)
+    started = []
+    releases = {}
+
+    def job(upload_id):
+        releases[upload_id] = threading.Event()
+
+        def run():
+            started.append(upload_id)
+            releases[upload_id].wait(timeout=10)
+        return run
+
+    futures = {
+        upload_id: scheduler.submit(upload_id, company_id, 1000, job(upload_id))
+        for upload_id, company_id in [(1, "A"), (2, "A"), (3, "B"), (4, "C")]
+    }
+    time.sleep(0.2)
+
+    # Upload 2 waits for its company, upload 4 for a free worker
+    assert sorted(started) == [1, 3]
+    assert scheduler.queue_status(2) == (1, None)
+    assert scheduler.queue_status(4) == (2, None)
+    assert scheduler.queue_status(1) == (None, None)
+
+    releases[1].set()
+    futures[1].result(timeout=10)
+    time.sleep(0.2)
+    assert sorted(started) == [1, 2, 3]
+
+    # Speeds of finished jobs give estimated start times
+    position, estimated_start = scheduler.queue_status(4)
+    assert position == 1 and estimated_start is not None
+
+    for release in releases.values():
+        release.set()
+    for future in futures.values():
+        future.result(timeout=10)
+    assert sorted(started) == [1, 2, 3, 4]